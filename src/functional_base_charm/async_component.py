@@ -0,0 +1,217 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""A Component API based on asyncio, and a ComponentGraph executor that runs on one event loop."""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Mapping, Optional
+
+from ops import EventBase, StatusBase
+
+from .component import Component
+from .component_graph import ComponentGraph, ReadinessTracker
+from .component_graph_item import ComponentGraphItem
+from .reconcile_profile import ReconcileProfile, run_in_daemon_thread
+from .reconcile_tracing import in_current_context, span
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncComponent(Component, ABC):
+    """A Component whose work and status are coroutines.
+
+    Implement get_status, and one or more of _configure_unit_async, _configure_app_leader_async
+    and _configure_app_non_leader_async.  When run by a CharmReconciler with use_asyncio=True,
+    independent AsyncComponents are awaited concurrently on one event loop.  Used elsewhere, the
+    synchronous configure_charm and status run the coroutines on a new event loop.
+    """
+
+    async def configure_charm_async(self, event):
+        """Public API to get this Component to do whatever it should with an Event."""
+        await self._configure_unit_async(event)
+        if self._charm.unit.is_leader():
+            await self._configure_app_leader_async(event)
+        else:
+            await self._configure_app_non_leader_async(event)
+
+    def configure_charm(self, event):
+        """Runs configure_charm_async to completion on a new event loop."""
+        asyncio.run(self.configure_charm_async(event))
+
+    @property
+    def status(self) -> StatusBase:
+        """Runs get_status to completion on a new event loop."""
+        return asyncio.run(self.get_status())
+
+    async def _configure_unit_async(self, event):
+        """Executes everything this Component should do for every Unit."""
+        pass
+
+    async def _configure_app_leader_async(self, event):
+        """Execute everything this Component should do at the Application level for leaders."""
+        pass
+
+    async def _configure_app_non_leader_async(self, event):
+        """Execute everything this Component should do at the Application level for non-Leaders."""
+        pass
+
+    @abstractmethod
+    async def get_status(self) -> StatusBase:
+        """Returns the status of this Component."""
+
+
+async def configure_component_async(
+    component: Component, event: EventBase, budgeted: bool = False
+):
+    """Configures any Component, dispatching a synchronous Component to a thread.
+
+    Args:
+        component: the Component to configure
+        event: the event passed to the Component's configure
+        budgeted: if True, a synchronous Component runs on a daemon thread that is not waited
+                  for if it overruns, rather than on the loop's default executor
+    """
+    if isinstance(component, AsyncComponent):
+        await component.configure_charm_async(event)
+    elif budgeted:
+        await asyncio.wrap_future(
+            run_in_daemon_thread(component.configure_charm, event, name="reconcile")
+        )
+    else:
+        await asyncio.get_running_loop().run_in_executor(
+            None, in_current_context(component.configure_charm), event
+        )
+
+
+async def get_component_status_async(component: Component) -> StatusBase:
+    """Returns the status of any Component, dispatching a synchronous Component to the executor."""
+    with span("component.status", {"component.name": component.name}) as status_span:
+        if isinstance(component, AsyncComponent):
+            status = await component.get_status()
+        else:
+            status = await asyncio.get_running_loop().run_in_executor(
+                None, in_current_context(lambda: component.status)
+            )
+        status_span.set_attribute("status.name", status.name)
+    return status
+
+
+async def execute_component_graph_async(
+    component_graph: ComponentGraph,
+    event: EventBase,
+    on_executed: Callable[[ComponentGraphItem, Optional[str]], None],
+    budgets: Optional[Mapping[str, float]] = None,
+    profile: Optional[ReconcileProfile] = None,
+):
+    """Executes every ready item of a ComponentGraph on the running event loop.
+
+    Items are started as soon as all their prerequisites have finished executing and are Active,
+    so independent items run concurrently.  Each Component's status is awaited at most once per
+    call: when it finishes executing, or the first time it is needed if it was executed before.
+
+    An item that exceeds its budget is cancelled and marked as timed out in the graph, so its
+    dependents wait while independent items carry on.  A synchronous Component with a budget
+    runs on a daemon thread rather than the default executor (see run_in_daemon_thread), so one
+    that overruns does not hold up the end of the pass.
+
+    If the graph uses incremental_status, run this within its deferred_status_notifications(),
+    as statuses cannot be evaluated on the running loop.
+
+    Args:
+        component_graph: the ComponentGraph to execute
+        event: the event passed to each Component's configure
+        on_executed: called on the event loop with each item and the fingerprint taken before it
+                     was configured, once it has finished executing within its budget
+        budgets: (optional) seconds each item, by name, may spend configuring
+        profile: (optional) the ReconcileProfile that bounds the pass and records its timings.
+                 If None, the pass is unbounded.
+    """
+    budgets = budgets or {}
+    profile = profile or ReconcileProfile()
+    running: Dict[asyncio.Task, ComponentGraphItem] = {}
+    fingerprints: Dict[str, Optional[str]] = {}
+    known_statuses: Dict[str, StatusBase] = {}
+    readiness = ReadinessTracker(component_graph)
+
+    while True:
+        ready = await _get_ready_items(component_graph, readiness, running, known_statuses)
+        if ready and profile.expired():
+            profile.skip([item.name for item in ready])
+            ready = []
+        for item in ready:
+            logger.info(f"Executing configure_charm for '{item.name}' on the event loop")
+            item.executed = True
+            fingerprints[item.name] = item.fingerprint()
+            task = asyncio.ensure_future(
+                _configure_within_budget(
+                    item, event, profile.budget_for(budgets.get(item.name)), profile
+                )
+            )
+            running[task] = item
+
+        if not running:
+            return
+
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            item = running.pop(task)
+            # Propagate any exception, as the synchronous execute_components does
+            timed_out_after = task.result()
+            if timed_out_after is not None:
+                known_statuses[item.name] = component_graph.mark_timed_out(
+                    item.name, timed_out_after
+                )
+                continue
+            on_executed(item, fingerprints[item.name])
+            known_statuses[item.name] = await get_component_status_async(item.component)
+
+
+async def _configure_within_budget(
+    item: ComponentGraphItem,
+    event: EventBase,
+    budget: Optional[float],
+    profile: ReconcileProfile,
+) -> Optional[float]:
+    """Configures an item's Component, returning the budget if it timed out, else None."""
+    started_at = profile.now()
+    with span("component.configure", {"component.name": item.name}) as configure_span:
+        try:
+            await asyncio.wait_for(
+                configure_component_async(item.component, event, budget is not None), budget
+            )
+        except asyncio.TimeoutError:
+            configure_span.set_attribute("component.timed_out", True)
+            profile.record(item.name, started_at, budget, timed_out=True)
+            return budget
+    profile.record(item.name, started_at, budget, timed_out=False)
+    return None
+
+
+async def _get_ready_items(
+    component_graph: ComponentGraph,
+    readiness: ReadinessTracker,
+    running: Dict[asyncio.Task, ComponentGraphItem],
+    known_statuses: Dict[str, StatusBase],
+):
+    """Returns the pending items whose prerequisites have all finished and are Active.
+
+    Statuses of executed items needed to decide this are awaited concurrently, and added to
+    known_statuses.
+    """
+    needed = readiness.needed(running.values())
+    to_fetch = []
+    for item in needed:
+        if item.name in known_statuses:
+            continue
+        # Do not build a factory Component just for a status the graph already knows
+        last_known = component_graph.get_last_known_status(item.name)
+        if last_known is not None and not item.built:
+            known_statuses[item.name] = last_known
+        else:
+            to_fetch.append(item)
+    fetched = await asyncio.gather(
+        *(get_component_status_async(item.component) for item in to_fetch)
+    )
+    known_statuses.update(zip((item.name for item in to_fetch), fetched))
+    return readiness.ready(needed, known_statuses)
@@ -1,14 +1,26 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 """A reusable reconcile loop for Charms."""
+
+import asyncio
 import logging
-from typing import List, Optional
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Mapping, MutableSequence, Optional
 
-from ops import CharmBase, EventBase, Object, StatusBase
+from ops import BoundEvent, CharmBase, EventBase, Object, StatusBase, StoredState
 
+from .async_component import execute_component_graph_async
 from .component import Component
 from .component_graph import ComponentGraph
 from .component_graph_item import ComponentGraphItem
+from .component_graph_summary import GraphSummary
+from .context_registry import ContextRegistry
+from .multistatus import CommitStatusSetter
+from .reconcile_metrics import ReconcileMetrics
+from .reconcile_profile import ReconcileProfile, run_in_daemon_thread
+from .reconcile_recording import ReconcileRecorder
+from .reconcile_tracing import Span, Tracer, span
+from .retry_scheduler import ReconcileRetryEvent, RetryScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +28,21 @@ logger = logging.getLogger(__name__)
 class CharmReconciler(Object):
     """A reusable reconcile loop for Charms."""
 
-    def __init__(self, charm: CharmBase, component_graph: Optional[ComponentGraph] = None):
+    _stored = StoredState()
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        component_graph: Optional[ComponentGraph] = None,
+        retry_scheduler: Optional[RetryScheduler] = None,
+        coalesce_events: bool = False,
+        use_asyncio: bool = False,
+        component_budget: Optional[float] = None,
+        pass_budget: Optional[float] = None,
+        recorder: Optional[ReconcileRecorder] = None,
+        tracer: Optional[Tracer] = None,
+        metrics: Optional[ReconcileMetrics] = None,
+    ):
         """A reusable reconcile loop for Charms.
 
         TODO: Do we really need to pass `charm` here?  We barely use it.  I think we need it (or
@@ -26,6 +52,32 @@ class CharmReconciler(Object):
             charm: a CharmBase object to operate from this CharmReconciler
             component_graph: (optional) a ComponentGraph that is used to define the execution order
                              of Components.  If None, an empty ComponentGraph will be created.
+            retry_scheduler: (optional) a RetryScheduler used to retry, with backoff, a reconcile
+                             pass that left Components pending.  If None, pending Components
+                             wait until another observed event runs execute_components.
+            coalesce_events: if True, execute_components only marks the work an event makes
+                             dirty and queues a single reconcile pass, which runs once per
+                             dispatch when the framework is about to commit.  Components must not
+                             defer events in this mode, as their handlers have already returned.
+            use_asyncio: if True, each reconcile pass runs the ComponentGraph on one asyncio event
+                         loop, awaiting independent Components concurrently.  AsyncComponents
+                         run on the loop, and other Components on its default executor.
+            component_budget: (optional) default seconds each Component may spend configuring in
+                              a pass.  A Component that overruns is no longer waited for (see
+                              run_in_daemon_thread) and is reported as Waiting until it
+                              is executed again, and its dependents are not
+                              executed.  If None, Components are unbounded unless given a budget
+                              in add().
+            pass_budget: (optional) seconds a whole reconcile pass may spend configuring
+                         Components.  Components that are ready once it is spent are left
+                         pending for a later pass.
+            recorder: (optional) a ReconcileRecorder that records the first reconcile pass of
+                      the dispatch, for replaying offline
+            tracer: (optional) a Tracer that records a trace of each dispatch.  It is active
+                    from the first event this CharmReconciler handles until the framework
+                    commits, so Components and status checks are traced under one dispatch span.
+            metrics: (optional) a ReconcileMetrics that is updated from the trace of each
+                     dispatch.  If no tracer is given, one that writes no trace file is created.
         """
         super().__init__(parent=charm, key=None)
 
@@ -34,11 +86,60 @@ class CharmReconciler(Object):
 
         self._charm = charm
         self._component_graph = component_graph
+        self._retry_scheduler = retry_scheduler
+        self._coalesce_events = coalesce_events
+        self._use_asyncio = use_asyncio
+        self._component_budget = component_budget
+        self._pass_budget = pass_budget
+        self._recorder = recorder
+        if metrics is not None:
+            tracer = tracer or Tracer()
+            tracer.processors.append(metrics.observe_trace)
+        self._tracer = tracer
+        self._tracer_token = None
+        self._dispatch_span: Optional[Span] = None
+        self._component_budgets: Dict[str, float] = {}
+        # Timings of the most recent reconcile pass
+        self.last_profile: Optional[ReconcileProfile] = None
+
+        # Event coalescing: the event that queued the pending pass, and counters for this dispatch
+        self._queued_event: Optional[EventBase] = None
+        self.events_received = 0
+        self.events_coalesced = 0
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+        # Sets the unit status from the graph once per dispatch, after all handlers have run
+        self._status_setter = CommitStatusSetter(
+            self, charm.unit, self._get_unit_status, key="status-setter"
+        )
+        # Observed after the status setter, so the unit status is traced within the dispatch
+        if tracer is not None:
+            self.framework.observe(self.framework.on.commit, self._end_dispatch_span)
+
+        # Component statuses seen by the last status refresh, as {name: [status_name, message]}
+        self._stored.set_default(component_statuses={})
+        # The ComponentGraph's execution plan and completed items, from the previous dispatches
+        self._stored.set_default(execution_state={})
+        self._execution_state_restored = False
+        # The last Component statuses and timings, for summarise() in later dispatches
+        self._stored.set_default(summary_state={})
+        self._summary_state_restored = False
+
+    @property
+    def component_graph(self) -> ComponentGraph:
+        """Returns the ComponentGraph of this reconciler's Components."""
+        return self._component_graph
+
+    @property
+    def contexts(self) -> ContextRegistry:
+        """Returns the registry of contexts shared by this reconciler's Components."""
+        return self._component_graph.contexts
 
     def add(
         self,
         component: Component,
         depends_on: Optional[List[ComponentGraphItem]] = None,
+        budget: Optional[float] = None,
     ) -> ComponentGraphItem:
         """Add a component to the graph, returning a ComponentGraphItem for this Component.
 
@@ -46,34 +147,305 @@ class CharmReconciler(Object):
             component: the Component to add to this execution graph
             depends_on: the list of registered ComponentGraphItems that this Component depends on
                         being Active before it should run.
+            budget: (optional) seconds this Component may spend configuring in a pass, overriding
+                    the CharmReconciler's component_budget
         """
-        return self._component_graph.add(component, depends_on)
+        item = self._component_graph.add(component, depends_on)
+        self._set_budget(item, budget)
+        return item
+
+    def add_factory(
+        self,
+        name: str,
+        factory: Callable[[], Component],
+        depends_on: Optional[List[ComponentGraphItem]] = None,
+        events_to_observe: Optional[List[BoundEvent]] = None,
+        budget: Optional[float] = None,
+        fingerprint: Optional[Callable[[], Optional[str]]] = None,
+    ) -> ComponentGraphItem:
+        """Add a Component that is built the first time it is needed for the current event.
+
+        See ComponentGraph.add_factory.
+
+        Args:
+            name: the name of the Component that factory builds
+            factory: callable, taking no arguments, that builds the Component
+            depends_on: the list of registered ComponentGraphItems that this Component depends on
+                        being Active before it should run.
+            events_to_observe: the extra events the Component observes, declared up front
+            budget: (optional) seconds this Component may spend configuring in a pass, overriding
+                    the CharmReconciler's component_budget
+            fingerprint: (optional) callable returning the Component's fingerprint without
+                         building it, so warm dispatches that do not execute it do not build it
+        """
+        item = self._component_graph.add_factory(
+            name, factory, depends_on, events_to_observe, fingerprint
+        )
+        self._set_budget(item, budget)
+        return item
+
+    def _set_budget(self, item: ComponentGraphItem, budget: Optional[float]):
+        """Records the configure budget of an item, defaulting to the component_budget."""
+        budget = budget if budget is not None else self._component_budget
+        if budget is not None:
+            self._component_budgets[item.name] = budget
 
     def execute_components(self, event: EventBase):
         """Executes all components that are ready for execution, ordered by their dependencies.
 
         This would be the handler for charm events like config-changed, etc.
+
+        Components restored as executed from an earlier dispatch are only executed again if they
+        are dirty: their fingerprint changed, they observe this event, they are no longer Active,
+        or they depend on a dirty Component.
+
+        If this CharmReconciler coalesces events, this only marks the Components the event makes
+        dirty and queues a reconcile pass for the end of the dispatch.  Events arriving while a
+        pass is queued are merged into it.
         """
+        self._start_dispatch_span(event)
+        if not self._coalesce_events:
+            self._reconcile(event)
+            return
+
+        self.events_received += 1
+        self._restore_execution_state()
+        # Only the cheap, event-based dirty marking happens per event - the queued pass checks
+        # Component statuses once
+        self._component_graph.mark_dirty_for_event(event)
+        if self._queued_event is not None:
+            self.events_coalesced += 1
+            logger.info(
+                f"Merged event '{event.handle}' into the queued reconcile pass "
+                f"({self.events_coalesced} of {self.events_received} events merged)"
+            )
+            return
+        logger.info(f"Queued a reconcile pass for event '{event.handle}'")
+        self._queued_event = event
+
+    def _on_pre_commit(self, _):
+        """Runs the queued reconcile pass, if there is one."""
+        if self._queued_event is None:
+            return
+        event, self._queued_event = self._queued_event, None
+        logger.info(
+            f"Running the queued reconcile pass ({self.events_coalesced} of "
+            f"{self.events_received} events merged)"
+        )
+        self._reconcile(event)
+
+    def _mark_dirty(self, event: EventBase):
+        """Marks dirty the Components affected by this event, and any that are not Active."""
+        dirty = self._component_graph.mark_dirty_for_event(event)
+        dirty += self._component_graph.mark_inactive_dirty()
+        if dirty:
+            logger.info(f"Components marked dirty for re-execution: {dirty}")
+            self._stored.execution_state = self._component_graph.export_execution_state()
+
+    def _reconcile(self, event: EventBase):
+        """Runs a reconcile pass, executing every dirty Component that is ready for execution."""
         logger.info(f"Starting `execute_components` for event '{event.handle}'")
+        # Recording starts before the stored state is restored, so the recording holds that state
+        # and the status calls made while marking Components dirty
+        if self._recorder is not None:
+            self._recorder.start(self._charm, event, self.export_stored_state())
+        self._restore_execution_state()
+        self._restore_summary_state()
+        self._mark_dirty(event)
+
+        profile = ReconcileProfile(self._pass_budget)
+        self.last_profile = profile
+        # Items still executed after marking dirty are up to date, so are not executed again
+        up_to_date = sum(item.executed for item in self._component_graph.component_items.values())
+        with span(
+            "reconcile", {"juju.event": event.handle.kind, "reconcile.up_to_date": up_to_date}
+        ) as reconcile_span:
+            try:
+                if self._use_asyncio:
+                    with self._component_graph.deferred_status_notifications():
+                        asyncio.run(
+                            execute_component_graph_async(
+                                self._component_graph,
+                                event,
+                                self._on_executed,
+                                self._component_budgets,
+                                profile,
+                            )
+                        )
+                else:
+                    self._execute_component_items(event, profile)
+            finally:
+                profile.finish()
+                logger.info(profile.summary())
+                self._component_graph.record_timings(profile.components)
+                if self._recorder is not None:
+                    self._recorder.finish(profile)
+                reconcile_span.set_attribute("reconcile.executed", len(profile.components))
+                reconcile_span.set_attribute("reconcile.skipped", len(profile.skipped))
 
+        # The unit status is computed once when the framework commits, so several observed
+        # events in one dispatch only cost one status pass and at most one status-set
+        logger.info("execute_components execution loop complete - unit status update requested.")
+        self._status_setter.request_update()
+        self._schedule_retry()
+
+    def _execute_component_items(self, event: EventBase, profile: ReconcileProfile):
+        """Executes ready components one at a time, ordered by their dependencies."""
         # TODO: Think this through again.  Look ok still?
         for component_item in self._component_graph.yield_executable_component_items():
+            if profile.expired():
+                # Not started, so leave it pending for a later pass
+                component_item.executed = False
+                ready = self._component_graph.get_executable_component_items()
+                profile.skip([item.name for item in ready])
+                break
+
             logger.info(
                 f"Executing component_item.component.configure_charm for '{component_item.name}'"
             )
 
-            component_item.component.configure_charm(event)
+            # Fingerprint the inputs before configuring, so they describe what was configured
+            fingerprint = component_item.fingerprint()
+            budget = profile.budget_for(self._component_budgets.get(component_item.name))
+            started_at = profile.now()
+            with span(
+                "component.configure", {"component.name": component_item.name}
+            ) as configure_span:
+                completed = _run_within_budget(
+                    component_item.component.configure_charm, event, budget
+                )
+                configure_span.set_attribute("component.timed_out", not completed)
+            profile.record(component_item.name, started_at, budget, timed_out=not completed)
+            if not completed:
+                self._component_graph.mark_timed_out(component_item.name, budget)
+                continue
+            self._on_executed(component_item, fingerprint)
             # TODO: If this component executes but does not go to ready, is there something we
             #  should do?  Omitted for now.
             # if not component_item.component.ready:
             #     raise NotImplementedError()
 
-        # TODO: Because on.commit didn't work for the Prioritiser, we add a call to Prioritiser
-        #  here.  This should be improved on in future.
-        logger.info("execute_components execution loop complete.")
-        status = self._component_graph.status_prioritiser.highest()
-        logger.info(f"Got status {status} from Prioritiser - updating unit status")
-        self._charm.unit.status = status
+    def _on_executed(self, component_item: ComponentGraphItem, fingerprint: Optional[str]):
+        """Records that a component has finished executing."""
+        self._component_graph.record_completion(component_item.name, fingerprint)
+        self._stored.execution_state = self._component_graph.export_execution_state()
+        self._component_graph.notify_status_changed(component_item.name)
+
+    def _schedule_retry(self):
+        """Schedules a retry if Components are still pending, or resets the retry backoff."""
+        if self._retry_scheduler is None:
+            return
+        if self._component_graph.get_pending_component_items():
+            self._retry_scheduler.schedule()
+        else:
+            self._retry_scheduler.reset()
+
+    def _on_reconcile_retry(self, event: ReconcileRetryEvent):
+        """Runs execute_components for a retry, if it is due."""
+        if self._retry_scheduler.is_due(event):
+            self.execute_components(event)
+
+    def _start_dispatch_span(self, event: EventBase):
+        """Activates the tracer and starts the dispatch span, if not already started."""
+        if self._tracer is None or self._dispatch_span is not None:
+            return
+        self._tracer_token = self._tracer.activate()
+        self._dispatch_span = self._tracer.start_span(
+            "dispatch", {"juju.event": event.handle.kind, "juju.unit": self._charm.unit.name}
+        )
+        self._dispatch_span.__enter__()
+
+    def _end_dispatch_span(self, _):
+        """Ends the dispatch span and deactivates the tracer, once the framework commits."""
+        if self._dispatch_span is None:
+            return
+        dispatch_span, self._dispatch_span = self._dispatch_span, None
+        dispatch_span.set_attribute("dispatch.events_received", max(self.events_received, 1))
+        dispatch_span.set_attribute("dispatch.events_coalesced", self.events_coalesced)
+        dispatch_span.__exit__(None, None, None)
+        self._tracer.deactivate(self._tracer_token)
+
+    def export_stored_state(self) -> Dict[str, Any]:
+        """Returns the state this reconciler keeps between dispatches, as simple types."""
+        return {key: _to_simple(getattr(self._stored, key)) for key in _STORED_STATE_KEYS}
+
+    def restore_stored_state(self, state: Mapping[str, Any]):
+        """Replaces the state this reconciler keeps between dispatches, such as for a replay.
+
+        Call this before the first reconcile pass of the dispatch.
+        """
+        for key in _STORED_STATE_KEYS:
+            if key in state:
+                setattr(self._stored, key, state[key])
+
+    def _restore_execution_state(self):
+        """Restores the graph's execution state from earlier dispatches, once per dispatch."""
+        if self._execution_state_restored:
+            return
+        self._execution_state_restored = True
+        self._component_graph.restore_execution_state(self._stored.execution_state)
+
+    def update_status(self, event: EventBase):
+        """Refreshes the unit status without executing any Components.
+
+        This is the handler for update-status.  Component statuses cached by the previous refresh
+        are reused where the Component can cheaply verify them, the rest are collected through
+        the graph's Prioritiser (concurrently, if it is configured to), and the unit status is
+        only set if it changed.
+        """
+        logger.info(f"Starting `update_status` for event '{event.handle}'")
+        self._start_dispatch_span(event)
+        with span("update_status"):
+            self._update_status()
+
+    def _update_status(self):
+        """Collects Component statuses, reusing cached ones, and sets the unit status."""
+        cached_statuses = {
+            name: StatusBase.from_name(status_name, message)
+            for name, (status_name, message) in self._stored.component_statuses.items()
+        }
+        component_statuses = self._component_graph.collect_component_statuses(cached_statuses)
+        self._stored.component_statuses = {
+            name: [status.name, status.message] for name, status in component_statuses.items()
+        }
+
+        status = self._component_graph.status_from_component_statuses(component_statuses)
+        self._save_summary_state()
+        self._status_setter.set_if_changed(status)
+
+    def _get_unit_status(self) -> StatusBase:
+        """Returns the graph's status for the status setter, saving what summarise() reports.
+
+        The status setter runs on commit, but its observer is registered before this
+        reconciler's StoredState is first accessed, so the StoredState is saved after it.
+        """
+        status = self._component_graph.status
+        self._save_summary_state()
+        return status
+
+    def _save_summary_state(self):
+        """Saves the graph's last statuses and timings, for summarise() in later dispatches."""
+        self._restore_summary_state()
+        self._stored.summary_state = self._component_graph.export_summary_state()
+
+    def _restore_summary_state(self):
+        """Restores the graph's last statuses and timings from earlier dispatches, once."""
+        if self._summary_state_restored:
+            return
+        self._summary_state_restored = True
+        self._component_graph.restore_summary_state(self._stored.summary_state)
+
+    def summarise(self) -> GraphSummary:
+        """Returns a report of the graph and the last known state of each Component.
+
+        The report is built from what this and earlier dispatches recorded, without evaluating
+        any Component or making external calls, so it is cheap enough for a debug action:
+
+            event.set_results({"summary": json.dumps(reconciler.summarise().to_dict())})
+        """
+        self._restore_summary_state()
+        execution_state = None if self._execution_state_restored else self._stored.execution_state
+        return self._component_graph.summarise(execution_state)
 
     def install(self, charm: CharmBase):
         """Installs execute_components as the handler for all necessary charm events.
@@ -86,25 +458,28 @@ class CharmReconciler(Object):
         # Install standard events
         charm.framework.observe(charm.on.install, self.execute_components)
         charm.framework.observe(charm.on.config_changed, self.execute_components)
+        charm.framework.observe(charm.on.update_status, self.update_status)
 
         # Install any custom events our component_graph needs
         additional_events = self._component_graph.get_events_to_observe()
         for event in additional_events:
             charm.framework.observe(event, self.execute_components)
 
+        # Retrying components that were not ready
+        if self._retry_scheduler is not None:
+            charm.framework.observe(
+                self._retry_scheduler.on.reconcile_retry, self._on_reconcile_retry
+            )
+
         # Removing components
         charm.framework.observe(charm.on.remove, self.remove_components)
 
-        # Updating status
-        # TODO: Does this implicitly make an update_status?
-        # TODO: Disabled because prioritizer's install doesn't work.  See note on that method
-        # self.component_graph.status_prioritiser.install(charm.framework, charm.unit)
-
     def remove_components(self, event: EventBase):
         """Runs Component.remove() for each component.
 
         Note that the order in which Components are removed is not guaranteed.
         """
+        self._start_dispatch_span(event)
         for component_item in self._component_graph.component_items.values():
             try:
                 component_item.component.remove(event)
@@ -128,3 +503,36 @@ class CharmReconciler(Object):
         charm's overall status.
         """
         raise NotImplementedError()
+
+
+# The StoredState a reconcile pass depends on, beyond the charm's own inputs
+_STORED_STATE_KEYS = ("component_statuses", "execution_state", "summary_state")
+
+
+def _to_simple(value: Any) -> Any:
+    """Returns a StoredState value as plain dicts and lists."""
+    if isinstance(value, Mapping):
+        return {key: _to_simple(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, MutableSequence)):
+        return [_to_simple(item) for item in value]
+    return value
+
+
+def _run_within_budget(
+    func: Callable[[EventBase], None], event: EventBase, budget: Optional[float]
+) -> bool:
+    """Calls func(event), returning False if it did not finish within budget seconds.
+
+    With a budget, func runs on a daemon thread (see run_in_daemon_thread), which is left
+    running if func overruns.  Exceptions raised by func within the budget are re-raised.
+    """
+    if budget is None:
+        func(event)
+        return True
+
+    future = run_in_daemon_thread(func, event, name="reconcile")
+    try:
+        future.result(timeout=budget)
+        return True
+    except FutureTimeoutError:
+        return False
@@ -3,7 +3,7 @@
 """Abstract class defining the API needed for an atomic piece of work that a charm does."""
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 
 from ops import ActiveStatus, BoundEvent, CharmBase, Object, StatusBase
 
@@ -60,6 +60,25 @@ class Component(Object, ABC):
         """
         return True
 
+    def verify_status(self, cached_status: StatusBase) -> bool:
+        """Returns True if a status cached during an earlier dispatch still holds.
+
+        This is used by status-only refreshes (such as update-status) to skip a full evaluation
+        of self.status.  Override this with a check that is cheaper than self.status, for example
+        a single connectivity probe.  By default, cached statuses are never trusted.
+        """
+        return False
+
+    def fingerprint(self) -> Optional[str]:
+        """Returns a string identifying the inputs of this Component's work, or None.
+
+        If this Component executed in an earlier dispatch and its fingerprint has not changed
+        since, the CharmReconciler treats it as already executed instead of running it again.
+        Override this to return, for example, a hash of the config and context the Component
+        renders.  By default this returns None, and the Component is executed in every dispatch.
+        """
+        return None
+
     def remove(self, event):
         """Removes everything this Component should when handling a `remove` event."""
         pass
@@ -6,21 +6,88 @@ from __future__ import (
     annotations,  # To enable type hinting a method in a class with its own class
 )
 
-from typing import Iterable, List, Optional
+import hashlib
+import heapq
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
 
-from ops import BoundEvent, StatusBase
+from ops import ActiveStatus, BoundEvent, EventBase, StatusBase, WaitingStatus
 
 from .component import Component
-from .component_graph_item import ComponentGraphItem
+from .component_graph_item import (
+    ComponentGraphItem,
+    SharedStatusCache,
+    StatusCache,
+    WaitReason,
+    get_traced_status,
+)
+from .component_graph_summary import ComponentSummary, GraphSummary
+from .context_registry import ContextRegistry
 from .multistatus import Prioritiser
+from .reconcile_profile import ComponentTiming
+
+logger = logging.getLogger(__name__)
 
 
 class ComponentGraph:
     """A collection of ComponentGraphItems that keeps their order."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        status_prioritiser: Optional[Prioritiser] = None,
+        incremental_status: bool = False,
+    ):
+        """Instantiate a ComponentGraph.
+
+        Args:
+            status_prioritiser: (optional) the Prioritiser used to aggregate the statuses of
+                                items in this graph, for example one that collects statuses
+                                concurrently.  If None, a sequential Prioritiser is created.
+            incremental_status: if True, items push their status to the status_prioritiser when
+                                notify_status_changed() is called instead of being polled every
+                                time the graph's status is requested.
+        """
         self.component_items: dict[str, ComponentGraphItem] = {}
-        self.status_prioritiser = Prioritiser()
+        self.status_prioritiser = status_prioritiser or Prioritiser()
+        self.incremental_status = incremental_status
+
+        # Edge indexes, by item name: what each item depends on, and what depends on each item
+        self._dependencies: Dict[str, List[str]] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        # Cached topological order of item names, or None if it needs recomputing
+        self._topological_order: Optional[List[str]] = []
+
+        # Compact state, indexed by each item's integer id (its position in self._items).  Sets of
+        # items are stored as int bitsets, where bit i represents self._items[i].
+        self._items: List[ComponentGraphItem] = []
+        self._dependency_masks: List[int] = []
+        self._executed_mask: int = 0
+
+        # Fingerprints of items that completed execution, for persisting across dispatches
+        self._completed_fingerprints: Dict[str, str] = {}
+        # Cached result of structure_hash(), or None if it needs recomputing
+        self._structure_hash: Optional[str] = None
+        # WaitReasons computed during the current status pass, shared by all items in the graph
+        self._status_cache: Optional[StatusCache] = None
+        # Contexts shared by the Components in this graph, computed once per dispatch
+        self.contexts = ContextRegistry()
+        # Statuses that replace Component.status for items that timed out in this dispatch
+        self._status_overrides: Dict[str, StatusBase] = {}
+
+        # What summarise() reports: the last WaitReason computed for each item, the last
+        # statuses restored from an earlier dispatch as (name, message, waiting_on), and the last
+        # configure timing of each item
+        self._last_reasons: Dict[str, WaitReason] = {}
+        self._restored_statuses: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        self._last_timings: Dict[str, ComponentTiming] = {}
+        # Incremented whenever anything summarise() reports changes, to invalidate its cache
+        self._revision = 0
+        self._summary: Optional[Tuple[Tuple[int, bool], GraphSummary]] = None
+
+        # Items whose status changes are waiting to be pushed, while notifications are deferred
+        self._deferred_notifications: Optional[List[str]] = None
 
     def add(
         self,
@@ -32,24 +99,359 @@ class ComponentGraph:
         Args:
             component: the Component to add to this execution graph
             depends_on: the list of registered ComponentGraphItems that this Component depends on
-                        being Active before it should run.
+                        being Active before it should run.  These must already be in this graph,
+                        so a new item can never create a cycle.
         """
         # TODO: It feels easier to pass Component's in `depends_on`, but then harder for us to
         #  process them here (we identify components by their name).
-        name = component.name
+        return self._add_item(ComponentGraphItem(component=component, depends_on=depends_on))
+
+    def add_factory(
+        self,
+        name: str,
+        factory: Callable[[], Component],
+        depends_on: Optional[List[ComponentGraphItem]] = None,
+        events_to_observe: Optional[List[BoundEvent]] = None,
+        fingerprint: Optional[Callable[[], Optional[str]]] = None,
+    ) -> ComponentGraphItem:
+        """Add a Component that is built on demand, returning its ComponentGraphItem.
+
+        The Component is only built the first time something needs it, such as executing it or
+        evaluating its status, so dispatches that never need it do not pay to build it.  As it
+        may be built after the current event was emitted, the Component must not rely on
+        observing events in its __init__.
+
+        To keep a Component unbuilt in a reconcile pass that does not execute it, declare its
+        fingerprint, so restore_execution_state can check its inputs without building it.  Its
+        status is then the last one the graph saw (see restore_summary_state) until something
+        builds it, such as executing it or update-status verifying every Component.
+
+        Args:
+            name: the name of the Component that factory builds
+            factory: callable, taking no arguments, that builds the Component
+            depends_on: the list of registered ComponentGraphItems that this Component depends on
+                        being Active before it should run
+            events_to_observe: the extra events the Component observes, declared up front so
+                               they can be observed without building it
+            fingerprint: (optional) callable, taking no arguments, that returns the fingerprint
+                         of the Component factory builds, without building it.  If given, it is
+                         used instead of the Component's fingerprint().
+        """
+        return self._add_item(
+            ComponentGraphItem(
+                depends_on=depends_on,
+                name=name,
+                factory=factory,
+                events_to_observe=events_to_observe,
+                fingerprint=fingerprint,
+            )
+        )
+
+    def _add_item(self, item: ComponentGraphItem) -> ComponentGraphItem:
+        """Adds a new ComponentGraphItem to the graph's indexes."""
+        name = item.name
         if name in self.component_items:
             raise ValueError(
                 f"Cannot add component {name} - component named {name} already exists."
             )
-        # TODO: Make an actual graph of this
-        #  or is this not needed?  If everything knows its dependencies and only says it is ready
-        #  if they're satisfied, that might be enough.
-        self.component_items[name] = ComponentGraphItem(component=component, depends_on=depends_on)
+        item.depends_on = list(item.depends_on)
+        for prerequisite in item.depends_on:
+            self._validate_registered(prerequisite, f"Cannot add component {name}")
+
+        item._graph = self
+        item._index = len(self._items)
+        self._items.append(item)
+        self._dependency_masks.append(0)
+
+        self.component_items[name] = item
+        self._dependencies[name] = []
+        self._dependents[name] = []
+        self._structure_hash = None
+        self._revision += 1
+        for prerequisite in item.depends_on:
+            self._add_edge(name, prerequisite.name)
+        if self._topological_order is not None:
+            # Everything this item depends on is already in the order, so it can go last
+            self._topological_order.append(name)
+
+        self.status_prioritiser.add(
+            name, lambda: self._get_item_status(name), pushes=self.incremental_status
+        )
 
-        self.status_prioritiser.add(name, lambda: self.component_items[name].status)
+        return item
 
+    def add_dependency(self, item: ComponentGraphItem, depends_on: ComponentGraphItem):
+        """Make an item that is already in the graph depend on another item in the graph.
+
+        Raises:
+            ValueError: if either item is not registered in this graph, or if the new dependency
+                        would create a cycle.
+        """
+        for to_validate in (item, depends_on):
+            self._validate_registered(
+                to_validate, f"Cannot make {item.name} depend on {depends_on.name}"
+            )
+        if depends_on.name == item.name or item.name in self._get_ancestor_names(depends_on.name):
+            raise ValueError(
+                f"Cannot make {item.name} depend on {depends_on.name} - this would create a cycle."
+            )
+        if depends_on.name in self._dependencies[item.name]:
+            return
+        item.depends_on.append(depends_on)
+        self._add_edge(item.name, depends_on.name)
+        self._topological_order = None
+        self._structure_hash = None
+        self._revision += 1
+
+    def get_by_name(self, name: str) -> ComponentGraphItem:
+        """Returns a ComponentGraphItem, accessed by name.
+
+        Raises:
+            KeyError: if no item of this name is in the graph.
+        """
         return self.component_items[name]
 
+    def get_dependents(self, name: str, transitive: bool = False) -> List[ComponentGraphItem]:
+        """Returns the items that depend on the named item.
+
+        Args:
+            name: the name of the item
+            transitive: if True, also include items that depend on the named item indirectly.
+                        These are returned in topological order.
+        """
+        if not transitive:
+            return [self.component_items[dependent] for dependent in self._dependents[name]]
+
+        descendants: Set[str] = set()
+        to_visit = list(self._dependents[name])
+        while to_visit:
+            dependent = to_visit.pop()
+            if dependent not in descendants:
+                descendants.add(dependent)
+                to_visit.extend(self._dependents[dependent])
+        return [self.component_items[n] for n in self._get_topological_order() if n in descendants]
+
+    def get_ancestors(self, name: str) -> List[ComponentGraphItem]:
+        """Returns the items the named item depends on, directly or indirectly, topologically."""
+        ancestors = self._get_ancestor_names(name)
+        return [self.component_items[n] for n in self._get_topological_order() if n in ancestors]
+
+    def topological_order(self) -> List[str]:
+        """Returns the names of all items, ordered so every item comes after its prerequisites.
+
+        Items are kept in the order they were added unless add_dependency requires otherwise.
+        """
+        return list(self._get_topological_order())
+
+    def _get_topological_order(self) -> List[str]:
+        """Returns the cached topological order, recomputing it if needed.  Do not modify."""
+        if self._topological_order is None:
+            self._topological_order = self._compute_topological_order()
+        return self._topological_order
+
+    def _compute_topological_order(self) -> List[str]:
+        """Returns a topological order of the items, preferring the order they were added."""
+        insertion_index = {name: index for index, name in enumerate(self.component_items)}
+        remaining = {name: len(dependencies) for name, dependencies in self._dependencies.items()}
+        ready = [(insertion_index[name], name) for name, count in remaining.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, name = heapq.heappop(ready)
+            order.append(name)
+            for dependent in self._dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, (insertion_index[dependent], dependent))
+        return order
+
+    def _get_ancestor_names(self, name: str) -> Set[str]:
+        """Returns the names of every item the named item depends on, directly or indirectly."""
+        ancestors: Set[str] = set()
+        to_visit = list(self._dependencies[name])
+        while to_visit:
+            prerequisite = to_visit.pop()
+            if prerequisite not in ancestors:
+                ancestors.add(prerequisite)
+                to_visit.extend(self._dependencies[prerequisite])
+        return ancestors
+
+    def _add_edge(self, name: str, depends_on: str):
+        """Records in the edge indexes that the named item depends on another."""
+        self._dependencies[name].append(depends_on)
+        self._dependents[depends_on].append(name)
+        self._dependency_masks[self.component_items[name]._index] |= (
+            1 << self.component_items[depends_on]._index
+        )
+
+    def _is_executed(self, index: int) -> bool:
+        """Returns whether the item with this id has been executed."""
+        return bool(self._executed_mask >> index & 1)
+
+    def _set_executed(self, index: int, value: bool):
+        """Sets whether the item with this id has been executed."""
+        if value:
+            self._executed_mask |= 1 << index
+        else:
+            self._executed_mask &= ~(1 << index)
+        self._revision += 1
+
+    def _validate_registered(self, item: ComponentGraphItem, error_prefix: str):
+        """Raises a ValueError if item is not an item of this graph."""
+        if self.component_items.get(item.name) is not item:
+            raise ValueError(
+                f"{error_prefix} - {item.name} is not a ComponentGraphItem of this graph."
+            )
+
+    def structure_hash(self) -> str:
+        """Returns a hash of the graph's structure: its items, their types and dependencies."""
+        if self._structure_hash is not None:
+            return self._structure_hash
+        structure = [
+            [
+                name,
+                self.component_items[name].kind,
+                sorted(self._dependencies[name]),
+            ]
+            for name in sorted(self.component_items)
+        ]
+        self._structure_hash = hashlib.sha256(json.dumps(structure).encode()).hexdigest()
+        return self._structure_hash
+
+    def record_completion(self, name: str, fingerprint: Optional[str]):
+        """Records that the named item completed execution with the given fingerprint.
+
+        Items without a fingerprint are not recorded, as their completion cannot be trusted in a
+        later dispatch.
+        """
+        if fingerprint is None:
+            self._completed_fingerprints.pop(name, None)
+        else:
+            self._completed_fingerprints[name] = fingerprint
+        self._revision += 1
+
+    def export_execution_state(self) -> Dict[str, Any]:
+        """Returns this graph's execution plan and completed items, for storing between dispatches.
+
+        The result is a dict of simple types, suitable for an ops StoredState.
+        """
+        return {
+            "structure_hash": self.structure_hash(),
+            "plan": self.topological_order(),
+            "completed": dict(self._completed_fingerprints),
+        }
+
+    def restore_execution_state(self, state: Mapping[str, Any]) -> List[str]:
+        """Restores state from export_execution_state, returning the names marked as executed.
+
+        Nothing is restored if the graph's structure changed since the state was exported.
+        Otherwise, the stored plan is reused as the topological order and every item that
+        completed with a fingerprint equal to its current fingerprint is marked as executed.
+        An item whose fingerprint cannot be computed is treated as changed.
+        """
+        if not state or state.get("structure_hash") != self.structure_hash():
+            logger.info("No execution state stored for this graph structure - starting cold.")
+            return []
+
+        self._topological_order = list(state["plan"])
+        changed = []
+        for name, fingerprint in state["completed"].items():
+            item = self.component_items[name]
+            if item.fingerprint() == fingerprint:
+                item.executed = True
+                self._completed_fingerprints[name] = fingerprint
+            else:
+                changed.append(name)
+
+        # Anything downstream of a changed item must run again too, even if it is unchanged
+        for name in changed:
+            self.mark_dirty(name)
+        restored = [
+            name for name in self._get_topological_order() if self.component_items[name].executed
+        ]
+        logger.info(f"Restored executed Components from stored state: {restored}")
+        return restored
+
+    def mark_dirty(self, name: str) -> List[str]:
+        """Marks an item and everything downstream of it as needing execution.
+
+        Returns the names of the items that were marked, in topological order.
+        """
+        dirty = [self.component_items[name]] + self.get_dependents(name, transitive=True)
+        for item in dirty:
+            item.executed = False
+            self._completed_fingerprints.pop(item.name, None)
+            self._status_overrides.pop(item.name, None)
+        return [item.name for item in dirty]
+
+    def mark_dirty_for_event(self, event: EventBase) -> List[str]:
+        """Marks dirty every item whose Component observes this event, and their dependents.
+
+        Returns the names of the items that were marked.  Events that no Component declared in
+        its events_to_observe, such as config-changed, do not mark anything.
+        """
+        handle = event.handle
+        dirty: List[str] = []
+        for name in self._get_topological_order():
+            if name in dirty:
+                continue
+            for bound_event in self.component_items[name].events_to_observe:
+                if (
+                    bound_event.event_kind == handle.kind
+                    and bound_event.emitter.handle == handle.parent
+                ):
+                    dirty.extend(n for n in self.mark_dirty(name) if n not in dirty)
+                    break
+        return dirty
+
+    def mark_inactive_dirty(self) -> List[str]:
+        """Marks dirty every executed item that is no longer Active, and their dependents.
+
+        An item is only checked if all of its prerequisites are Active, as an item waiting on
+        its prerequisites is not expected to be Active.  Returns the names of the items marked.
+        """
+        cache: StatusCache = {}
+        failed = [
+            item.name
+            for item in self.component_items.values()
+            if item.executed
+            and not item._inactive_prerequisites(cache)
+            and not item.wait_reason(cache).is_active
+        ]
+        dirty: List[str] = []
+        for name in failed:
+            dirty.extend(n for n in self.mark_dirty(name) if n not in dirty)
+        return dirty
+
+    def mark_timed_out(self, name: str, budget: float) -> StatusBase:
+        """Marks an executed item as having run out of its time budget, returning its new status.
+
+        Until the item is marked dirty, its status is a WaitingStatus giving the timeout, rather
+        than its Component.status, so items that depend on it are not executed.  The item is not
+        recorded as completed, so it is executed again in the next dispatch.
+        """
+        status = WaitingStatus(f"Timed out after {budget:.3g}s configuring.")
+        self._status_overrides[name] = status
+        self._completed_fingerprints.pop(name, None)
+        self._revision += 1
+        self.notify_status_changed(name)
+        return status
+
+    def get_last_known_status(self, name: str) -> Optional[StatusBase]:
+        """Returns the named item's own status restored from an earlier dispatch, if known.
+
+        Statuses restored while the item was waiting on its prerequisites are not returned, as
+        they do not describe the item's Component.
+        """
+        restored = self._restored_statuses.get(name)
+        if restored is None or restored[2]:
+            return None
+        return StatusBase.from_name(restored[0], restored[1])
+
+    def get_status_override(self, name: str) -> Optional[StatusBase]:
+        """Returns the status that replaces the named item's Component.status, if there is one."""
+        return self._status_overrides.get(name)
+
     def get_events_to_observe(self) -> List[BoundEvent]:
         """Returns a list of the extra events these Components should observe."""
         to_observe = []
@@ -58,32 +460,379 @@ class ComponentGraph:
         return to_observe
 
     def get_executable_component_items(self) -> List[ComponentGraphItem]:
-        """Returns a list of ComponentGraphItems ready for execution."""
-        return [item for item in self.component_items.values() if item.ready_for_execution]
+        """Returns a list of ComponentGraphItems ready for execution.
+
+        Readiness is computed on the graph's bitsets: an item is ready if it has not executed and
+        its dependency mask is a subset of the mask of Active items.  Only the prerequisites of
+        items that have not executed have their status evaluated.
+        """
+        pending_mask = self._pending_mask()
+        if not pending_mask:
+            return []
+        active_mask = self._active_mask(self._required_mask(pending_mask), {})
+        return self._ready_items(pending_mask, active_mask)
 
     def yield_executable_component_items(self) -> Iterable[ComponentGraphItem]:
         """Yields all executable components, marking them as executed as they're yielded.
 
-        Will only yield Components after all their depends_on Components are ready.
+        Will only yield Components after all their depends_on Components are ready.  Each item is
+        yielded at most once, and the graph is acyclic, so this always terminates.
+
+        The mask of Active items is kept for the whole loop, so each prerequisite is evaluated
+        once.  Items yielded by the loop are only evaluated once nothing else is ready, and only
+        if a pending item depends on them.
         """
-        # TODO: Is there any way this can become an infinite loop?  Add a failsafe just in case?
-        while len(executable_component_items := self.get_executable_component_items()) > 0:
-            executable_component_items[0].executed = True
-            yield executable_component_items[0]
+        cache: StatusCache = {}
+        pending_mask = self._pending_mask()
+        active_mask = self._active_mask(self._required_mask(pending_mask), cache)
+        # Items yielded by this loop, whose status has not been evaluated since they executed
+        unknown_mask = 0
+        while True:
+            ready = self._ready_items(pending_mask, active_mask)
+            if not ready and unknown_mask:
+                for index in _iter_bits(unknown_mask):
+                    cache.pop(self._items[index], None)
+                required_mask = self._required_mask(pending_mask) & unknown_mask
+                unknown_mask &= ~required_mask
+                active_mask |= self._active_mask(required_mask & self._executed_mask, cache)
+                ready = self._ready_items(pending_mask, active_mask)
+            if not ready:
+                break
+
+            item = ready[0]
+            item.executed = True
+            yield item
+
+            pending_mask = self._pending_mask()
+            unknown_mask |= 1 << item._index
+            active_mask &= ~(1 << item._index)
 
-    def get_by_name(self, name: str):
-        """Returns a component, accessed by name."""
-        raise NotImplementedError()
+        pending = [item.name for item in self.get_pending_component_items()]
+        if pending:
+            logger.info(f"Components not executed because prerequisites are not ready: {pending}")
+
+    def _pending_mask(self) -> int:
+        """Returns the mask of items that have not executed."""
+        return ~self._executed_mask & ((1 << len(self._items)) - 1)
+
+    def _required_mask(self, pending_mask: int) -> int:
+        """Returns the mask of items that the items in pending_mask depend on."""
+        required_mask = 0
+        for index in _iter_bits(pending_mask):
+            required_mask |= self._dependency_masks[index]
+        return required_mask
+
+    def _active_mask(self, mask: int, cache: StatusCache) -> int:
+        """Returns the subset of mask whose items are Active, evaluating each one's status."""
+        active_mask = 0
+        for index in _iter_bits(mask):
+            if self._items[index].wait_reason(cache).is_active:
+                active_mask |= 1 << index
+        return active_mask
+
+    def _ready_items(self, pending_mask: int, active_mask: int) -> List[ComponentGraphItem]:
+        """Returns the pending items whose prerequisites are all Active, in topological order."""
+        dependency_masks = self._dependency_masks
+        return [
+            item
+            for item in (self.component_items[name] for name in self._get_topological_order())
+            if pending_mask >> item._index & 1 and not dependency_masks[item._index] & ~active_mask
+        ]
+
+    def get_pending_component_items(self) -> List[ComponentGraphItem]:
+        """Returns the ComponentGraphItems that have not executed, in topological order."""
+        return [
+            self.component_items[name]
+            for name in self._get_topological_order()
+            if not self.component_items[name].executed
+        ]
 
     @property
     def status(self) -> StatusBase:
-        """Returns the worst status of all ComponentItems in the collection."""
-        return self.status_prioritiser.highest()
+        """Returns the worst status of all ComponentItems in the collection.
+
+        Statuses are computed in a single pass, so each Component's status is evaluated at most
+        once regardless of how many items depend on it, including when the status_prioritiser
+        collects the items' statuses concurrently.
+        """
+        self._status_cache = SharedStatusCache()
+        try:
+            return self.status_prioritiser.highest()
+        finally:
+            self._status_cache = None
+
+    def collect_component_statuses(
+        self, cached_statuses: Optional[Mapping[str, StatusBase]] = None
+    ) -> Dict[str, StatusBase]:
+        """Returns the status of each item's Component, ignoring whether it has been executed.
+
+        Cached statuses that a Component confirms with its cheap Component.verify_status are
+        reused.  All other statuses are collected through the status_prioritiser, so they are
+        collected concurrently if it is configured to do so.
+
+        Args:
+            cached_statuses: (optional) Component statuses from an earlier dispatch, keyed by name
+        """
+        cached_statuses = cached_statuses or {}
+        statuses = {}
+        getters = {}
+        for name, item in self.component_items.items():
+            cached_status = cached_statuses.get(name)
+            if cached_status is not None and item.component.verify_status(cached_status):
+                statuses[name] = cached_status
+            else:
+                getters[name] = lambda item=item: get_traced_status(item.component)
+        statuses.update(self.status_prioritiser.collect(getters))
+        return statuses
+
+    def status_from_component_statuses(
+        self, component_statuses: Mapping[str, StatusBase]
+    ) -> StatusBase:
+        """Returns the worst status of all items, given the status of each of their Components.
+
+        Every item is treated as already executed, as is the case when refreshing status in a
+        dispatch that does not run the Components.
+        """
+        cache: StatusCache = {}
+        statuses = [
+            (name, item.wait_reason(cache, component_statuses).to_status())
+            for name, item in self.component_items.items()
+        ]
+        return self.status_prioritiser.highest_of(statuses)
+
+    def notify_status_changed(self, name: str):
+        """Pushes the status of an item, and of the items that depend on it, to the Prioritiser.
+
+        Does nothing if this graph is not using incremental_status.
+        """
+        if not self.incremental_status:
+            return
+        if self._deferred_notifications is not None:
+            if name not in self._deferred_notifications:
+                self._deferred_notifications.append(name)
+            return
+        self._push_statuses([name])
+
+    @contextmanager
+    def deferred_status_notifications(self):
+        """Defers notify_status_changed until the block exits, then pushes each status once.
+
+        Use this around an event loop that executes the graph, such as asyncio.run of
+        execute_component_graph_async: on the loop, evaluating an AsyncComponent's status would
+        start a nested event loop, and a synchronous status would block the loop.  Notifications
+        are dropped if the block raises.
+        """
+        if self._deferred_notifications is not None:
+            yield
+            return
+        self._deferred_notifications = []
+        try:
+            yield
+            names = self._deferred_notifications
+        finally:
+            self._deferred_notifications = None
+        self._push_statuses(names)
+
+    def _push_statuses(self, names: List[str]):
+        """Pushes the status of the named items, and of the items that depend on them."""
+        cache: StatusCache = {}
+        pushed: Set[str] = set()
+        for name in names:
+            for item in [self.component_items[name]] + self.get_dependents(name, transitive=True):
+                if item.name not in pushed:
+                    pushed.add(item.name)
+                    self.status_prioritiser.push(item.name, item.wait_reason(cache).to_status())
+
+    def _get_item_status(self, name: str) -> StatusBase:
+        """Returns the status of an item, reusing the current status pass cache if there is one."""
+        return self.component_items[name].wait_reason(self._status_cache).to_status()
+
+    def _record_wait_reason(self, reason: WaitReason):
+        """Records the WaitReason just computed for an item, for summarise()."""
+        self._last_reasons[reason.name] = reason
+        self._revision += 1
+
+    def record_timings(self, timings: Iterable[ComponentTiming]):
+        """Records how long items took to configure in a reconcile pass, for summarise()."""
+        for timing in timings:
+            self._last_timings[timing.name] = timing
+        self._revision += 1
+
+    def export_summary_state(self) -> Dict[str, Any]:
+        """Returns the last statuses and timings of the items, for storing between dispatches.
+
+        The result is a dict of simple types, suitable for an ops StoredState.
+        """
+        statuses = {name: list(status) for name, status in self._restored_statuses.items()}
+        for name, reason in self._last_reasons.items():
+            status = reason.to_status()
+            statuses[name] = [
+                status.name,
+                status.message,
+                [waiting.name for waiting in reason.waiting_on],
+            ]
+        timings = {
+            name: [timing.duration, timing.budget, timing.timed_out]
+            for name, timing in self._last_timings.items()
+        }
+        return {"statuses": statuses, "timings": timings}
+
+    def restore_summary_state(self, state: Mapping[str, Any]):
+        """Restores state from export_summary_state, without replacing anything newer."""
+        if not state:
+            return
+        for name, (status, message, waiting_on) in state.get("statuses", {}).items():
+            if name in self.component_items and name not in self._last_reasons:
+                self._restored_statuses[name] = (status, message, tuple(waiting_on))
+        for name, (duration, budget, timed_out) in state.get("timings", {}).items():
+            if name in self.component_items and name not in self._last_timings:
+                self._last_timings[name] = ComponentTiming(name, duration, budget, timed_out)
+        self._revision += 1
+
+    def summarise(self, execution_state: Optional[Mapping[str, Any]] = None) -> GraphSummary:
+        """Returns a report of the graph's shape and the last known state of each item.
+
+        The report is built only from what earlier status evaluations and reconcile passes
+        recorded, so it evaluates no Component.status, fingerprint or factory, and makes no
+        external calls.  It is cached until anything it reports changes.
+
+        Args:
+            execution_state: (optional) a state from export_execution_state to report executed
+                             items and fingerprints from, for example in a dispatch that did not
+                             restore the graph's execution state.  If None, the graph's own
+                             execution state is reported.
+        """
+        cache_key = (self._revision, execution_state is None)
+        if self._summary is not None and self._summary[0] == cache_key:
+            return self._summary[1]
 
-    def summarise(self):
-        """Placeholder.
+        if execution_state is None:
+            fingerprints = self._completed_fingerprints
+            executed = {name for name, item in self.component_items.items() if item.executed}
+        else:
+            fingerprints = execution_state.get("completed", {})
+            executed = set(fingerprints)
 
-        TODO: definitely need something to help writing/debugging
-         charms.  Not sure exactly what to put here.
+        order = self._get_topological_order()
+        summary = GraphSummary(
+            structure_hash=self.structure_hash(),
+            order=tuple(order),
+            components=tuple(
+                self._summarise_item(name, name in executed, fingerprints.get(name))
+                for name in order
+            ),
+        )
+        self._summary = (cache_key, summary)
+        return summary
+
+    def _summarise_item(
+        self, name: str, executed: bool, fingerprint: Optional[str]
+    ) -> ComponentSummary:
+        """Returns the summary of one item, from its last recorded status and timing."""
+        status, message, waiting_on = None, "", ()
+        if name in self._last_reasons:
+            reason = self._last_reasons[name]
+            last_status = reason.to_status()
+            status, message = last_status.name, last_status.message
+            waiting_on = tuple(waiting.name for waiting in reason.waiting_on)
+        elif name in self._restored_statuses:
+            status, message, waiting_on = self._restored_statuses[name]
+        timing = self._last_timings.get(name)
+        return ComponentSummary(
+            name=name,
+            kind=self.component_items[name].kind,
+            depends_on=tuple(self._dependencies[name]),
+            executed=executed,
+            status=status,
+            message=message,
+            waiting_on=waiting_on,
+            fingerprint=fingerprint,
+            duration=timing.duration if timing is not None else None,
+            timed_out=timing.timed_out if timing is not None else False,
+        )
+
+
+class ReadinessTracker:
+    """Tracks which pending items of a ComponentGraph are ready while items finish out of order.
+
+    Used by executors that configure several items at once.  An executed item is Active if its
+    own status is Active and every item it depends on is Active.  Once all of an executed item's
+    prerequisites have finished, whether it is Active is decided and kept, so each item's status
+    is needed at most once.  Readiness is then computed on the graph's bitsets, without
+    evaluating wait reasons.
+    """
+
+    def __init__(self, graph: ComponentGraph):
+        """Instantiate a ReadinessTracker for graph, whose items must not change while in use."""
+        self._graph = graph
+        self._positions = [0] * len(graph._items)
+        for position, name in enumerate(graph._get_topological_order()):
+            self._positions[graph.component_items[name]._index] = position
+        # Items whose activeness is decided, and the subset of them that are Active
+        self._decided_mask = 0
+        self._active_mask = 0
+
+    def needed(self, unfinished: Iterable[ComponentGraphItem]) -> List[ComponentGraphItem]:
+        """Returns the finished items whose statuses decide which pending items are ready.
+
+        These are the undecided prerequisites of pending items, and theirs in turn, in
+        topological order.
+
+        Args:
+            unfinished: items that are executing and have not yet finished
         """
-        raise NotImplementedError()
+        graph = self._graph
+        pending_mask = graph._pending_mask()
+        excluded_mask = pending_mask | self._decided_mask
+        for item in unfinished:
+            excluded_mask |= 1 << item._index
+        needed_mask = 0
+        frontier = graph._required_mask(pending_mask) & ~excluded_mask
+        while frontier:
+            needed_mask |= frontier
+            frontier = graph._required_mask(frontier) & ~excluded_mask & ~needed_mask
+        return self._in_order(needed_mask)
+
+    def ready(
+        self, needed: List[ComponentGraphItem], statuses: Mapping[str, StatusBase]
+    ) -> List[ComponentGraphItem]:
+        """Decides which needed items are Active, returning the pending items that are ready.
+
+        Args:
+            needed: the items returned by needed()
+            statuses: the own status of every needed item, by name
+        """
+        dependency_masks = self._graph._dependency_masks
+        for item in needed:
+            bit = 1 << item._index
+            dependencies = dependency_masks[item._index]
+            if dependencies & ~self._decided_mask:
+                # Waiting on an item that has not finished
+                continue
+            self._decided_mask |= bit
+            if not dependencies & ~self._active_mask and isinstance(
+                statuses[item.name], ActiveStatus
+            ):
+                self._active_mask |= bit
+        return self._in_order(
+            sum(
+                1 << index
+                for index in _iter_bits(self._graph._pending_mask())
+                if not dependency_masks[index] & ~self._active_mask
+            )
+        )
+
+    def _in_order(self, mask: int) -> List[ComponentGraphItem]:
+        """Returns the items in mask, in topological order."""
+        return sorted(
+            (self._graph._items[index] for index in _iter_bits(mask)),
+            key=lambda item: self._positions[item._index],
+        )
+
+
+def _iter_bits(mask: int) -> Iterable[int]:
+    """Yields the index of each set bit in mask, lowest first."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
@@ -6,41 +6,242 @@ from __future__ import (
     annotations,  # To enable type hinting a method in a class with its own class
 )
 
-from typing import List, Optional
+import logging
+import threading
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, Optional, Tuple
 
-from ops import ActiveStatus, MaintenanceStatus, StatusBase
+from ops import ActiveStatus, BoundEvent, MaintenanceStatus, StatusBase
 
 from .component import Component
+from .reconcile_tracing import span
+
+if TYPE_CHECKING:
+    from .component_graph import ComponentGraph
+
+logger = logging.getLogger(__name__)
+
+# How many levels of nested prerequisites are spelled out in a status message
+DEFAULT_WAIT_REASON_DEPTH = 2
+
+# Cache of WaitReasons computed during a single status pass, keyed by ComponentGraphItem
+StatusCache = Dict["ComponentGraphItem", "WaitReason"]
+
+
+class SharedStatusCache(dict):
+    """A StatusCache shared by threads, in which each item's WaitReason is evaluated once.
+
+    Threads evaluating the same item, such as a prerequisite shared by items whose statuses are
+    collected concurrently, take a lock per item, so one evaluates it and the others reuse it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._evaluating: Dict[ComponentGraphItem, threading.Lock] = defaultdict(threading.Lock)
+
+    def evaluation_lock(self, item: ComponentGraphItem) -> threading.Lock:
+        """Returns the lock held while evaluating an item's WaitReason into this cache."""
+        with self._lock:
+            return self._evaluating[item]
+
+
+@dataclass(frozen=True)
+class WaitReason:
+    """A structured explanation of the Status of a ComponentGraphItem.
+
+    A WaitReason is either waiting on other WaitReasons (the item's prerequisites that are not
+    Active), or holds the Status the item reports now that it is no longer waiting.  Messages are
+    only formatted when the WaitReason is converted to a Status, and nested prerequisites are only
+    spelled out to a bounded depth.
+
+    Args:
+        name: the name of the ComponentGraphItem this describes
+        status: the Status of the item, or None if it is waiting on prerequisites
+        waiting_on: WaitReasons for the prerequisites of this item that are not Active
+    """
+
+    name: str
+    status: Optional[StatusBase] = None
+    waiting_on: Tuple[WaitReason, ...] = ()
+
+    @property
+    def is_active(self) -> bool:
+        """Returns True if this item is not waiting on anything and is Active."""
+        return not self.waiting_on and isinstance(self.status, ActiveStatus)
+
+    def format(self, max_depth: int = DEFAULT_WAIT_REASON_DEPTH) -> str:
+        """Returns a human-readable description of this WaitReason.
+
+        Args:
+            max_depth: how many levels of prerequisites to describe before eliding them.
+        """
+        if not self.waiting_on:
+            return f"{self.name} ({self.status.name}: {self.status.message})"
+        return f"{self.name} (waiting on {self.format_waiting_on(max_depth - 1)})"
+
+    def format_waiting_on(self, max_depth: int = DEFAULT_WAIT_REASON_DEPTH) -> str:
+        """Returns a human-readable description of the prerequisites this is waiting on."""
+        if max_depth < 0:
+            return "..."
+        return ", ".join(reason.format(max_depth) for reason in self.waiting_on)
+
+    def to_status(self, max_depth: int = DEFAULT_WAIT_REASON_DEPTH) -> StatusBase:
+        """Returns the Status described by this WaitReason."""
+        if self.waiting_on:
+            return MaintenanceStatus(
+                f"Execution pending - waiting on {self.format_waiting_on(max_depth)}."
+            )
+        return self.status
 
 
 class ComponentGraphItem:
-    """A wrapper around a Component for use in a ComponentGraph."""
+    """A wrapper around a Component for use in a ComponentGraph.
+
+    Once added to a ComponentGraph, an item is a view onto the graph's compact state: its
+    execution state is stored in the graph's bitsets under the item's integer id.
+    """
+
+    __slots__ = (
+        "_component",
+        "_factory",
+        "_wrappers",
+        "_declared_events",
+        "_declared_fingerprint",
+        "name",
+        "depends_on",
+        "_executed",
+        "_graph",
+        "_index",
+    )
 
     def __init__(
         self,
-        component: Component,
+        component: Optional[Component] = None,
         depends_on: Optional[List[ComponentGraphItem]] = None,
+        name: Optional[str] = None,
+        factory: Optional[Callable[[], Component]] = None,
+        events_to_observe: Optional[List[BoundEvent]] = None,
+        fingerprint: Optional[Callable[[], Optional[str]]] = None,
     ):
-        self.component = component
-        self.name = self.component.name
+        """Instantiate a ComponentGraphItem, for either a Component or a Component factory.
+
+        Args:
+            component: (optional) the Component this item wraps
+            depends_on: (optional) the items this item's Component depends on being Active
+            name: (optional) the name of the Component built by factory.  Required with factory.
+            factory: (optional) callable that builds the Component the first time it is needed.
+                     Use this instead of component to defer building the Component.
+            events_to_observe: (optional) the events the Component built by factory observes, so
+                               they can be observed without building it
+            fingerprint: (optional) callable returning the fingerprint of the Component built by
+                         factory, so it can be fingerprinted without building it
+        """
+        if (component is None) == (factory is None):
+            raise ValueError("Exactly one of component or factory must be given.")
+        if factory is not None and name is None:
+            raise ValueError("A ComponentGraphItem built by a factory must be given a name.")
+        self._component = component
+        self._factory = factory
+        self._wrappers: List[Callable[[Component], Component]] = []
+        self._declared_events = list(events_to_observe or [])
+        self._declared_fingerprint = fingerprint
+        self.name = component.name if component is not None else name
         self.depends_on = depends_on or []
         self._executed: bool = False
+        # Set by the ComponentGraph this item is added to
+        self._graph: Optional[ComponentGraph] = None
+        self._index: int = -1
+
+    @property
+    def component(self) -> Component:
+        """Returns this item's Component, building it with the factory if not yet built."""
+        if self._component is None:
+            logger.info(f"Building component '{self.name}'")
+            component = self._factory()
+            if component.name != self.name:
+                raise ValueError(
+                    f"Factory for component '{self.name}' built a component named "
+                    f"'{component.name}'."
+                )
+            for wrapper in self._wrappers:
+                component = wrapper(component)
+            self._component = component
+        return self._component
+
+    def wrap_component(self, wrapper: Callable[[Component], Component]):
+        """Wraps this item's Component, now if it is built or else when it is built.
+
+        Used to instrument Components, for example by the graph profiler.  A factory's Component
+        is not built by wrapping it.
+
+        Args:
+            wrapper: callable returning the Component to use in place of the one it is given
+        """
+        if self._component is None:
+            self._wrappers.append(wrapper)
+        else:
+            self._component = wrapper(self._component)
+
+    @property
+    def built(self) -> bool:
+        """Returns whether this item's Component has been built."""
+        return self._component is not None
+
+    @property
+    def kind(self) -> str:
+        """Returns the name of the Component type, or of the factory, without building it."""
+        if self._factory is not None:
+            return f"factory:{self._factory.__qualname__}"
+        # A wrapped Component reports the class of the Component it wraps
+        return self._component.__class__.__qualname__
 
     @property
-    def events_to_observe(self) -> List[str]:
-        """Returns a list of the names of extra events that this Component should observe."""
+    def events_to_observe(self) -> List[BoundEvent]:
+        """Returns a list of the extra events that this Component should observe.
+
+        For an item built by a factory, these are the events declared when it was added, so
+        the Component is not built just to observe them.
+        """
+        if self._factory is not None:
+            return self._declared_events
         return self.component.events_to_observe
 
+    def fingerprint(self) -> Optional[str]:
+        """Returns the fingerprint of this item's Component, or None if computing it raised.
+
+        For an item built by a factory with a declared fingerprint, that is used instead, so the
+        Component is not built.  Fingerprints often read inputs that are not available yet, such
+        as relation data, so an error is treated as changed inputs rather than aborting the pass.
+        The Component's own configure reports the error when it is executed.
+        """
+        try:
+            if self._declared_fingerprint is not None:
+                return self._declared_fingerprint()
+            return self.component.fingerprint()
+        except Exception as e:
+            logger.warning(
+                f"Failed to fingerprint component '{self.name}' - treating it as changed: {e}"
+            )
+            return None
+
     @property
     def executed(self) -> bool:
         """Returns whether this Component has already been executed."""
+        if self._graph is not None:
+            return self._graph._is_executed(self._index)
         return self._executed
 
     @executed.setter
     def executed(self, value: bool):
         if value not in [True, False]:
             raise ValueError(f"Executed must be either True or False - got {value}.")
-        self._executed = value
+        if self._graph is not None:
+            self._graph._set_executed(self._index, value)
+        else:
+            self._executed = value
 
     @property
     def ready_for_execution(self) -> bool:
@@ -50,9 +251,18 @@ class ComponentGraphItem:
         * it has not previously been executed
         * all Components it depends_on have been executed and gone to ActiveStatus
         """
-        if len(self._inactive_prerequisites()) != 0:
+        return self.is_ready_for_execution()
+
+    def is_ready_for_execution(self, cache: Optional[StatusCache] = None) -> bool:
+        """Returns whether this Component is ready for execution, reusing a status pass cache.
+
+        Args:
+            cache: (optional) WaitReasons already computed in this status pass.  Pass the same
+                   dict when checking several items so each prerequisite is evaluated only once.
+        """
+        if self.executed:
             return False
-        if self._executed:
+        if len(self._inactive_prerequisites(cache)) != 0:
             return False
         return True
 
@@ -69,26 +279,113 @@ class ComponentGraphItem:
         If all depends_on Components are in ActiveStatus and this Component has been executed,
         returns the Status for this Component
         """
-        missing_prerequisites = {
-            prerequisite.name: prerequisite.status
-            for prerequisite in self._inactive_prerequisites()
-        }
-
-        if missing_prerequisites:
-            message_suffix = ", ".join(
-                [f"{name} ({status})" for name, status in missing_prerequisites.items()]
-            )
-            return MaintenanceStatus(f"Execution pending - waiting on {message_suffix}.")
+        return self.wait_reason().to_status()
 
-        if not self.executed:
-            return MaintenanceStatus("Execution pending.")
+    def wait_reason(
+        self,
+        cache: Optional[StatusCache] = None,
+        component_statuses: Optional[Mapping[str, StatusBase]] = None,
+    ) -> WaitReason:
+        """Returns the WaitReason for this item, computing its prerequisites bottom-up.
 
-        return self.component.status
+        Each item reachable from this one is evaluated at most once per cache, so a chain or
+        diamond of N items costs N Component.status evaluations, and the graph is walked without
+        recursion so chains of any length can be evaluated.
 
-    def _inactive_prerequisites(self) -> List[ComponentGraphItem]:
+        Args:
+            cache: (optional) WaitReasons already computed in this status pass.  If omitted, a new
+                   cache is used for this call only.
+            component_statuses: (optional) already known Component statuses, keyed by item name.
+                                If provided, every item is treated as executed and these are used
+                                instead of evaluating Component.status.  A cache must not be
+                                shared between calls with and without component_statuses.
+        """
+        if cache is None:
+            cache = {}
+        if self in cache:
+            return cache[self]
+
+        # Walk the prerequisites depth first with an explicit stack, evaluating each item after
+        # all of its prerequisites, so the depth of the graph is not limited by recursion
+        stack = [(self, iter(self.depends_on))]
+        visited = {self}
+        while stack:
+            item, prerequisites = stack[-1]
+            for prerequisite in prerequisites:
+                if prerequisite not in cache and prerequisite not in visited:
+                    visited.add(prerequisite)
+                    stack.append((prerequisite, iter(prerequisite.depends_on)))
+                    break
+            else:
+                stack.pop()
+                with _evaluation_lock(cache, item):
+                    # Another thread sharing the cache may have evaluated it while this one waited
+                    if item not in cache:
+                        item._evaluate_wait_reason(cache, component_statuses)
+        return cache[self]
+
+    def _evaluate_wait_reason(
+        self, cache: StatusCache, component_statuses: Optional[Mapping[str, StatusBase]]
+    ):
+        """Computes this item's WaitReason into cache, given those of all its prerequisites."""
+        waiting_on = tuple(
+            cache[prerequisite]
+            for prerequisite in self.depends_on
+            if not cache[prerequisite].is_active
+        )
+
+        if waiting_on:
+            reason = WaitReason(name=self.name, waiting_on=waiting_on)
+        elif component_statuses is not None:
+            reason = WaitReason(name=self.name, status=component_statuses[self.name])
+        elif not self.executed:
+            reason = WaitReason(name=self.name, status=MaintenanceStatus("Execution pending."))
+        else:
+            reason = WaitReason(name=self.name, status=self._get_component_status())
+
+        cache[self] = reason
+        if self._graph is not None:
+            self._graph._record_wait_reason(reason)
+
+    def _get_component_status(self) -> StatusBase:
+        """Returns the Component's status, unless the graph has overridden it.
+
+        A Component built by a factory that has not been built in this dispatch reports the
+        status the graph last saw for it, if there is one, rather than being built.
+        """
+        if self._graph is not None:
+            override = self._graph.get_status_override(self.name)
+            if override is not None:
+                return override
+            if not self.built:
+                last_known = self._graph.get_last_known_status(self.name)
+                if last_known is not None:
+                    return last_known
+        return get_traced_status(self.component)
+
+    def _inactive_prerequisites(
+        self, cache: Optional[StatusCache] = None
+    ) -> List[ComponentGraphItem]:
         """Returns a list of any depends_on ComponentGraphItems that are not yet ActiveStatus."""
+        if cache is None:
+            cache = {}
         return [
             prerequisite
             for prerequisite in self.depends_on
-            if not isinstance(prerequisite.status, ActiveStatus)
+            if not prerequisite.wait_reason(cache).is_active
         ]
+
+
+def _evaluation_lock(cache: StatusCache, item: ComponentGraphItem):
+    """Returns the context to evaluate an item's WaitReason in, locked if cache is shared."""
+    if isinstance(cache, SharedStatusCache):
+        return cache.evaluation_lock(item)
+    return nullcontext()
+
+
+def get_traced_status(component: Component) -> StatusBase:
+    """Returns a Component's status, in a span if tracing is active."""
+    with span("component.status", {"component.name": component.name}) as status_span:
+        status = component.status
+        status_span.set_attribute("status.name", status.name)
+    return status
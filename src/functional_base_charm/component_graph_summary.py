@@ -0,0 +1,79 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""A debug report of a ComponentGraph, built only from what earlier passes cached."""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ComponentSummary:
+    """What is known about one item of a ComponentGraph, without evaluating anything.
+
+    Args:
+        name: the name of the item
+        kind: the Component type, or the factory that builds it
+        depends_on: the names of the items this item depends on
+        executed: whether the item has executed and not been marked dirty since
+        status: the name of the item's last seen status, or None if it was never evaluated
+        message: the message of the item's last seen status
+        waiting_on: the names of the prerequisites the item was last seen waiting on
+        fingerprint: the fingerprint the item last completed execution with, if any
+        duration: seconds the item last spent configuring, if it has been timed
+        timed_out: whether the item's last configure exceeded its budget
+    """
+
+    name: str
+    kind: str
+    depends_on: Tuple[str, ...]
+    executed: bool
+    status: Optional[str] = None
+    message: str = ""
+    waiting_on: Tuple[str, ...] = ()
+    fingerprint: Optional[str] = None
+    duration: Optional[float] = None
+    timed_out: bool = False
+
+    def format(self) -> str:
+        """Returns a one-line, human readable description of this item."""
+        status = f"{self.status}: {self.message}" if self.status else "status not evaluated"
+        parts = [
+            f"{self.name} [{'executed' if self.executed else 'pending'}] ({status})",
+        ]
+        if self.waiting_on:
+            parts.append(f"waiting on {', '.join(self.waiting_on)}")
+        if self.duration is not None:
+            parts.append(
+                f"configured in {self.duration:.3f}s" + (" (timed out)" if self.timed_out else "")
+            )
+        if self.fingerprint:
+            parts.append(f"fingerprint {self.fingerprint[:12]}")
+        return " - ".join(parts)
+
+
+@dataclass(frozen=True)
+class GraphSummary:
+    """A snapshot of a ComponentGraph's shape and the last known state of its items.
+
+    Args:
+        structure_hash: the hash of the graph's items, their types and dependencies
+        order: the names of the items in execution order
+        components: a summary of each item, in execution order
+    """
+
+    structure_hash: str
+    order: Tuple[str, ...]
+    components: Tuple[ComponentSummary, ...]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns this summary as a dict of simple types, for example for a Juju action."""
+        return asdict(self)
+
+    def format(self) -> str:
+        """Returns a human readable, multi-line report of this summary."""
+        lines = [f"ComponentGraph {self.structure_hash[:12]} ({len(self.components)} items)"]
+        for component in self.components:
+            lines.append(f"  {component.format()}")
+            if component.depends_on:
+                lines.append(f"    depends on {', '.join(component.depends_on)}")
+        return "\n".join(lines)
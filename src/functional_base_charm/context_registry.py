@@ -0,0 +1,121 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""A registry of named contexts that Components share, each computed once per dispatch."""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ContextRegistry:
+    """Named contexts shared by Components, each computed at most once until invalidated.
+
+    Register the function that computes each context, with the keys of any contexts it is built
+    from.  Components then ask for a context by key, for example by passing getter(key) as a
+    KubernetesComponent's context_callable or a ContainerFileTemplate's context_function, and
+    every Component asking for the same key shares one computation.
+
+    A charm is instantiated for each dispatch, so a registry created with it caches contexts for
+    one dispatch.  Call invalidate(key) if something a context was computed from changes within
+    the dispatch, for example after a Component writes a relation or a secret.
+
+    Contexts may be asked for from several threads at once.  Each context is computed by one
+    thread while others asking for it wait, and different contexts are computed concurrently.
+    """
+
+    def __init__(self):
+        """Instantiate an empty ContextRegistry."""
+        self._functions: Dict[str, Callable[..., Any]] = {}
+        self._dependencies: Dict[str, List[str]] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        self._values: Dict[str, Any] = {}
+        # Guards _values and computations, and serialises the computation of each context.
+        # Contexts only depend on those registered before them, so the per-context locks are
+        # always taken in the same order and cannot deadlock.
+        self._lock = threading.Lock()
+        self._computing: Dict[str, threading.Lock] = {}
+        # Number of times each context has been computed
+        self.computations: Dict[str, int] = {}
+
+    def register(self, key: str, func: Callable[..., Any], depends_on: Optional[List[str]] = None):
+        """Registers the function that computes a context.
+
+        Args:
+            key: the name of the context
+            func: callable that computes the context.  It is called with the values of the
+                  contexts in depends_on, in order, as positional arguments.
+            depends_on: (optional) keys of registered contexts this context is computed from.
+                        Invalidating any of them also invalidates this context.
+        """
+        if key in self._functions:
+            raise ValueError(f"Context '{key}' is already registered.")
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            # Requiring dependencies to be registered first also means there can be no cycles
+            if dependency not in self._functions:
+                raise ValueError(
+                    f"Cannot register context '{key}' - it depends on '{dependency}', which is "
+                    f"not registered."
+                )
+        self._functions[key] = func
+        self._dependencies[key] = depends_on
+        self._dependents[key] = []
+        self._computing[key] = threading.Lock()
+        self.computations[key] = 0
+        for dependency in depends_on:
+            self._dependents[dependency].append(key)
+
+    def get(self, key: str) -> Any:
+        """Returns a context, computing it and the contexts it depends on if not yet cached."""
+        if key not in self._functions:
+            raise KeyError(f"Context '{key}' is not registered.")
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+        with self._computing[key]:
+            # Another thread may have computed it while this one waited
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            dependencies = [self.get(dependency) for dependency in self._dependencies[key]]
+            logger.debug(f"Computing context '{key}'")
+            value = self._functions[key](*dependencies)
+            with self._lock:
+                self._values[key] = value
+                self.computations[key] += 1
+            return value
+
+    def getter(self, key: str) -> Callable[[], Any]:
+        """Returns a callable that returns the context, for APIs that take a context callable."""
+        if key not in self._functions:
+            raise KeyError(f"Context '{key}' is not registered.")
+        return lambda: self.get(key)
+
+    def invalidate(self, key: str) -> List[str]:
+        """Drops a cached context and every context computed from it.
+
+        Returns the keys whose cached values were dropped.
+        """
+        if key not in self._functions:
+            raise KeyError(f"Context '{key}' is not registered.")
+        dropped = []
+        to_visit = [key]
+        visited = set()
+        with self._lock:
+            while to_visit:
+                current = to_visit.pop()
+                if current in visited:
+                    continue
+                visited.add(current)
+                if current in self._values:
+                    del self._values[current]
+                    dropped.append(current)
+                to_visit.extend(self._dependents[current])
+        return dropped
+
+    def clear(self):
+        """Drops every cached context."""
+        with self._lock:
+            self._values.clear()
@@ -0,0 +1,503 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Profile a charm's component graph offline, under ops.testing.Harness.
+
+The charm is run in a Harness against a fake Kubernetes client and the Harness' fake Pebble,
+both of which can be given a fake latency per call.  Each Component is instrumented to record
+the time it spends configuring and evaluating its status, how often its status is evaluated and
+the external calls it makes, so hot spots in a graph can be found without deploying it.
+
+Run it as a module, for example:
+
+    python -m functional_base_charm.graph_profiler charm:MyCharm --charm-dir . \
+        --event install --event config_changed --kubernetes-latency 0.05 --collapsed out.folded
+"""
+
+import argparse
+import cProfile
+import importlib
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from unittest.mock import MagicMock, patch
+
+from ops import CharmBase, Container, StatusBase
+
+from .async_component import AsyncComponent
+from .component import Component
+from .harness_setup import PEBBLE_METHODS, emit_event, set_up_harness
+
+logger = logging.getLogger(__name__)
+
+# Name under which work outside any Component, such as unit status handling, is reported
+UNATTRIBUTED = "(reconciler)"
+
+
+@dataclass
+class ComponentStats:
+    """What one Component cost across the profiled events."""
+
+    name: str
+    configure_calls: int = 0
+    configure_time: float = 0.0
+    status_calls: int = 0
+    status_time: float = 0.0
+    external_calls: Counter = field(default_factory=Counter)
+
+    @property
+    def total_time(self) -> float:
+        """Returns the seconds spent configuring and evaluating status."""
+        return self.configure_time + self.status_time
+
+
+@dataclass
+class GraphProfile:
+    """The result of profiling a charm's component graph."""
+
+    events: List[str]
+    event_durations: List[float]
+    components: Dict[str, ComponentStats]
+    collapsed_stacks: Counter
+
+    def report(self) -> str:
+        """Returns a table of the cost of each Component, most expensive first."""
+        header = (
+            f"{'component':<30} {'configure':>9} {'conf s':>9} {'status':>7} {'status s':>9}  "
+            "external calls"
+        )
+        lines = [header, "-" * len(header)]
+        for stats in sorted(self.components.values(), key=lambda s: s.total_time, reverse=True):
+            calls = ", ".join(
+                f"{name}={count}" for name, count in sorted(stats.external_calls.items())
+            )
+            lines.append(
+                f"{stats.name:<30} {stats.configure_calls:>9} {stats.configure_time:>9.4f} "
+                f"{stats.status_calls:>7} {stats.status_time:>9.4f}  {calls or '-'}"
+            )
+        lines.append("")
+        for event, duration in zip(self.events, self.event_durations):
+            lines.append(f"{event}: {duration:.4f}s")
+        return "\n".join(lines)
+
+    def write_collapsed(self, path):
+        """Writes the profiled stacks in the collapsed format read by flamegraph.pl.
+
+        Each line is a ';'-separated stack and the microseconds spent in its innermost frame.
+        """
+        with open(path, "w") as f:
+            for stack, microseconds in sorted(self.collapsed_stacks.items()):
+                f.write(f"{stack} {microseconds}\n")
+
+
+class FakeKubernetesClient:
+    """A stand-in for a lightkube Client, returning no resources after a fake latency.
+
+    list returns an empty list and other methods return a MagicMock.  Private attributes, such as
+    the generic client under _client, are served by the MagicMock without being counted.
+    """
+
+    def __init__(self, profiler: "GraphProfiler", latency: float = 0.0):
+        self._profiler = profiler
+        self._latency = latency
+        self._backend = MagicMock()
+        self._backend.list.return_value = []
+
+    def __getattr__(self, name: str):
+        """Returns a wrapper for a client method that counts and delays the call."""
+        attribute = getattr(self._backend, name)
+        if name.startswith("_"):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._profiler.external_call(f"k8s.{name}", self._latency):
+                return attribute(*args, **kwargs)
+
+        return call
+
+
+class InstrumentedComponent:
+    """A proxy for a Component, timing its configure and status for a GraphProfiler.
+
+    Other attributes are read from the Component.  The proxy reports the Component's class, so
+    isinstance checks see through it.  Calls the Component makes on itself are not timed
+    separately, as they are part of the configure or status that made them.
+    """
+
+    def __init__(self, component: Component, profiler: "GraphProfiler"):
+        self._component = component
+        self._profiler = profiler
+
+    @property
+    def __class__(self):
+        """Returns the class of the Component, for isinstance checks."""
+        return type(self._component)
+
+    def __getattr__(self, name: str):
+        """Returns an attribute of the Component."""
+        return getattr(self._component, name)
+
+    def configure_charm(self, event):
+        """Configures the Component, timing it."""
+        with self._profiler._component_frame(self._component.name, "configure"):
+            self._component.configure_charm(event)
+
+    @property
+    def status(self) -> StatusBase:
+        """Returns the Component's status, timing it."""
+        with self._profiler._component_frame(self._component.name, "status"):
+            return self._component.status
+
+
+class InstrumentedAsyncComponent(InstrumentedComponent):
+    """A proxy for an AsyncComponent, also timing its asynchronous configure and status.
+
+    AsyncComponents executing concurrently on an event loop overlap, so their asynchronous
+    configure and status are recorded but not nested in the profiled stacks.
+    """
+
+    async def configure_charm_async(self, event):
+        """Configures the Component, timing it."""
+        started_at = time.perf_counter()
+        try:
+            await self._component.configure_charm_async(event)
+        finally:
+            self._profiler._record(self._component.name, "configure", started_at)
+
+    async def get_status(self) -> StatusBase:
+        """Returns the Component's status, timing it."""
+        started_at = time.perf_counter()
+        try:
+            return await self._component.get_status()
+        finally:
+            self._profiler._record(self._component.name, "status", started_at)
+
+
+class GraphProfiler:
+    """Instruments a charm's Components and external calls, and collects what they cost.
+
+    Time is attributed with a stack of frames: a Component's configure and status, and the
+    external calls made within them.  The stack is held in context variables, so each thread and
+    asyncio task has its own, starting from the stack of the code that started it where the
+    context is carried over (as with in_current_context).  AsyncComponents executing
+    concurrently on an event loop overlap, so their configure and status time is recorded but
+    not nested in the stacks.
+    """
+
+    def __init__(self, kubernetes_latency: float = 0.0, pebble_latency: float = 0.0):
+        """Instantiate a GraphProfiler.
+
+        Args:
+            kubernetes_latency: seconds each Kubernetes API call takes
+            pebble_latency: seconds each Pebble call takes
+        """
+        self.kubernetes_latency = kubernetes_latency
+        self.pebble_latency = pebble_latency
+        self.components: Dict[str, ComponentStats] = {}
+        self.collapsed_stacks: Counter = Counter()
+        # Frames of the stack being timed, each as [name, seconds spent in child frames], and the
+        # Components they belong to
+        self._frames: ContextVar[Tuple[List[Any], ...]] = ContextVar("frames", default=())
+        self._components: ContextVar[Tuple[str, ...]] = ContextVar("components", default=())
+        # Guards the results, which frames on any thread add to
+        self._lock = threading.Lock()
+
+    def kubernetes_client(self, *args, **kwargs) -> FakeKubernetesClient:
+        """Returns a fake Kubernetes client.  Used in place of lightkube.Client."""
+        return FakeKubernetesClient(self, self.kubernetes_latency)
+
+    @contextmanager
+    def patch_pebble(self) -> Iterator[None]:
+        """Counts and delays the Pebble calls made through any Container."""
+        with ExitStack() as stack:
+            for name in PEBBLE_METHODS:
+                method = getattr(Container, name, None)
+                if method is not None:
+                    stack.enter_context(
+                        patch.object(Container, name, self._wrap_pebble_method(name, method))
+                    )
+            yield
+
+    def _wrap_pebble_method(self, name: str, method: Callable) -> Callable:
+        profiler = self
+
+        def call(container, *args, **kwargs):
+            with profiler.external_call(f"pebble.{name}", profiler.pebble_latency):
+                return method(container, *args, **kwargs)
+
+        return call
+
+    def instrument(self, component_graph):
+        """Instruments the Components of a ComponentGraph, including those not yet built."""
+        for item in component_graph.component_items.values():
+            self.components.setdefault(item.name, ComponentStats(item.name))
+            item.wrap_component(self.instrument_component)
+
+    def instrument_component(self, component: Component) -> Component:
+        """Returns a proxy for a Component that records the cost of its configure and status."""
+        self.components.setdefault(component.name, ComponentStats(component.name))
+        if isinstance(component, AsyncComponent):
+            return InstrumentedAsyncComponent(component, self)
+        return InstrumentedComponent(component, self)
+
+    @contextmanager
+    def frame(self, name: str) -> Iterator[None]:
+        """Times a frame of the profiled stack, recording its self time."""
+        frames = self._frames.get() + ([name, 0.0],)
+        token = self._frames.set(frames)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self._frames.reset(token)
+            stack = ";".join(frame[0] for frame in frames)
+            with self._lock:
+                self.collapsed_stacks[stack] += max(int((elapsed - frames[-1][1]) * 1e6), 0)
+                if len(frames) > 1:
+                    frames[-2][1] += elapsed
+
+    @contextmanager
+    def _component_frame(self, name: str, phase: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        token = self._components.set(self._components.get() + (name,))
+        try:
+            with self.frame(f"{name}.{phase}"):
+                yield
+        finally:
+            self._components.reset(token)
+            self._record(name, phase, started_at)
+
+    def _record(self, name: str, phase: str, started_at: float):
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            stats = self.components.setdefault(name, ComponentStats(name))
+            if phase == "configure":
+                stats.configure_calls += 1
+                stats.configure_time += elapsed
+            else:
+                stats.status_calls += 1
+                stats.status_time += elapsed
+
+    @contextmanager
+    def external_call(self, name: str, latency: float) -> Iterator[None]:
+        """Counts an external call against the current Component, after a fake latency."""
+        components = self._components.get()
+        component = components[-1] if components else UNATTRIBUTED
+        with self._lock:
+            stats = self.components.setdefault(component, ComponentStats(component))
+            stats.external_calls[name] += 1
+        with self.frame(name):
+            if latency:
+                time.sleep(latency)
+            yield
+
+
+def profile_charm(
+    charm_type: Type[CharmBase],
+    events: Sequence[str],
+    meta: Optional[str] = None,
+    config: Optional[str] = None,
+    actions: Optional[str] = None,
+    leader: bool = True,
+    relations: Iterable[str] = (),
+    kubernetes_latency: float = 0.0,
+    pebble_latency: float = 0.0,
+    get_reconciler: Callable[[CharmBase], Any] = lambda charm: charm.charm_reconciler,
+    patch_targets: Iterable[str] = ("lightkube.Client",),
+) -> GraphProfile:
+    """Runs events on a charm under ops.testing.Harness and profiles its component graph.
+
+    Every container can connect, every patch_target is replaced by a fake Kubernetes client, and
+    the framework is committed after each event so deferred work such as the unit status runs.
+
+    Args:
+        charm_type: the charm class to profile
+        events: names of the charm events to emit in order, such as "config_changed".  Relation
+                events are emitted for the first relation of their name.
+        meta: (optional) the charm's metadata.yaml, if Harness cannot find it
+        config: (optional) the charm's config.yaml, if Harness cannot find it
+        actions: (optional) the charm's actions.yaml, if Harness cannot find it
+        leader: whether the unit is the leader
+        relations: relations to add before the charm starts, each as "name:remote-app"
+        kubernetes_latency: seconds each Kubernetes API call takes
+        pebble_latency: seconds each Pebble call takes
+        get_reconciler: callable returning the CharmReconciler of a charm instance
+        patch_targets: dotted paths of the lightkube Client classes the charm instantiates
+    """
+    # Imported here so charms importing this package do not import the testing modules
+    from ops.testing import Harness
+
+    profiler = GraphProfiler(kubernetes_latency, pebble_latency)
+    harness = Harness(charm_type, meta=meta, config=config, actions=actions)
+    durations = []
+    with ExitStack() as stack:
+        stack.callback(harness.cleanup)
+        for target in patch_targets:
+            stack.enter_context(patch(target, profiler.kubernetes_client))
+        added_relations = [
+            {"id": relation_id, "name": name, "remote_app": remote_app or name}
+            for relation_id, (name, _, remote_app) in enumerate(
+                relation.partition(":") for relation in relations
+            )
+        ]
+        relation_ids = set_up_harness(
+            harness,
+            leader,
+            {},
+            added_relations,
+            {container: True for container in harness.model.unit.containers},
+        )
+        harness.begin()
+        profiler.instrument(get_reconciler(harness.charm).component_graph)
+
+        stack.enter_context(profiler.patch_pebble())
+        for event in events:
+            recorded_event = _event_by_name(harness, event, added_relations)
+            started_at = time.perf_counter()
+            with profiler.frame(event):
+                emit_event(harness, recorded_event, relation_ids, get_reconciler)
+                harness.framework.commit()
+            durations.append(time.perf_counter() - started_at)
+
+    return GraphProfile(
+        events=list(events),
+        event_durations=durations,
+        components=profiler.components,
+        collapsed_stacks=profiler.collapsed_stacks,
+    )
+
+
+def _event_by_name(harness, event: str, relations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns a charm event named on the command line in the form recorded by a recording.
+
+    Relation events are for the first relation of their name, and pebble-ready events for the
+    container of their name.
+    """
+    if getattr(harness.charm.on, event, None) is None:
+        raise ValueError(f"Charm has no event '{event}'.")
+    if event.endswith("_pebble_ready"):
+        return {"kind": event, "workload": event[: -len("_pebble_ready")].replace("_", "-")}
+    if "_relation_" in event:
+        name = event.split("_relation_")[0].replace("_", "-")
+        for relation in relations:
+            if relation["name"] == name:
+                return {"kind": event, "relation_name": name, "relation_id": relation["id"]}
+        raise ValueError(f"Event '{event}' needs a relation - add it with --relation.")
+    return {"kind": event}
+
+
+def _load_charm(path: str, charm_dir: Optional[Path]) -> Type[CharmBase]:
+    """Imports a charm class given as 'module:Class', searching charm_dir/src first."""
+    if charm_dir is not None:
+        sys.path.insert(0, str(charm_dir / "src"))
+        sys.path.insert(0, str(charm_dir))
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError(f"Expected the charm as 'module:Class', got '{path}'.")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _read(charm_dir: Optional[Path], name: str) -> Optional[str]:
+    if charm_dir is None or not (charm_dir / name).exists():
+        return None
+    return (charm_dir / name).read_text()
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m functional_base_charm.graph_profiler",
+        description="Profile a charm's component graph under ops.testing.Harness.",
+    )
+    parser.add_argument("charm", help="the charm class, as 'module:Class'")
+    parser.add_argument(
+        "--charm-dir",
+        type=Path,
+        help="directory holding the charm's metadata.yaml, config.yaml and src",
+    )
+    parser.add_argument(
+        "--event",
+        dest="events",
+        action="append",
+        help="charm event to emit, in order.  May be repeated.  Defaults to config_changed.",
+    )
+    parser.add_argument("--non-leader", action="store_true", help="run as a non-leader unit")
+    parser.add_argument(
+        "--relation",
+        dest="relations",
+        action="append",
+        default=[],
+        help="relation to add, as 'name:remote-app'.  May be repeated.",
+    )
+    parser.add_argument("--kubernetes-latency", type=float, default=0.0, metavar="SECONDS")
+    parser.add_argument("--pebble-latency", type=float, default=0.0, metavar="SECONDS")
+    parser.add_argument(
+        "--reconciler-attribute",
+        default="charm_reconciler",
+        help="attribute of the charm holding its CharmReconciler",
+    )
+    parser.add_argument(
+        "--patch",
+        dest="patch_targets",
+        action="append",
+        help="dotted path of a lightkube Client class to fake.  Defaults to lightkube.Client.",
+    )
+    parser.add_argument("--cprofile", type=Path, help="write cProfile stats to this file")
+    parser.add_argument(
+        "--collapsed", type=Path, help="write flamegraph.pl collapsed stacks to this file"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the profiler from the command line."""
+    args = _parse_args(argv)
+    charm_type = _load_charm(args.charm, args.charm_dir)
+
+    def run() -> GraphProfile:
+        return profile_charm(
+            charm_type,
+            args.events or ["config_changed"],
+            meta=_read(args.charm_dir, "metadata.yaml"),
+            config=_read(args.charm_dir, "config.yaml"),
+            actions=_read(args.charm_dir, "actions.yaml"),
+            leader=not args.non_leader,
+            relations=args.relations,
+            kubernetes_latency=args.kubernetes_latency,
+            pebble_latency=args.pebble_latency,
+            get_reconciler=lambda charm: getattr(charm, args.reconciler_attribute),
+            patch_targets=args.patch_targets or ["lightkube.Client"],
+        )
+
+    if args.cprofile is not None:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(run)
+        profiler.dump_stats(args.cprofile)
+    else:
+        result = run()
+
+    print(result.report())
+    if args.collapsed is not None:
+        result.write_collapsed(args.collapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
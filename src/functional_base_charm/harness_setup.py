@@ -0,0 +1,129 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Set up a charm under ops.testing.Harness and emit its events, for offline tools.
+
+Shared by reconcile_recording, which replays recorded reconcile passes, and graph_profiler,
+which profiles a charm's component graph.
+"""
+
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional
+
+from ops import CharmBase, Handle
+
+if TYPE_CHECKING:
+    from ops.testing import Harness
+
+logger = logging.getLogger(__name__)
+
+# Container methods that call Pebble
+PEBBLE_METHODS = (
+    "add_layer",
+    "autostart",
+    "can_connect",
+    "exec",
+    "exists",
+    "get_check",
+    "get_checks",
+    "get_plan",
+    "get_service",
+    "get_services",
+    "isdir",
+    "list_files",
+    "make_dir",
+    "pull",
+    "push",
+    "remove_path",
+    "replan",
+    "restart",
+    "send_signal",
+    "start",
+    "stop",
+)
+
+
+def set_up_harness(
+    harness: "Harness",
+    leader: bool,
+    config: Mapping[str, Any],
+    relations: List[Dict[str, Any]],
+    can_connect: Optional[Mapping[str, bool]] = None,
+) -> Dict[int, int]:
+    """Sets up a Harness with a charm's inputs, returning the given to new relation ids.
+
+    Args:
+        harness: the Harness, before begin() is called
+        leader: whether the unit is the leader
+        config: the charm's config
+        relations: the relations to add, each as a dict of its "id", "name" and "remote_app",
+                   and optionally its "remote_app_data", "remote_units" (as {unit: data}),
+                   "local_unit_data" and "local_app_data".  Missing relation data is left empty.
+        can_connect: (optional) whether each named container can connect
+    """
+    harness.set_leader(leader)
+    harness.update_config(dict(config))
+    for name, connectable in (can_connect or {}).items():
+        harness.set_can_connect(name, connectable)
+
+    relation_ids = {}
+    for relation in relations:
+        relation_id = harness.add_relation(relation["name"], relation["remote_app"])
+        relation_ids[relation["id"]] = relation_id
+        harness.update_relation_data(
+            relation_id, relation["remote_app"], relation.get("remote_app_data", {})
+        )
+        for unit, data in relation.get("remote_units", {}).items():
+            harness.add_relation_unit(relation_id, unit)
+            harness.update_relation_data(relation_id, unit, data)
+        harness.update_relation_data(
+            relation_id, harness.model.unit.name, relation.get("local_unit_data", {})
+        )
+        if relation.get("local_app_data"):
+            harness.update_relation_data(
+                relation_id, harness.model.app.name, relation["local_app_data"]
+            )
+    return relation_ids
+
+
+class _ReplayedEvent:
+    """Stands in for an event that is not emitted by the charm itself."""
+
+    def __init__(self, kind: str):
+        self.handle = Handle(None, kind, None)
+
+    def defer(self):
+        logger.info(f"Replayed event '{self.handle.kind}' deferred - ignored.")
+
+
+def emit_event(
+    harness: "Harness",
+    event: Dict[str, Any],
+    relation_ids: Dict[int, int],
+    get_reconciler: Callable[[CharmBase], Any],
+):
+    """Emits an event on the charm, or runs a reconcile pass for events the charm does not have.
+
+    Args:
+        harness: the Harness, after begin() is called
+        event: the event, as recorded by a ReconcileRecorder: its "kind", and the
+               "relation_name", "relation_id" and "unit" of relation events or the "workload"
+               of workload events
+        relation_ids: the ids of the relations set up by set_up_harness, by their given id
+        get_reconciler: callable returning the CharmReconciler of a charm instance
+    """
+    kind = event["kind"]
+    bound_event = getattr(harness.charm.on, kind, None)
+    if bound_event is None:
+        # For example a RetryScheduler's reconcile_retry: run the pass for it directly
+        logger.info(f"Event '{kind}' is not a charm event - executing components directly.")
+        get_reconciler(harness.charm).execute_components(_ReplayedEvent(kind))
+    elif "relation_id" in event:
+        relation = harness.model.get_relation(
+            event["relation_name"], relation_ids[event["relation_id"]]
+        )
+        unit = harness.model.get_unit(event["unit"]) if event.get("unit") else None
+        bound_event.emit(relation, relation.app, unit)
+    elif "workload" in event:
+        bound_event.emit(harness.model.unit.get_container(event["workload"]))
+    else:
+        bound_event.emit()
@@ -2,6 +2,12 @@
 # See LICENSE file for licensing details.
 """A reusable Component for Kubernetes resources."""
 
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from typing import Callable, List, Optional
 
 import lightkube
@@ -13,10 +19,43 @@ from charmed_kubeflow_chisme.kubernetes._kubernetes_resource_handler import (
 )
 from charmed_kubeflow_chisme.types import LightkubeResourceTypesList
 from lightkube.core.exceptions import ApiError
+from lightkube.core.resource import NamespacedResource
+from lightkube.core.selector import build_selector
 from lightkube.generic_resource import load_in_cluster_generic_resources
 from ops import ActiveStatus, BlockedStatus, CharmBase, StatusBase
 
 from functional_base_charm.component import Component
+from functional_base_charm.kubernetes_readiness import (
+    ReadinessVerdict,
+    evaluate_readiness,
+)
+from functional_base_charm.kubernetes_session import KubernetesSession
+from functional_base_charm.reconcile_tracing import (
+    SPAN_KIND_CLIENT,
+    in_current_context,
+    span,
+)
+from functional_base_charm.template_renderer import TemplateRenderer
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for resources that are still being deleted
+FINALIZER_POLL_INTERVAL = 2.0
+
+
+class _RendererKubernetesResourceHandler(KubernetesResourceHandler):
+    """A KubernetesResourceHandler that renders its templates with a TemplateRenderer."""
+
+    def __init__(self, *args, template_renderer: TemplateRenderer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._template_renderer = template_renderer
+
+    def _render_manifest_parts(self):
+        """Returns the rendered templates, compiled and memoized by the TemplateRenderer."""
+        return [
+            self._template_renderer.render(template_file, self.context)
+            for template_file in self.template_files
+        ]
 
 
 class KubernetesComponent(Component):
@@ -29,31 +68,79 @@ class KubernetesComponent(Component):
         resource_templates: List[str],
         krh_child_resource_types: LightkubeResourceTypesList,
         krh_labels: dict,
-        lightkube_client: lightkube.Client,
+        lightkube_client: Optional[lightkube.Client] = None,
         context_callable: Optional[Callable] = None,
+        bulk_delete: bool = False,
+        wait_for_finalizers: bool = False,
+        finalizer_timeout: float = 60.0,
+        kubernetes_session: Optional[KubernetesSession] = None,
+        check_readiness: bool = False,
+        template_renderer: Optional[TemplateRenderer] = None,
     ):
+        """Instantiate a KubernetesComponent.
+
+        Args:
+            charm: the charm this Component belongs to
+            name: the name of this Component
+            resource_templates: paths of the Jinja templates of the resources to apply
+            krh_child_resource_types: the types of resource this Component deploys
+            krh_labels: the labels that identify the resources this Component deploys
+            lightkube_client: (optional) the client used to talk to Kubernetes.  Required unless
+                              kubernetes_session is given.
+            context_callable: (optional) callable returning the context to render templates with
+            bulk_delete: if True, remove() deletes each of krh_child_resource_types with one
+                         collection delete by krh_labels, concurrently across types, rather than
+                         deleting the rendered resources one at a time.  This also deletes stale
+                         resources that are no longer in the templates.
+            wait_for_finalizers: if True, a bulk_delete remove() waits until no resources with
+                                 krh_labels remain, for example because of finalizers
+            finalizer_timeout: seconds a bulk_delete remove() waits for finalizers
+            kubernetes_session: (optional) a KubernetesSession shared with other Components.  Its
+                                client is used if lightkube_client is None, discovery is done
+                                once per session, and lists of deployed resources are cached.
+            check_readiness: if True, status also requires the deployed resources to be ready,
+                             for example Deployments to be rolled out.  Readiness is evaluated
+                             from one list per resource type.
+            template_renderer: (optional) a TemplateRenderer shared with other Components, used
+                               to compile and render resource_templates.  If None, this
+                               Component uses its own.
+        """
         super().__init__(charm=charm, name=name)
         self._charm = charm
         self._resource_templates = resource_templates
         self._krh_child_resource_types = krh_child_resource_types
         self._krh_labels = krh_labels
+        if lightkube_client is None:
+            if kubernetes_session is None:
+                raise ValueError("One of lightkube_client or kubernetes_session is required")
+            lightkube_client = kubernetes_session.client
         self._lightkube_client = lightkube_client
+        self._kubernetes_session = kubernetes_session
+        self._check_readiness = check_readiness
+        self._template_renderer = template_renderer or TemplateRenderer()
         if context_callable is None:
             context_callable = lambda: {}  # noqa: E731
         self._context_callable = context_callable
+        self._bulk_delete = bulk_delete
+        self._wait_for_finalizers = wait_for_finalizers
+        self._finalizer_timeout = finalizer_timeout
 
     def _configure_app_leader(self, event):
         """Execute everything this Component should do at the Application level for leaders."""
         try:
             krh = self._get_kubernetes_resource_handler()
-            krh.apply()
+            with span("kubernetes.apply", {"component.name": self.name}, SPAN_KIND_CLIENT):
+                krh.apply()
         except ApiError as e:
             # TODO: Blocked?
             raise GenericCharmRuntimeError("Failed to create Kubernetes resources") from e
+        finally:
+            self._invalidate_session()
 
     def _get_kubernetes_resource_handler(self) -> KubernetesResourceHandler:
         """Returns a KubernetesResourceHandler for this class."""
-        k8s_resource_handler = KubernetesResourceHandler(
+        k8s_resource_handler = _RendererKubernetesResourceHandler(
+            template_renderer=self._template_renderer,
             # TODO: Make field_manager configurable?
             field_manager="lightkube",
             template_files=self._resource_templates,
@@ -62,18 +149,50 @@ class KubernetesComponent(Component):
             labels=self._krh_labels,
             resource_types=self._krh_child_resource_types,
         )
-        load_in_cluster_generic_resources(k8s_resource_handler.lightkube_client)
+        if self._kubernetes_session is not None:
+            self._kubernetes_session.load_generic_resources()
+        else:
+            with span("kubernetes.discovery", kind=SPAN_KIND_CLIENT):
+                load_in_cluster_generic_resources(k8s_resource_handler.lightkube_client)
         return k8s_resource_handler
 
-    def _get_missing_kubernetes_resources(self):
+    def _get_deployed_resources(self, krh: KubernetesResourceHandler) -> list:
+        """Returns the resources this Component has deployed, using the session's cache if any."""
+        if self._kubernetes_session is None:
+            with span("kubernetes.list", {"component.name": self.name}, SPAN_KIND_CLIENT):
+                return krh.get_deployed_resources()
+        resources = []
+        for resource_type in self._krh_child_resource_types:
+            resources.extend(
+                self._kubernetes_session.list_all_namespaces(resource_type, self._krh_labels)
+            )
+        return resources
+
+    def _invalidate_session(self):
+        """Drops the session's cached lists of the resource types this Component writes."""
+        if self._kubernetes_session is not None:
+            self._kubernetes_session.invalidate(self._krh_child_resource_types)
+
+    def _get_missing_kubernetes_resources(
+        self,
+        krh: Optional[KubernetesResourceHandler] = None,
+        existing_resources: Optional[list] = None,
+    ):
         """Returns the desired resources this Component wants in Kubernetes but are not.
 
+        Args:
+            krh: (optional) the KubernetesResourceHandler to render with.  If None, one is made.
+            existing_resources: (optional) the resources this Component has deployed, if they
+                                have already been listed
+
         TODO: Move this to the KRH class
         """
-        krh = self._get_kubernetes_resource_handler()
+        if krh is None:
+            krh = self._get_kubernetes_resource_handler()
 
         # TODO: Move this validation into KRH class
-        existing_resources = krh.get_deployed_resources()
+        if existing_resources is None:
+            existing_resources = self._get_deployed_resources(krh)
         desired_resources = krh.render_manifests()
 
         # Delete any resources that exist but are no longer in scope
@@ -82,10 +201,163 @@ class KubernetesComponent(Component):
         )
         return missing_resources
 
+    def fingerprint(self) -> Optional[str]:
+        """Returns a hash of the templates, context, labels and resource types this applies."""
+        fingerprint = hashlib.sha256()
+        for template in self._resource_templates:
+            fingerprint.update(Path(template).read_bytes())
+        fingerprint.update(
+            json.dumps(
+                [
+                    self._context_callable(),
+                    self._krh_labels,
+                    sorted(t.__name__ for t in self._krh_child_resource_types),
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        )
+        return fingerprint.hexdigest()
+
     def remove(self, event):
         """Removes all deployed resources."""
-        krh = self._get_kubernetes_resource_handler()
-        krh.delete()
+        try:
+            if self._bulk_delete:
+                self._delete_by_labels()
+                return
+            krh = self._get_kubernetes_resource_handler()
+            with span("kubernetes.delete", {"component.name": self.name}, SPAN_KIND_CLIENT):
+                krh.delete()
+        finally:
+            self._invalidate_session()
+
+    def _delete_by_labels(self):
+        """Deletes every resource of krh_child_resource_types that has krh_labels.
+
+        Each type costs one collection delete, plus one list for namespaced types to find the
+        namespaces to delete from, as Kubernetes has no collection delete across namespaces.
+        Types are deleted concurrently.
+        """
+        if not self._krh_labels or not self._krh_child_resource_types:
+            raise GenericCharmRuntimeError(
+                "Bulk delete requires krh_labels and krh_child_resource_types to be set"
+            )
+
+        with ThreadPoolExecutor(
+            max_workers=len(self._krh_child_resource_types), thread_name_prefix="bulk-delete"
+        ) as executor:
+            futures = {
+                executor.submit(
+                    in_current_context(self._delete_collection), resource_type
+                ): resource_type
+                for resource_type in self._krh_child_resource_types
+            }
+            errors = []
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except ApiError as e:
+                    logger.warning(f"Failed to delete {futures[future].__name__} resources: {e}")
+                    errors.append(e)
+        if errors:
+            raise GenericCharmRuntimeError("Failed to delete Kubernetes resources") from errors[0]
+
+        if self._wait_for_finalizers:
+            self._wait_for_deletion()
+
+    def _delete_collection(self, resource_type):
+        """Deletes all resources of one type that have krh_labels, ignoring unknown types."""
+        if issubclass(resource_type, NamespacedResource):
+            namespaces = {
+                resource.metadata.namespace
+                for resource in self._list_labelled(resource_type, namespace="*")
+            }
+        else:
+            namespaces = {None}
+
+        selector = build_selector(self._krh_labels)
+        for namespace in namespaces:
+            logger.info(
+                f"Deleting {resource_type.__name__} resources with labels {selector}"
+                + (f" in namespace {namespace}" if namespace else "")
+            )
+            try:
+                with span(
+                    "kubernetes.deletecollection",
+                    _resource_attributes(resource_type, namespace),
+                    SPAN_KIND_CLIENT,
+                ):
+                    self._request_delete_collection(resource_type, namespace, selector)
+            except ApiError as e:
+                if e.status.code != 404:
+                    raise
+
+    def _request_delete_collection(self, resource_type, namespace: Optional[str], selector: str):
+        """Deletes the resources of one type in a namespace that match a label selector.
+
+        lightkube.Client.deletecollection does not accept a label selector, so the request is
+        made through the generic client lightkube keeps under Client._client.  That is not public
+        API, so if a lightkube version lacks it the resources are listed and deleted one by one.
+        """
+        generic_client = getattr(self._lightkube_client, "_client", None)
+        if callable(getattr(generic_client, "request", None)):
+            generic_client.request(
+                "deletecollection",
+                res=resource_type,
+                namespace=namespace,
+                params={"labelSelector": selector},
+            )
+            return
+
+        logger.warning(
+            f"lightkube client has no generic client - deleting {resource_type.__name__} "
+            "resources one by one."
+        )
+        for resource in self._lightkube_client.list(
+            resource_type, namespace=namespace, labels=self._krh_labels
+        ):
+            self._lightkube_client.delete(
+                resource_type, resource.metadata.name, namespace=namespace
+            )
+
+    def _list_labelled(self, resource_type, namespace: Optional[str] = None) -> list:
+        """Returns the resources of a type that have krh_labels, or [] if the type is unknown."""
+        try:
+            with span(
+                "kubernetes.list", _resource_attributes(resource_type, namespace), SPAN_KIND_CLIENT
+            ):
+                return list(
+                    self._lightkube_client.list(
+                        resource_type, namespace=namespace, labels=self._krh_labels
+                    )
+                )
+        except ApiError as e:
+            if e.status.code == 404:
+                return []
+            raise
+
+    def _wait_for_deletion(self):
+        """Waits until no resources with krh_labels remain, or the finalizer_timeout passes."""
+        deadline = time.monotonic() + self._finalizer_timeout
+        remaining = list(self._krh_child_resource_types)
+        while True:
+            remaining = [
+                resource_type
+                for resource_type in remaining
+                if self._list_labelled(
+                    resource_type,
+                    namespace="*" if issubclass(resource_type, NamespacedResource) else None,
+                )
+            ]
+            if not remaining:
+                return
+            if time.monotonic() >= deadline:
+                raise GenericCharmRuntimeError(
+                    f"Timed out after {self._finalizer_timeout}s waiting for resources to be "
+                    f"deleted: {[t.__name__ for t in remaining]}"
+                )
+            logger.info(f"Waiting for finalizers of {[t.__name__ for t in remaining]}")
+            time.sleep(FINALIZER_POLL_INTERVAL)
 
     @property
     def status(self) -> StatusBase:
@@ -100,7 +372,9 @@ class KubernetesComponent(Component):
             return ActiveStatus()
 
         # TODO: Add better validation
-        missing_resources = self._get_missing_kubernetes_resources()
+        krh = self._get_kubernetes_resource_handler()
+        existing_resources = self._get_deployed_resources(krh)
+        missing_resources = self._get_missing_kubernetes_resources(krh, existing_resources)
 
         # TODO: This feels awkward.  This will happen both if we haven't deployed anything yet (a
         #  typical case of "just wait longer") and if a resource has been lost.  How to handle this
@@ -111,4 +385,33 @@ class KubernetesComponent(Component):
                 "to deploy them yet."
             )
 
+        if self._check_readiness:
+            return self.readiness(existing_resources).to_status()
+
         return ActiveStatus()
+
+    def readiness(self, deployed_resources: Optional[list] = None) -> ReadinessVerdict:
+        """Returns the readiness of the resources this Component has deployed.
+
+        With a KubernetesSession, this reuses the lists already fetched in this dispatch and the
+        verdict is cached until this Component writes its resources.  Without one, it is
+        evaluated from deployed_resources, or from one list per resource type if they are None.
+
+        Args:
+            deployed_resources: (optional) the resources this Component has deployed, if they
+                                have already been listed
+        """
+        if self._kubernetes_session is not None:
+            return self._kubernetes_session.readiness(
+                self._krh_child_resource_types, self._krh_labels
+            )
+        if deployed_resources is None:
+            deployed_resources = self._get_deployed_resources(
+                self._get_kubernetes_resource_handler()
+            )
+        return evaluate_readiness(deployed_resources)
+
+
+def _resource_attributes(resource_type, namespace: Optional[str]) -> dict:
+    """Returns the span attributes of a request for a resource type in a namespace."""
+    return {"k8s.resource.kind": resource_type.__name__, "k8s.namespace.name": namespace or ""}
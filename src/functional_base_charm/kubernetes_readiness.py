@@ -0,0 +1,179 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Local readiness evaluation of Kubernetes workloads and custom resources."""
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, Tuple
+
+from lightkube.core.resource import Resource
+from ops import ActiveStatus, StatusBase, WaitingStatus
+
+# How many not-ready resources are named in a verdict's status message
+MAX_REPORTED_RESOURCES = 3
+
+
+@dataclass(frozen=True)
+class ResourceReadiness:
+    """Whether one Kubernetes resource is ready, and why not if it isn't."""
+
+    kind: str
+    name: str
+    namespace: Optional[str]
+    ready: bool
+    reason: str = ""
+
+    def describe(self) -> str:
+        """Returns a short description of this resource and its readiness."""
+        path = "/".join(part for part in (self.kind, self.namespace, self.name) if part)
+        return f"{path} ({self.reason})" if self.reason else path
+
+
+@dataclass(frozen=True)
+class ReadinessVerdict:
+    """The readiness of all the resources of a Component."""
+
+    resources: Tuple[ResourceReadiness, ...] = ()
+
+    @property
+    def ready(self) -> bool:
+        """Returns True if every resource is ready."""
+        return all(resource.ready for resource in self.resources)
+
+    @property
+    def not_ready(self) -> Tuple[ResourceReadiness, ...]:
+        """Returns the resources that are not ready."""
+        return tuple(resource for resource in self.resources if not resource.ready)
+
+    def to_status(self) -> StatusBase:
+        """Returns ActiveStatus if every resource is ready, else a WaitingStatus naming them."""
+        not_ready = self.not_ready
+        if not not_ready:
+            return ActiveStatus()
+        described = ", ".join(r.describe() for r in not_ready[:MAX_REPORTED_RESOURCES])
+        if len(not_ready) > MAX_REPORTED_RESOURCES:
+            described += f" and {len(not_ready) - MAX_REPORTED_RESOURCES} more"
+        return WaitingStatus(f"Waiting for resources to be ready: {described}")
+
+
+def evaluate_readiness(resources: Iterable[Resource]) -> ReadinessVerdict:
+    """Returns the ReadinessVerdict for some resources, without making any requests."""
+    return ReadinessVerdict(tuple(evaluate_resource(resource) for resource in resources))
+
+
+def evaluate_resource(resource: Resource) -> ResourceReadiness:
+    """Returns whether a resource is ready, judged from the resource as it was listed.
+
+    Deployments and StatefulSets are ready once their latest generation is observed and fully
+    rolled out, and Jobs once they have completed.  Any other resource that reports
+    status.conditions is ready if its Ready (or, failing that, Available) condition is True.
+    Resources without a recognisable status are ready as soon as they exist.
+    """
+    kind = type(resource).__name__
+    metadata = _field(resource, "metadata")
+    name = _field(metadata, "name")
+    namespace = _field(metadata, "namespace")
+
+    if kind == "Deployment":
+        ready, reason = _deployment_readiness(resource)
+    elif kind == "StatefulSet":
+        ready, reason = _statefulset_readiness(resource)
+    elif kind == "Job":
+        ready, reason = _job_readiness(resource)
+    else:
+        ready, reason = _conditions_readiness(resource)
+    return ResourceReadiness(kind, name, namespace, ready, reason)
+
+
+def _deployment_readiness(resource: Resource) -> Tuple[bool, str]:
+    status = _field(resource, "status")
+    generation_reason = _generation_not_observed(resource)
+    if generation_reason:
+        return False, generation_reason
+    progressing = _condition(status, "Progressing")
+    if progressing is not None and _field(progressing, "reason") == "ProgressDeadlineExceeded":
+        return False, "progress deadline exceeded"
+
+    replicas = _replicas(resource)
+    updated = _field(status, "updatedReplicas") or 0
+    available = _field(status, "availableReplicas") or 0
+    if updated < replicas:
+        return False, f"{updated}/{replicas} replicas updated"
+    if available < replicas:
+        return False, f"{available}/{replicas} replicas available"
+    return True, ""
+
+
+def _statefulset_readiness(resource: Resource) -> Tuple[bool, str]:
+    status = _field(resource, "status")
+    generation_reason = _generation_not_observed(resource)
+    if generation_reason:
+        return False, generation_reason
+
+    replicas = _replicas(resource)
+    ready = _field(status, "readyReplicas") or 0
+    if ready < replicas:
+        return False, f"{ready}/{replicas} replicas ready"
+    update_revision = _field(status, "updateRevision")
+    if update_revision and _field(status, "currentRevision") != update_revision:
+        return False, "rolling update in progress"
+    return True, ""
+
+
+def _job_readiness(resource: Resource) -> Tuple[bool, str]:
+    status = _field(resource, "status")
+    if _condition_is_true(status, "Complete"):
+        return True, ""
+    if _condition_is_true(status, "Failed"):
+        return False, "failed"
+    return False, "not complete"
+
+
+def _conditions_readiness(resource: Resource) -> Tuple[bool, str]:
+    status = _field(resource, "status")
+    for condition_type in ("Ready", "Available"):
+        condition = _condition(status, condition_type)
+        if condition is not None:
+            if _field(condition, "status") == "True":
+                return True, ""
+            message = _field(condition, "message") or _field(condition, "reason") or ""
+            return False, f"{condition_type} is {_field(condition, 'status')}" + (
+                f": {message}" if message else ""
+            )
+    return True, ""
+
+
+def _generation_not_observed(resource: Resource) -> str:
+    """Returns a reason if the latest spec has not been observed by its controller, else ''."""
+    generation = _field(_field(resource, "metadata"), "generation")
+    observed = _field(_field(resource, "status"), "observedGeneration")
+    if generation is not None and (observed is None or observed < generation):
+        return "latest generation not yet observed"
+    return ""
+
+
+def _replicas(resource: Resource) -> int:
+    replicas = _field(_field(resource, "spec"), "replicas")
+    # Kubernetes defaults replicas to 1
+    return 1 if replicas is None else replicas
+
+
+def _condition(status: Any, condition_type: str) -> Any:
+    """Returns the condition of this type in status.conditions, or None."""
+    for condition in _field(status, "conditions") or []:
+        if _field(condition, "type") == condition_type:
+            return condition
+    return None
+
+
+def _condition_is_true(status: Any, condition_type: str) -> bool:
+    condition = _condition(status, condition_type)
+    return condition is not None and _field(condition, "status") == "True"
+
+
+def _field(obj: Any, name: str) -> Any:
+    """Returns a field of a lightkube model or, for generic resources, of a dict, or None."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
@@ -0,0 +1,138 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""A Kubernetes session that KubernetesComponents can share."""
+
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Type
+
+import lightkube
+from lightkube.core.resource import NamespacedResource, Resource
+from lightkube.generic_resource import load_in_cluster_generic_resources
+
+from .kubernetes_readiness import ReadinessVerdict, evaluate_readiness
+from .reconcile_tracing import SPAN_KIND_CLIENT, span
+
+logger = logging.getLogger(__name__)
+
+ListKey = Tuple[Type[Resource], Optional[str], FrozenSet[Tuple[str, str]]]
+VerdictKey = Tuple[Tuple[Type[Resource], ...], FrozenSet[Tuple[str, str]]]
+
+
+class KubernetesSession:
+    """A lightkube client, discovery cache and read cache shared by several KubernetesComponents.
+
+    The session holds one lightkube Client, so Components share its pooled HTTP connections.
+    Generic resources are discovered from the cluster at most once per session, and lists of
+    resources are cached by type, namespace and labels, so a status check in one Component reuses
+    lists that another has already fetched.
+
+    Create one session per dispatch, for example in the charm's __init__, so cached lists never
+    outlive the dispatch.  Writes made through the session's Components invalidate the lists of
+    the types they write, and clear() drops everything.
+    """
+
+    def __init__(self, lightkube_client: Optional[lightkube.Client] = None):
+        """Instantiate a KubernetesSession.
+
+        Args:
+            lightkube_client: (optional) the client to share.  If None, one is created on first
+                              use.
+        """
+        self._client = lightkube_client
+        self._generic_resources_loaded = False
+        self._lists: Dict[ListKey, List[Resource]] = {}
+        self._verdicts: Dict[VerdictKey, ReadinessVerdict] = {}
+        self._lock = threading.Lock()
+        self.list_requests = 0
+        self.list_cache_hits = 0
+
+    @property
+    def client(self) -> lightkube.Client:
+        """Returns the shared lightkube Client."""
+        if self._client is None:
+            self._client = lightkube.Client(field_manager="lightkube")
+        return self._client
+
+    def load_generic_resources(self):
+        """Registers the cluster's custom resource types with lightkube, once per session."""
+        if self._generic_resources_loaded:
+            return
+        with span("kubernetes.discovery", kind=SPAN_KIND_CLIENT):
+            load_in_cluster_generic_resources(self.client)
+        self._generic_resources_loaded = True
+
+    def list(
+        self,
+        resource_type: Type[Resource],
+        namespace: Optional[str] = None,
+        labels: Optional[dict] = None,
+    ) -> List[Resource]:
+        """Returns the resources of a type matching labels, using the cache if possible.
+
+        Args:
+            resource_type: the lightkube resource type to list
+            namespace: (optional) the namespace to list in, or "*" for all namespaces
+            labels: (optional) the labels the resources must have
+        """
+        key = (resource_type, namespace, frozenset((labels or {}).items()))
+        with self._lock:
+            if key in self._lists:
+                self.list_cache_hits += 1
+                return self._lists[key]
+        with span(
+            "kubernetes.list",
+            {"k8s.resource.kind": resource_type.__name__, "k8s.namespace.name": namespace or ""},
+            SPAN_KIND_CLIENT,
+        ) as list_span:
+            resources = list(self.client.list(resource_type, namespace=namespace, labels=labels))
+            list_span.set_attribute("k8s.resources", len(resources))
+        with self._lock:
+            self.list_requests += 1
+            self._lists[key] = resources
+        return resources
+
+    def list_all_namespaces(
+        self, resource_type: Type[Resource], labels: Optional[dict] = None
+    ) -> List[Resource]:
+        """Returns the resources of a type matching labels across all namespaces, if namespaced."""
+        namespace = "*" if issubclass(resource_type, NamespacedResource) else None
+        return self.list(resource_type, namespace=namespace, labels=labels)
+
+    def readiness(
+        self, resource_types: Iterable[Type[Resource]], labels: Optional[dict] = None
+    ) -> ReadinessVerdict:
+        """Returns the readiness of every resource of these types matching labels.
+
+        Each type costs at most one list across all namespaces, shared with list(), and the
+        resources are evaluated locally.  Verdicts are cached until their types are invalidated.
+        """
+        resource_types = tuple(resource_types)
+        key = (resource_types, frozenset((labels or {}).items()))
+        with self._lock:
+            if key in self._verdicts:
+                return self._verdicts[key]
+        resources = [
+            resource
+            for resource_type in resource_types
+            for resource in self.list_all_namespaces(resource_type, labels)
+        ]
+        verdict = evaluate_readiness(resources)
+        with self._lock:
+            self._verdicts[key] = verdict
+        return verdict
+
+    def invalidate(self, resource_types: Iterable[Type[Resource]]):
+        """Drops the cached lists of these resource types, for example after writing them."""
+        resource_types = set(resource_types)
+        with self._lock:
+            for key in [key for key in self._lists if key[0] in resource_types]:
+                del self._lists[key]
+            for key in [key for key in self._verdicts if resource_types.intersection(key[0])]:
+                del self._verdicts[key]
+
+    def clear(self):
+        """Drops every cached list and verdict."""
+        with self._lock:
+            self._lists.clear()
+            self._verdicts.clear()
@@ -5,18 +5,31 @@
 # https://github.com/benhoyt/test-charms/blob/statustest-stateless/statustest/src/multistatus.py
 """Status prioritiser."""
 
+import heapq
 import logging
+import queue
+import threading
+import time
 import typing
-from typing import List, Tuple
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set, Tuple
 
 import ops
-from ops import EventBase, Framework, Unit
+from ops import CommitEvent, Framework, Object, Unit
+
+from .reconcile_profile import run_in_daemon_thread
+from .reconcile_tracing import span
 
 logger = logging.getLogger(__name__)
 
 
 class Prioritiser:
-    """Status prioritiser: track the highest-priority status among several components."""
+    """Status prioritiser: track the highest-priority status among several components.
+
+    Components are either polled (their get_status is called whenever statuses are requested) or
+    push their status changes with push().  Pushed statuses are kept in an index bucketed by
+    priority, so finding the highest-priority pushed status does not call any get_status.
+    """
 
     _PRIORITIES = {
         "error": 0,
@@ -27,41 +40,124 @@ class Prioritiser:
         "unknown": 5,
     }
 
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None):
+        """Instantiate a Prioritiser.
+
+        Args:
+            max_workers: (optional) if set, statuses are collected concurrently on an executor
+                         with at most this many threads.  If None, statuses are collected
+                         sequentially.
+            timeout: (optional) seconds each component's get_status may run for when collecting
+                     concurrently.  A component that exceeds this is reported as WaitingStatus.
+        """
         self._components = {}
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        # Registration order of each component, used to break ties between equal priorities
+        self._order: Dict[str, int] = {}
+        # Components whose get_status is called by highest(), in registration order: those that
+        # are polled, and those that push but have not pushed yet
+        self._to_poll: Dict[str, None] = {}
+        # Index of pushed statuses: a heap of (order, component) per priority.  Entries are
+        # invalidated lazily, by checking them against self._pushed_priorities when popped, and
+        # a component has at most one entry per priority, in self._bucketed.
+        self._pushing: Set[str] = set()
+        self._pushed: Dict[str, ops.StatusBase] = {}
+        self._pushed_priorities: Dict[str, int] = {}
+        self._buckets: Dict[int, List[Tuple[int, str]]] = {
+            priority: [] for priority in sorted(set(self._PRIORITIES.values()))
+        }
+        self._bucketed: Set[Tuple[int, str]] = set()
+
+    def add(
+        self,
+        component: str,
+        get_status: Optional[typing.Callable[[], ops.StatusBase]] = None,
+        pushes: bool = False,
+    ):
+        """Add a named status component.
 
-    def add(self, component: str, get_status: typing.Callable[[], ops.StatusBase]):
-        """Add a named status component."""
+        Args:
+            component: the name of the component
+            get_status: (optional) callable returning the current status of the component.  For
+                        a component that pushes its status, this is only used to get its initial
+                        status if it has not pushed one yet.
+            pushes: if True, this component reports status changes with push() rather than being
+                    polled.
+        """
         if component in self._components:
             raise ValueError(f"duplicate component {component!r}")
+        if get_status is None and not pushes:
+            raise ValueError(f"component {component!r} must have get_status or push its status")
         self._components[component] = get_status
+        self._order[component] = len(self._order)
+        if pushes:
+            self._pushing.add(component)
+        if get_status is not None:
+            self._to_poll[component] = None
+
+    def push(self, component: str, status: ops.StatusBase):
+        """Record a new status for a component that was added with pushes=True."""
+        if component not in self._pushing:
+            raise ValueError(f"component {component!r} was not added with pushes=True")
+        self._pushed[component] = status
+        self._to_poll.pop(component, None)
+        priority = self._PRIORITIES[status.name]
+        if self._pushed_priorities.get(component) != priority:
+            self._pushed_priorities[component] = priority
+            # An entry left from an earlier time at this priority is valid again
+            if (priority, component) not in self._bucketed:
+                self._bucketed.add((priority, component))
+                heapq.heappush(self._buckets[priority], (self._order[component], component))
 
     def highest(self) -> ops.StatusBase:
-        """Return highest-priority status with message prefixed with component name."""
-        statuses = self.all()
+        """Return highest-priority status with message prefixed with component name.
+
+        If every component pushes its status, this does not call any get_status.
+        """
+        with span("prioritiser.highest") as highest_span:
+            candidates = [
+                (self._PRIORITIES[status.name], self._order[component], component, status)
+                for component, status in self._poll().items()
+            ]
+            highest_pushed = self._highest_pushed()
+            if highest_pushed is not None:
+                candidates.append(highest_pushed)
+            if not candidates:
+                return ops.UnknownStatus()
+            _, _, component, status = min(candidates, key=lambda candidate: candidate[:2])
+            highest_span.set_attribute("status.name", status.name)
+            return self._prefix_status(component, status)
+
+    def highest_of(self, statuses: List[Tuple[str, ops.StatusBase]]) -> ops.StatusBase:
+        """Return the highest-priority of the given (component_name, status) tuples.
+
+        This uses the same priorities and message format as highest(), but for statuses that
+        were collected elsewhere.  Ties are broken by the order of the given list.
+        """
         if not statuses:
             return ops.UnknownStatus()
-        component, status = statuses[0]
+        component, status = min(statuses, key=lambda s: self._PRIORITIES[s[1].name])
+        return self._prefix_status(component, status)
+
+    @staticmethod
+    def _prefix_status(component: str, status: ops.StatusBase) -> ops.StatusBase:
+        """Return a copy of status with its message prefixed with the component name."""
         if isinstance(status, ops.ActiveStatus) and not status.message:
             return ops.ActiveStatus()
         return ops.StatusBase.from_name(status.name, f"[{component}] {status.message}")
 
-    def install(self, framework: Framework, unit: Unit):
+    def install(self, framework: Framework, unit: Unit) -> "CommitStatusSetter":
         """Installs this instance onto the framework events required.
 
-        TODO: This doesn't work because framework.observe's observer parameter (the last one)
-         only accepts methods, not functions?  For now, use the hack of implementing this
-         directly in the charm main.
+        The unit status is set to self.highest() once, when the framework commits at the end of
+        the dispatch.
         """
-
-        def update_unit_status(event: EventBase):
-            logger.info("Executing Prioritizer.update_unit_status")
-            unit.status = self.highest()
-
-        framework.observe(framework.on.commit, update_unit_status)
-
-    def _on_commit(self, event):
-        self.unit.status = self.prioritiser.highest()
+        # Keep a reference, as the framework only holds weak references to observers
+        self._status_setter = CommitStatusSetter(framework, unit, self.highest, key="prioritiser")
+        self._status_setter.request_update()
+        return self._status_setter
 
     def all(self) -> List[Tuple[str, ops.StatusBase]]:
         """Return list of (component_name, status) tuples for all components.
@@ -70,8 +166,218 @@ class Prioritiser:
         with the same level, components added first come first.
         """
         # TODO: exception handling (log full details and yield ErrorStatus?)
+        polled = self._poll()
         statuses = [
-            (component, get_status()) for component, get_status in self._components.items()
+            (component, polled[component] if component in polled else self._pushed[component])
+            for component in self._components
+            if component in polled or component in self._pushed
         ]
         statuses.sort(key=lambda s: self._PRIORITIES[s[1].name])
         return statuses
+
+    def _poll(self) -> Dict[str, ops.StatusBase]:
+        """Return the statuses of the components that are polled rather than pushed.
+
+        Components that push their status but have not yet pushed one are polled once here too,
+        with the result recorded as their pushed status.
+        """
+        if not self._to_poll:
+            return {}
+        to_poll = {component: self._components[component] for component in self._to_poll}
+        polled = self.collect(to_poll)
+        for component in self._pushing.intersection(polled):
+            self.push(component, polled.pop(component))
+        return polled
+
+    def _highest_pushed(self) -> Optional[Tuple[int, int, str, ops.StatusBase]]:
+        """Return (priority, order, component, status) of the highest-priority pushed status."""
+        for priority, bucket in self._buckets.items():
+            while bucket and self._pushed_priorities[bucket[0][1]] != priority:
+                _, component = heapq.heappop(bucket)
+                self._bucketed.discard((priority, component))
+            if bucket:
+                order, component = bucket[0]
+                return priority, order, component, self._pushed[component]
+        return None
+
+    def collect(
+        self, getters: Dict[str, typing.Callable[[], ops.StatusBase]]
+    ) -> Dict[str, ops.StatusBase]:
+        """Return a dict of component_name: status, calling each getter once.
+
+        If this Prioritiser has max_workers set, getters are called concurrently.
+        """
+        with span(
+            "prioritiser.collect",
+            {
+                "prioritiser.components": len(getters),
+                "prioritiser.concurrent": bool(self.max_workers),
+            },
+        ):
+            if not self.max_workers:
+                return {component: get_status() for component, get_status in getters.items()}
+            return self._collect_concurrently(getters)
+
+    def _collect_concurrently(
+        self, getters: Dict[str, typing.Callable[[], ops.StatusBase]]
+    ) -> Dict[str, ops.StatusBase]:
+        """Calls getters on at most self.max_workers threads, giving each self.timeout to run.
+
+        The timeout for a component starts when its getter starts running, not when it is
+        queued.  A getter that times out is left running on its daemon thread (see
+        run_in_daemon_thread), and its component is reported as WaitingStatus.
+        """
+        futures: Dict[str, Future] = {component: Future() for component in getters}
+        started_at: Dict[str, float] = {}
+        queued: "queue.SimpleQueue[str]" = queue.SimpleQueue()
+        for component in getters:
+            queued.put(component)
+        # Notified whenever a getter starts or finishes
+        changed = threading.Condition()
+
+        for _ in range(min(self.max_workers, len(getters))):
+            run_in_daemon_thread(
+                self._run_queued, queued, getters, futures, started_at, changed, name="prioritiser"
+            )
+
+        statuses: Dict[str, ops.StatusBase] = {}
+        pending = list(getters)
+        try:
+            with changed:
+                while pending:
+                    now = time.monotonic()
+                    pending = self._settle(pending, futures, started_at, statuses, now)
+                    if pending:
+                        changed.wait(self._next_deadline(pending, started_at, now))
+        finally:
+            for future in futures.values():
+                future.cancel()
+        return {component: statuses[component] for component in getters}
+
+    @staticmethod
+    def _run_queued(
+        queued: "queue.SimpleQueue[str]",
+        getters: Dict[str, typing.Callable[[], ops.StatusBase]],
+        futures: Dict[str, Future],
+        started_at: Dict[str, float],
+        changed: threading.Condition,
+    ):
+        """Runs queued getters until none are left, notifying changed as each starts and ends."""
+        while True:
+            try:
+                component = queued.get_nowait()
+            except queue.Empty:
+                return
+            future = futures[component]
+            if not future.set_running_or_notify_cancel():
+                continue
+            with changed:
+                started_at[component] = time.monotonic()
+                changed.notify()
+            try:
+                future.set_result(getters[component]())
+            except BaseException as e:
+                future.set_exception(e)
+            with changed:
+                changed.notify()
+
+    def _settle(
+        self,
+        pending: List[str],
+        futures: Dict[str, Future],
+        started_at: Dict[str, float],
+        statuses: Dict[str, ops.StatusBase],
+        now: float,
+    ) -> List[str]:
+        """Adds the statuses of finished and timed out getters, returning those still pending."""
+        still_pending = []
+        for component in pending:
+            future = futures[component]
+            if future.done():
+                statuses[component] = future.result()
+            elif self._has_timed_out(started_at.get(component), now):
+                logger.warning(
+                    f"Timed out after {self.timeout}s collecting status for '{component}'"
+                )
+                statuses[component] = ops.WaitingStatus(
+                    f"Timed out after {self.timeout}s checking status."
+                )
+            else:
+                still_pending.append(component)
+        return still_pending
+
+    def _has_timed_out(self, started_at: Optional[float], now: float) -> bool:
+        """Returns True if a getter that started at started_at has run out of time."""
+        return (
+            self.timeout is not None
+            and started_at is not None
+            and now - started_at >= self.timeout
+        )
+
+    def _next_deadline(
+        self, pending: List[str], started_at: Dict[str, float], now: float
+    ) -> Optional[float]:
+        """Returns seconds until the earliest running pending getter times out, if any.
+
+        Returns None if no pending getter has started, as their clocks start when they do and
+        the wait is woken then.
+        """
+        if self.timeout is None:
+            return None
+        remaining = [
+            started_at[component] + self.timeout - now
+            for component in pending
+            if component in started_at
+        ]
+        if not remaining:
+            return None
+        return max(min(remaining), 0.0)
+
+
+class CommitStatusSetter(Object):
+    """Sets a unit status at most once per dispatch, when the framework commits.
+
+    Handlers call request_update() to say the status may have changed.  The status is then
+    computed once, after every handler in the dispatch has run, and only set if it differs from
+    the current unit status.
+    """
+
+    def __init__(
+        self,
+        parent: typing.Union[Framework, Object],
+        unit: Unit,
+        get_status: typing.Callable[[], ops.StatusBase],
+        key: str = "commit-status-setter",
+    ):
+        """Instantiate a CommitStatusSetter.
+
+        Args:
+            parent: the Framework or ops.Object this belongs to
+            unit: the Unit to set the status of
+            get_status: callable returning the status to set.  Only called on commit, and only if
+                        an update has been requested.
+            key: the ops.Object key of this instance
+        """
+        super().__init__(parent, key)
+        self._unit = unit
+        self._get_status = get_status
+        self._update_requested = False
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+    def request_update(self):
+        """Request that the unit status be recomputed when the framework commits."""
+        self._update_requested = True
+
+    def set_if_changed(self, status: ops.StatusBase):
+        """Set the unit status, skipping the status-set call if it would not change anything."""
+        if self._unit.status == status:
+            logger.info(f"Unit status {status} unchanged")
+            return
+        logger.info(f"Updating unit status to {status}")
+        self._unit.status = status
+
+    def _on_commit(self, _: CommitEvent):
+        if not self._update_requested:
+            return
+        self._update_requested = False
+        self.set_if_changed(self._get_status())
@@ -1,20 +1,38 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 """Reusable Components for Pebble containers."""
+
 import logging
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, List, Optional, Union
-
-import jinja2
-from ops import ActiveStatus, CharmBase, StatusBase, WaitingStatus
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, TypeVar, Union
+
+from ops import (
+    ActiveStatus,
+    BoundEvent,
+    CharmBase,
+    Container,
+    StatusBase,
+    WaitingStatus,
+)
 from ops.pebble import Layer, ServiceInfo
 
 from functional_base_charm.component import Component
+from functional_base_charm.multistatus import Prioritiser
+from functional_base_charm.reconcile_tracing import (
+    SPAN_KIND_CLIENT,
+    in_current_context,
+    span,
+)
+from functional_base_charm.template_renderer import TemplateRenderer
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 @dataclass
 class ContainerFileTemplate:
@@ -35,7 +53,8 @@ class ContainerFileTemplate:
             if value is None:
                 value = lambda: {}  # noqa: E731
             elif not callable(value):
-                value = lambda: value  # noqa: E731
+                context = value
+                value = lambda: context  # noqa: E731
 
         super().__setattr__(name, value)
 
@@ -48,6 +67,7 @@ class PebbleComponent(Component):
         charm: CharmBase,
         container_name: str,
         files_to_push: Optional[List[ContainerFileTemplate]] = None,
+        template_renderer: Optional[TemplateRenderer] = None,
     ):
         """Instantiate the PebbleComponent.
 
@@ -57,6 +77,8 @@ class PebbleComponent(Component):
                             parent object's Component.name parameter.
             files_to_push: Optional List of ContainerFile objects that define templates to be
                            rendered and pushed into the container as files
+            template_renderer: Optional TemplateRenderer shared with other Components, used to
+                               render files_to_push.  If None, this Component uses its own.
         """
         super().__init__(charm=charm, name=container_name)
         self.container_name = self.name
@@ -66,16 +88,49 @@ class PebbleComponent(Component):
             get_pebble_ready_event_from_charm(self._charm, self.container_name)
         ]
         self._files_to_push = files_to_push or []
+        self._template_renderer = template_renderer or TemplateRenderer()
+        # Set by known_connectivity, in place of asking Pebble
+        self._known_can_connect: Optional[bool] = None
+
+    @property
+    def template_renderer(self) -> TemplateRenderer:
+        """Returns the TemplateRenderer used to render files_to_push."""
+        return self._template_renderer
+
+    @template_renderer.setter
+    def template_renderer(self, template_renderer: TemplateRenderer):
+        """Sets the TemplateRenderer used to render files_to_push, for sharing with others."""
+        self._template_renderer = template_renderer
 
     @property
     def ready_for_execution(self) -> bool:
         """Returns True if Pebble is ready."""
         return self.pebble_ready
 
+    @contextmanager
+    def known_connectivity(self, can_connect: bool) -> Iterator[None]:
+        """Uses can_connect as whether Pebble is ready, rather than asking Pebble, within."""
+        self._known_can_connect = can_connect
+        try:
+            yield
+        finally:
+            self._known_can_connect = None
+
     @property
     def pebble_ready(self) -> bool:
         """Returns True if Pebble is ready."""
-        return self._charm.unit.get_container(self.container_name).can_connect()
+        if self._known_can_connect is not None:
+            return self._known_can_connect
+        with span(
+            "pebble.can_connect", {"container.name": self.container_name}, SPAN_KIND_CLIENT
+        ) as pebble_span:
+            can_connect = self._charm.unit.get_container(self.container_name).can_connect()
+            pebble_span.set_attribute("pebble.can_connect", can_connect)
+        return can_connect
+
+    def verify_status(self, cached_status: StatusBase) -> bool:
+        """Returns True if the cached status matches whether Pebble can currently be reached."""
+        return isinstance(cached_status, ActiveStatus) == self.pebble_ready
 
     def execute(self):
         """Execute the given command in the container managed by this Component."""
@@ -85,16 +140,26 @@ class PebbleComponent(Component):
         """Renders and pushes the files defined in self._files_to_push into the container."""
         container = self._charm.unit.get_container(self.container_name)
         for container_file_template in self._files_to_push:
-            template = jinja2.Template(container_file_template.source_template_path.read_text())
-            rendered = template.render(**container_file_template.context_function())
-            container.push(
-                path=container_file_template.destination_path,
-                source=rendered,
-                user=container_file_template.user,
-                group=container_file_template.group,
-                permissions=container_file_template.permissions,
-                make_dirs=True,
+            rendered = self._template_renderer.render(
+                container_file_template.source_template_path,
+                container_file_template.context_function(),
             )
+            with span(
+                "pebble.push",
+                {
+                    "container.name": self.container_name,
+                    "file.path": str(container_file_template.destination_path),
+                },
+                SPAN_KIND_CLIENT,
+            ):
+                container.push(
+                    path=container_file_template.destination_path,
+                    source=rendered,
+                    user=container_file_template.user,
+                    group=container_file_template.group,
+                    permissions=container_file_template.permissions,
+                    make_dirs=True,
+                )
 
     @property
     def status(self) -> StatusBase:
@@ -132,11 +197,15 @@ class PebbleServiceComponent(PebbleComponent):
         container = self._charm.unit.get_container(self.container_name)
         new_layer = self.get_layer()
 
-        current_layer = container.get_plan()
+        attributes = {"container.name": self.container_name}
+        with span("pebble.get_plan", attributes, SPAN_KIND_CLIENT):
+            current_layer = container.get_plan()
         if current_layer.services != new_layer.services:
-            container.add_layer(self.container_name, new_layer, combine=True)
+            with span("pebble.add_layer", attributes, SPAN_KIND_CLIENT):
+                container.add_layer(self.container_name, new_layer, combine=True)
             # TODO: Add error handling here?  Not sure what will catch them yet so left out for now
-            container.replan()
+            with span("pebble.replan", attributes, SPAN_KIND_CLIENT):
+                container.replan()
 
     @abstractmethod
     def get_layer(self) -> Layer:
@@ -163,7 +232,7 @@ class PebbleServiceComponent(PebbleComponent):
             return services_expected
 
         container = self._charm.unit.get_container(self.container_name)
-        services = container.get_services()
+        services = self._get_services(container)
 
         # Get any services that should be active, but are not in the container at all
         services_not_found = [
@@ -177,6 +246,24 @@ class PebbleServiceComponent(PebbleComponent):
 
         return services_not_ready
 
+    def verify_status(self, cached_status: StatusBase) -> bool:
+        """Returns True if a cached ActiveStatus still holds because every service is running.
+
+        This skips rendering the layer, which self.status needs to find services that are not yet
+        defined in the container.
+        """
+        if not isinstance(cached_status, ActiveStatus) or not self.pebble_ready:
+            return False
+        services = self._get_services(self._charm.unit.get_container(self.container_name))
+        return len(services) > 0 and all(service.is_running() for service in services.values())
+
+    def _get_services(self, container: Container) -> Mapping[str, ServiceInfo]:
+        """Returns the services defined in the container."""
+        with span(
+            "pebble.get_services", {"container.name": self.container_name}, SPAN_KIND_CLIENT
+        ):
+            return container.get_services()
+
     @property
     def status(self) -> StatusBase:
         """Returns the status of this Pebble service container.
@@ -196,6 +283,132 @@ class PebbleServiceComponent(PebbleComponent):
         return ActiveStatus()
 
 
+class MultiContainerPebbleComponent(Component):
+    """Wraps several Pebble containers that are configured and reported on as one Component.
+
+    Each container is described by a PebbleComponent (or PebbleServiceComponent) that is given to
+    this Component rather than added to the graph, and is configured by its own configure_charm:
+    a PebbleServiceComponent pushes its files and updates its layer, while a plain
+    PebbleComponent only does what its own _configure_unit does.  The containers are configured
+    and their statuses evaluated concurrently, one thread per container, and their statuses are
+    combined into one.
+
+    Each of configure_charm, status and verify_status checks the connectivity of every container
+    once, concurrently, and the containers use that result throughout the call rather than each
+    checking it again.
+    """
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        name: str,
+        containers: List[PebbleComponent],
+        template_renderer: Optional[TemplateRenderer] = None,
+    ):
+        """Instantiate the MultiContainerPebbleComponent.
+
+        Args:
+            charm: the charm using this MultiContainerPebbleComponent
+            name: Unique name of this Component
+            containers: a PebbleComponent for each container managed by this Component
+            template_renderer: Optional TemplateRenderer used to render the files_to_push of
+                               every container, so templates they share are rendered once.  If
+                               None, each container uses its own.
+        """
+        super().__init__(charm=charm, name=name)
+        if not containers:
+            raise ValueError(f"{name} must manage at least one container")
+        self.containers = list(containers)
+        if template_renderer is not None:
+            for container in self.containers:
+                container.template_renderer = template_renderer
+        self._prioritiser = Prioritiser()
+
+    @property
+    def events_to_observe(self) -> List[BoundEvent]:
+        """Returns the events observed by any of the containers."""
+        events: Dict[str, BoundEvent] = {}
+        for container in self.containers:
+            for event in container.events_to_observe:
+                events.setdefault(event.event_kind, event)
+        return list(events.values())
+
+    @property
+    def ready_for_execution(self) -> bool:
+        """Returns True if Pebble is ready in every container."""
+        connectivity = self._check_connectivity()
+        return all(self._map_containers(lambda c: c.ready_for_execution, connectivity).values())
+
+    @property
+    def pebble_ready(self) -> bool:
+        """Returns True if Pebble is ready in every container."""
+        return all(self._check_connectivity().values())
+
+    def verify_status(self, cached_status: StatusBase) -> bool:
+        """Returns True if every container confirms a cached ActiveStatus still holds."""
+        if not isinstance(cached_status, ActiveStatus):
+            return False
+        connectivity = self._check_connectivity()
+        return all(
+            self._map_containers(lambda c: c.verify_status(cached_status), connectivity).values()
+        )
+
+    def _configure_unit(self, event):
+        """Configures every container concurrently.
+
+        Containers whose Pebble is not ready are skipped by their own PebbleComponent, as when
+        they are used alone.
+        """
+        super()._configure_unit(event)
+        self._map_containers(lambda c: c.configure_charm(event), self._check_connectivity())
+
+    @property
+    def status(self) -> StatusBase:
+        """Returns the highest priority status of the containers, prefixed with its container.
+
+        The status of each container is evaluated concurrently.
+        """
+        statuses = self._map_containers(lambda c: c.status, self._check_connectivity())
+        return self._prioritiser.highest_of(list(statuses.items()))
+
+    def _check_connectivity(self) -> Dict[str, bool]:
+        """Returns whether Pebble is ready in each container, checked concurrently."""
+        return self._map_containers(lambda c: c.pebble_ready)
+
+    def _map_containers(
+        self,
+        func: Callable[[PebbleComponent], T],
+        connectivity: Optional[Dict[str, bool]] = None,
+    ) -> Dict[str, T]:
+        """Returns func called on each container concurrently, by container name.
+
+        If func raises for any container, the first such exception is raised once all have
+        finished.
+
+        Args:
+            func: the function to call on each container
+            connectivity: (optional) whether Pebble is ready in each container, by container
+                          name, used by the containers in place of asking Pebble while in func
+        """
+
+        def call(container: PebbleComponent) -> T:
+            if connectivity is None:
+                return func(container)
+            with container.known_connectivity(connectivity[container.container_name]):
+                return func(container)
+
+        if len(self.containers) == 1:
+            return {self.containers[0].container_name: call(self.containers[0])}
+        with ThreadPoolExecutor(
+            max_workers=len(self.containers), thread_name_prefix=f"pebble-{self.name}"
+        ) as executor:
+            futures = {
+                container.container_name: executor.submit(in_current_context(call), container)
+                for container in self.containers
+            }
+        return {name: future.result() for name, future in futures.items()}
+
+
 def get_pebble_ready_event_from_charm(charm: CharmBase, container_name: str) -> str:
     """Returns the pebble-ready event for a given container_name."""
     prefix = container_name.replace("-", "_")
@@ -0,0 +1,329 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Reconcile metrics, written in the Prometheus text format for node-exporter's textfile collector.
+
+A ReconcileMetrics is updated from the trace of each dispatch (see reconcile_tracing), so the
+code it measures is only instrumented once.  Each dispatch is a new process, so counters and
+histograms are accumulated across dispatches by adding this dispatch's observations to the
+samples already in the file, which is then replaced atomically.
+"""
+
+import logging
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .reconcile_tracing import Span
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+SampleKey = Tuple[str, Labels]
+
+_SAMPLE_PATTERN = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+@dataclass(frozen=True)
+class MetricFamily:
+    """The name, type and help text of a metric."""
+
+    name: str
+    type: str
+    help: str
+
+
+DISPATCH_DURATION = MetricFamily(
+    "charm_dispatch_duration_seconds", "histogram", "Time spent handling a Juju hook dispatch."
+)
+CONFIGURE_DURATION = MetricFamily(
+    "charm_component_configure_duration_seconds",
+    "histogram",
+    "Time a Component spent configuring.",
+)
+STATUS_DURATION = MetricFamily(
+    "charm_component_status_duration_seconds",
+    "histogram",
+    "Time a Component spent evaluating its status.",
+)
+CONFIGURE_TIMEOUTS = MetricFamily(
+    "charm_component_configure_timeouts_total",
+    "counter",
+    "Component configures abandoned for exceeding their budget.",
+)
+KUBERNETES_REQUESTS = MetricFamily(
+    "charm_kubernetes_requests_total", "counter", "Kubernetes API requests made, by operation."
+)
+PEBBLE_REQUESTS = MetricFamily(
+    "charm_pebble_requests_total", "counter", "Pebble requests made, by operation."
+)
+SKIPPED = MetricFamily(
+    "charm_skipped_work_total",
+    "counter",
+    "Work not done: up to date Components, Components left for a later pass by the pass budget"
+    " and events merged into a queued pass.",
+)
+STATUS_TRANSITIONS = MetricFamily(
+    "charm_component_status_transitions_total",
+    "counter",
+    "Changes of a Component's status between dispatches.",
+)
+COMPONENT_STATUS = MetricFamily(
+    "charm_component_status", "gauge", "The last status seen for each Component."
+)
+
+FAMILIES = (
+    DISPATCH_DURATION,
+    CONFIGURE_DURATION,
+    STATUS_DURATION,
+    CONFIGURE_TIMEOUTS,
+    KUBERNETES_REQUESTS,
+    PEBBLE_REQUESTS,
+    SKIPPED,
+    STATUS_TRANSITIONS,
+    COMPONENT_STATUS,
+)
+
+
+class ReconcileMetrics:
+    """Accumulates reconcile metrics from each dispatch's trace into a Prometheus textfile.
+
+    Pass it to a CharmReconciler as metrics.  Every sample is labelled with the charm and unit
+    of the dispatch.
+    """
+
+    def __init__(self, path: Union[str, Path], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Instantiate a ReconcileMetrics.
+
+        Args:
+            path: the file metrics are written to.  For the textfile collector, this must be in
+                  its directory and end in .prom.
+            buckets: upper bounds, in seconds, of the histogram buckets
+        """
+        self.path = Path(path)
+        self.buckets = tuple(sorted(buckets))
+        self._families = {family.name: family for family in FAMILIES}
+
+    def observe_trace(self, spans: List[Span]):
+        """Adds the observations in the spans of one dispatch to the file."""
+        samples = self.load()
+        self.observe(samples, spans)
+        self.write(samples)
+
+    def observe(self, samples: Dict[SampleKey, float], spans: Iterable[Span]):
+        """Adds the observations in the spans of one dispatch to samples."""
+        spans = list(spans)
+        root = next((s for s in spans if s.parent_span_id is None), None)
+        unit = str(root.attributes.get("juju.unit", "")) if root is not None else ""
+        common = (("charm", unit.split("/")[0]), ("unit", unit))
+
+        statuses: Dict[str, str] = {}
+        for span in spans:
+            labels = dict(common)
+            if span is root:
+                labels["event"] = str(span.attributes.get("juju.event", ""))
+                self._observe_histogram(samples, DISPATCH_DURATION, labels, _duration(span))
+                coalesced = span.attributes.get("dispatch.events_coalesced", 0)
+                self._increment(
+                    samples, SKIPPED.name, {**labels, "reason": "coalesced"}, coalesced
+                )
+            else:
+                self._observe_span(samples, span, labels, statuses)
+
+        self._record_statuses(samples, dict(common), statuses)
+
+    def _observe_span(
+        self,
+        samples: Dict[SampleKey, float],
+        span: Span,
+        labels: Dict[str, str],
+        statuses: Dict[str, str],
+    ):
+        """Adds the observations in one span below the dispatch span to samples."""
+        attributes = span.attributes
+        if span.name == "reconcile":
+            for reason, attribute in (
+                ("up_to_date", "reconcile.up_to_date"),
+                ("pass_budget", "reconcile.skipped"),
+            ):
+                amount = attributes.get(attribute, 0)
+                self._increment(samples, SKIPPED.name, {**labels, "reason": reason}, amount)
+        elif span.name == "component.configure":
+            labels["component"] = str(attributes.get("component.name", ""))
+            self._observe_histogram(samples, CONFIGURE_DURATION, labels, _duration(span))
+            if attributes.get("component.timed_out"):
+                self._increment(samples, CONFIGURE_TIMEOUTS.name, labels)
+        elif span.name == "component.status":
+            labels["component"] = str(attributes.get("component.name", ""))
+            self._observe_histogram(samples, STATUS_DURATION, labels, _duration(span))
+            if "status.name" in attributes:
+                statuses[labels["component"]] = str(attributes["status.name"])
+        else:
+            service, _, operation = span.name.partition(".")
+            if service in _REQUEST_FAMILIES:
+                labels["operation"] = operation
+                self._increment(samples, _REQUEST_FAMILIES[service].name, labels)
+
+    def _record_statuses(
+        self, samples: Dict[SampleKey, float], common: Dict[str, str], statuses: Dict[str, str]
+    ):
+        """Counts status transitions since the last dispatch, and records the latest statuses."""
+        for component, status in statuses.items():
+            labels = {**common, "component": component}
+            previous = [
+                key
+                for key in samples
+                if key[0] == COMPONENT_STATUS.name and _contains(key[1], labels)
+            ]
+            for key in previous:
+                previous_status = dict(key[1]).get("status")
+                if previous_status != status:
+                    transition = {**labels, "from": previous_status, "to": status}
+                    self._increment(samples, STATUS_TRANSITIONS.name, transition)
+                del samples[key]
+            samples[(COMPONENT_STATUS.name, _labels({**labels, "status": status}))] = 1
+
+    @staticmethod
+    def _increment(
+        samples: Dict[SampleKey, float], name: str, labels: Dict[str, str], amount: float = 1
+    ):
+        if not amount:
+            return
+        key = (name, _labels(labels))
+        samples[key] = samples.get(key, 0) + amount
+
+    def _observe_histogram(
+        self,
+        samples: Dict[SampleKey, float],
+        family: MetricFamily,
+        labels: Dict[str, str],
+        value: float,
+    ):
+        # Buckets are cumulative, so +Inf is the count, and empty buckets are written as 0
+        bucket = f"{family.name}_bucket"
+        for bound in self.buckets:
+            key = (bucket, _labels({**labels, "le": _format(bound)}))
+            samples[key] = samples.get(key, 0) + (1 if value <= bound else 0)
+        self._increment(samples, bucket, {**labels, "le": "+Inf"})
+        self._increment(samples, f"{family.name}_count", labels)
+        self._increment(samples, f"{family.name}_sum", labels, value)
+
+    def load(self) -> Dict[SampleKey, float]:
+        """Returns the samples in the file, or none if it does not exist or cannot be parsed."""
+        try:
+            text = self.path.read_text()
+        except FileNotFoundError:
+            return {}
+        samples = {}
+        for line in text.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            match = _SAMPLE_PATTERN.match(line)
+            if match is None:
+                logger.warning(f"Discarding metrics in {self.path}: cannot parse '{line}'")
+                return {}
+            name, labels, value = match.groups()
+            if self._family_of(name) is None:
+                continue
+            parsed = tuple(
+                (key, _unescape(value)) for key, value in _LABEL_PATTERN.findall(labels or "")
+            )
+            samples[(name, parsed)] = float(value)
+        return samples
+
+    def render(self, samples: Dict[SampleKey, float]) -> str:
+        """Returns samples in the Prometheus text format, grouped by metric family."""
+        by_family: Dict[str, List[Tuple[SampleKey, float]]] = {}
+        for key, value in samples.items():
+            family = self._family_of(key[0])
+            if family is not None:
+                by_family.setdefault(family.name, []).append((key, value))
+
+        lines = []
+        for family in FAMILIES:
+            if family.name not in by_family:
+                continue
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for (name, labels), value in sorted(by_family[family.name], key=_sort_key):
+                lines.append(f"{name}{_format_labels(labels)} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, samples: Dict[SampleKey, float]):
+        """Replaces the file with samples atomically, so a collector never reads a partial file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render(samples))
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def _family_of(self, sample_name: str) -> Optional[MetricFamily]:
+        """Returns the family of a sample, including the _bucket, _sum and _count of histograms."""
+        if sample_name in self._families:
+            return self._families[sample_name]
+        base, _, suffix = sample_name.rpartition("_")
+        family = self._families.get(base)
+        if family is not None and family.type == "histogram" and suffix in _HISTOGRAM_SUFFIXES:
+            return family
+        return None
+
+
+_HISTOGRAM_SUFFIXES = ("bucket", "sum", "count")
+
+# Request counters by the prefix of the spans they count
+_REQUEST_FAMILIES = {"kubernetes": KUBERNETES_REQUESTS, "pebble": PEBBLE_REQUESTS}
+
+
+def _duration(span: Span) -> float:
+    return (span.end_time - span.start_time) / 1e9
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(labels.items())
+
+
+def _contains(labels: Labels, subset: Dict[str, str]) -> bool:
+    labels = dict(labels)
+    return all(labels.get(key) == value for key, value in subset.items())
+
+
+def _sort_key(sample: Tuple[SampleKey, float]):
+    (name, labels), _ = sample
+    # Sort buckets numerically, rather than as strings
+    ordered = tuple(
+        (key, (float(value), "") if key == "le" else (0.0, value)) for key, value in labels
+    )
+    return name, ordered
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
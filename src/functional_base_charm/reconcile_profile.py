@@ -0,0 +1,137 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Time budgets and timings for a reconcile pass."""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from .reconcile_tracing import in_current_context
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ComponentTiming:
+    """How long a Component took to configure in a reconcile pass, and the budget it had."""
+
+    name: str
+    duration: float
+    budget: Optional[float] = None
+    timed_out: bool = False
+
+
+class ReconcileProfile:
+    """Tracks the time budget of a reconcile pass, and records how long each Component took.
+
+    The pass budget is shared by every Component executed in the pass: each Component is given
+    the smaller of its own budget and what remains of the pass budget, and no Component is
+    started once the pass budget is spent.
+    """
+
+    def __init__(
+        self,
+        pass_budget: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Instantiate a ReconcileProfile, starting the pass clock.
+
+        Args:
+            pass_budget: (optional) seconds the whole pass may spend executing Components.  If
+                         None, the pass is unbounded.
+            clock: callable returning a monotonic time in seconds
+        """
+        self.pass_budget = pass_budget
+        self._clock = clock
+        self.started_at = clock()
+        self.finished_at: Optional[float] = None
+        self.components: List[ComponentTiming] = []
+        self.skipped: List[str] = []
+
+    def now(self) -> float:
+        """Returns the current time of this profile's clock."""
+        return self._clock()
+
+    def remaining(self) -> Optional[float]:
+        """Returns the seconds left in the pass budget, or None if the pass is unbounded."""
+        if self.pass_budget is None:
+            return None
+        return max(self.pass_budget - (self._clock() - self.started_at), 0.0)
+
+    def expired(self) -> bool:
+        """Returns True if the pass budget has been spent."""
+        return self.remaining() == 0.0
+
+    def budget_for(self, component_budget: Optional[float]) -> Optional[float]:
+        """Returns the seconds a Component may run for now, or None if it is unbounded."""
+        budgets = [b for b in (component_budget, self.remaining()) if b is not None]
+        return min(budgets, default=None)
+
+    def record(self, name: str, started_at: float, budget: Optional[float], timed_out: bool):
+        """Records a Component that finished, or was abandoned, in this pass."""
+        timing = ComponentTiming(name, self._clock() - started_at, budget, timed_out)
+        self.components.append(timing)
+        if timed_out:
+            logger.warning(f"Component '{name}' exceeded its budget of {budget:.3g}s - abandoned.")
+
+    def skip(self, names: List[str]):
+        """Records Components that were ready but not started because the pass budget ran out."""
+        self.skipped.extend(names)
+        logger.warning(f"Pass budget of {self.pass_budget:g}s spent - not starting {names}.")
+
+    def finish(self):
+        """Stops the pass clock."""
+        self.finished_at = self._clock()
+
+    @property
+    def duration(self) -> float:
+        """Returns the seconds the pass took, or has taken so far."""
+        end = self.finished_at if self.finished_at is not None else self._clock()
+        return end - self.started_at
+
+    @property
+    def overruns(self) -> List[ComponentTiming]:
+        """Returns the timings of Components that were abandoned for exceeding their budget."""
+        return [timing for timing in self.components if timing.timed_out]
+
+    def summary(self) -> str:
+        """Returns a one-line, human readable summary of this profile."""
+        budget = "unbounded" if self.pass_budget is None else f"budget {self.pass_budget:g}s"
+        timings = ", ".join(
+            f"{t.name}={t.duration:.3f}s" + (" (timed out)" if t.timed_out else "")
+            for t in self.components
+        )
+        summary = f"Reconcile pass took {self.duration:.3f}s ({budget}): [{timings}]"
+        if self.skipped:
+            summary += f", skipped {self.skipped}"
+        return summary
+
+
+def run_in_daemon_thread(func: Callable[..., Any], *args, name: str = "budgeted") -> Future:
+    """Starts func(*args) on a new daemon thread, returning a Future of its result.
+
+    Use this for work that may be given up on after a timeout.  Python threads cannot be
+    interrupted, so work that overruns keeps running: it is only stopped when the dispatch's
+    process exits.  Unlike the workers of a ThreadPoolExecutor, which the interpreter joins on
+    exit (as does asyncio.run for its default executor), a daemon thread is never joined, so
+    overrunning work does not hold the hook open.  Until the process exits, that work may still
+    use the ops model concurrently with the rest of the dispatch, so anything it could affect
+    should treat it as not yet done.
+    """
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=in_current_context(run), name=name, daemon=True).start()
+    return future
@@ -0,0 +1,693 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Record a reconcile pass, and replay it offline under ops.testing.Harness.
+
+A ReconcileRecorder captures the inputs of one reconcile pass (its event, the charm's config,
+leadership, relation data and the reconciler's stored state), every Kubernetes API call made
+through a client it wraps, with the responses of list calls, and every Pebble call made through
+the charm's containers during the pass, with the responses of reads such as get_plan,
+get_services and pull.  replay() then runs the same pass in a Harness, serving the recorded
+responses in place of the cluster and Pebble, so real hooks can be replayed in CI to catch
+latency and call-count regressions without a cluster.
+
+Pebble calls that change a container, and reads whose responses are not recorded (exec,
+list_files, and any read made during replay that was not made while recording), are made
+against the Harness' fake Pebble on replay.  Recordings of format version 1 and 2 hold a
+snapshot of each container instead, which seeds the fake Pebble.
+"""
+
+import base64
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+from lightkube.core.resource import Resource
+from ops import (
+    CharmBase,
+    CheckInfoMapping,
+    Container,
+    EventBase,
+    RelationEvent,
+    ServiceInfoMapping,
+    WorkloadEvent,
+    pebble,
+)
+
+from .harness_setup import PEBBLE_METHODS, emit_event, set_up_harness
+from .reconcile_profile import ReconcileProfile
+
+if TYPE_CHECKING:
+    from ops.testing import Harness
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 3
+# Version 1 recordings lack stored_state and running services, which replay without them, and
+# versions 1 and 2 hold a snapshot of each container rather than its Pebble calls
+SUPPORTED_FORMAT_VERSIONS = (1, 2, FORMAT_VERSION)
+
+# Pebble reads whose responses are recorded, and served by replay instead of the fake Pebble
+PEBBLE_RESPONSE_METHODS = (
+    "can_connect",
+    "exists",
+    "get_check",
+    "get_checks",
+    "get_plan",
+    "get_service",
+    "get_services",
+    "isdir",
+    "pull",
+)
+
+
+@dataclass
+class ReconcileRecording:
+    """The inputs, external calls and timings of one recorded reconcile pass."""
+
+    event: Dict[str, Any]
+    config: Dict[str, Any] = field(default_factory=dict)
+    leader: bool = False
+    relations: List[Dict[str, Any]] = field(default_factory=list)
+    containers: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    stored_state: Dict[str, Any] = field(default_factory=dict)
+    kubernetes_calls: List[Dict[str, Any]] = field(default_factory=list)
+    pebble_calls: List[Dict[str, Any]] = field(default_factory=list)
+    duration: float = 0.0
+    components: List[Dict[str, Any]] = field(default_factory=list)
+
+    def kubernetes_call_counts(self) -> Dict[str, int]:
+        """Returns the number of Kubernetes calls made in the pass, by method."""
+        return dict(Counter(call["method"] for call in self.kubernetes_calls))
+
+    def pebble_call_counts(self) -> Dict[str, int]:
+        """Returns the number of Pebble calls made in the pass, by method."""
+        return dict(Counter(call["method"] for call in self.pebble_calls))
+
+    def save(self, path: Union[str, Path]):
+        """Writes this recording to a gzipped JSON file."""
+        document = {"version": FORMAT_VERSION, **asdict(self)}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(document, f, separators=(",", ":"), default=str)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ReconcileRecording":
+        """Reads a recording written by save()."""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            document = json.load(f)
+        version = document.pop("version", None)
+        if version not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported recording format version {version} in {path}")
+        return cls(**document)
+
+
+class RecordingClient:
+    """A proxy for a lightkube Client that records every call made through it.
+
+    List calls are recorded with their responses, so they can be served by a ReplayClient.
+    Other calls are recorded with their timing only, including requests made through the
+    client's generic client under _client, such as collection deletes.  Other private attributes
+    of the client are not recorded and cannot be used through this proxy.
+    """
+
+    def __init__(self, client, calls: List[Dict[str, Any]]):
+        self._recorded_client = client
+        self._calls = calls
+
+    def list(self, res: Type[Resource], *, namespace=None, labels=None, **kwargs) -> list:
+        """Lists resources through the wrapped client, recording the response."""
+        started_at = time.perf_counter()
+        resources = list(
+            self._recorded_client.list(res, namespace=namespace, labels=labels, **kwargs)
+        )
+        self._calls.append(
+            {
+                "method": "list",
+                "resource": _resource_key(res),
+                "namespace": namespace,
+                "labels": labels,
+                "response": [resource.to_dict() for resource in resources],
+                "duration": time.perf_counter() - started_at,
+            }
+        )
+        return resources
+
+    @property
+    def _client(self) -> "_RecordingGenericClient":
+        """Returns a proxy for the wrapped client's generic client, recording its requests."""
+        return _RecordingGenericClient(self._recorded_client._client, self._calls)
+
+    def __getattr__(self, name: str):
+        """Returns the wrapped client's attribute, recording calls if it is a method."""
+        if name.startswith("_"):
+            raise AttributeError(f"'{name}' of a recorded lightkube Client is not recorded")
+        attribute = getattr(self._recorded_client, name)
+        if not callable(attribute):
+            return attribute
+
+        def record(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self._calls.append(
+                    {
+                        "method": name,
+                        "resource": _resource_key(args[0]) if args else None,
+                        "duration": time.perf_counter() - started_at,
+                    }
+                )
+
+        return record
+
+
+class _RecordingGenericClient:
+    """A proxy for a lightkube Client's generic client that records the requests made with it."""
+
+    def __init__(self, generic_client, calls: List[Dict[str, Any]]):
+        self._generic_client = generic_client
+        self._calls = calls
+
+    def request(self, method: str, res=None, **kwargs):
+        """Makes a request through the generic client, recording it as a call of method."""
+        started_at = time.perf_counter()
+        try:
+            return self._generic_client.request(method, res=res, **kwargs)
+        finally:
+            self._calls.append(
+                {
+                    "method": method,
+                    "resource": _resource_key(res) if res is not None else None,
+                    "duration": time.perf_counter() - started_at,
+                }
+            )
+
+    def __getattr__(self, name: str):
+        raise AttributeError(f"'{name}' of a recorded lightkube generic client is not recorded")
+
+
+class ReconcileRecorder:
+    """Records the first reconcile pass of a dispatch to a file.
+
+    Pass it as a CharmReconciler's recorder, and wrap the lightkube client the charm's
+    Components use with wrap_client(), for example:
+
+        recorder = ReconcileRecorder("/tmp/reconcile.rec.gz")
+        session = KubernetesSession(recorder.wrap_client(lightkube.Client()))
+        reconciler = CharmReconciler(charm, recorder=recorder)
+
+    The Pebble methods of the charm's containers are wrapped when the pass starts, and record
+    the calls made during the pass.  A Pebble method called by another, such as get_services by
+    get_service, is recorded as the outer call only.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Instantiate a ReconcileRecorder.
+
+        Args:
+            path: the file the recording is written to at the end of the pass
+        """
+        self.path = Path(path)
+        self.last_recording: Optional[ReconcileRecording] = None
+        self._kubernetes_calls: List[Dict[str, Any]] = []
+        self._pebble_calls: List[Dict[str, Any]] = []
+        self._recording: Optional[ReconcileRecording] = None
+        self._wrapped_containers: List[Container] = []
+        # Whether this thread is already in a recorded Pebble call
+        self._in_pebble_call = threading.local()
+
+    def wrap_client(self, client) -> RecordingClient:
+        """Returns a proxy for a lightkube Client that records the calls made through it."""
+        return RecordingClient(client, self._kubernetes_calls)
+
+    def start(
+        self,
+        charm: CharmBase,
+        event: EventBase,
+        stored_state: Optional[Dict[str, Any]] = None,
+    ):
+        """Captures the inputs of a reconcile pass that is about to run.
+
+        Args:
+            charm: the charm running the pass
+            event: the event the pass is for
+            stored_state: (optional) the reconciler's state from earlier dispatches, from
+                          CharmReconciler.export_stored_state, so a warm pass replays warm
+        """
+        if self.last_recording is not None or self._recording is not None:
+            return
+        self._kubernetes_calls.clear()
+        self._pebble_calls.clear()
+        for container in charm.unit.containers.values():
+            if not any(container is wrapped for wrapped in self._wrapped_containers):
+                self._wrap_container(container)
+        self._recording = ReconcileRecording(
+            event=_record_event(event),
+            config=dict(charm.config),
+            leader=charm.unit.is_leader(),
+            relations=_record_relations(charm),
+            stored_state=dict(stored_state or {}),
+        )
+
+    def _wrap_container(self, container: Container):
+        """Replaces the container's Pebble methods with ones recording calls made in a pass."""
+        for name in PEBBLE_METHODS:
+            method = getattr(container, name, None)
+            if method is not None:
+                setattr(container, name, self._recording_pebble_method(container, name, method))
+        self._wrapped_containers.append(container)
+
+    def _recording_pebble_method(self, container: Container, name: str, method: Callable):
+        recorder = self
+
+        def record(*args, **kwargs):
+            if recorder._recording is None or getattr(recorder._in_pebble_call, "active", False):
+                return method(*args, **kwargs)
+            recorder._in_pebble_call.active = True
+            call: Dict[str, Any] = {
+                "container": container.name,
+                "method": name,
+                "arguments": _arguments_key(args, kwargs),
+            }
+            started_at = time.perf_counter()
+            try:
+                response = method(*args, **kwargs)
+                if name in PEBBLE_RESPONSE_METHODS:
+                    response, call["response"] = _encode_pebble_response(name, response)
+                return response
+            except pebble.Error as e:
+                call["error"] = _encode_pebble_error(e)
+                raise
+            finally:
+                recorder._in_pebble_call.active = False
+                call["duration"] = time.perf_counter() - started_at
+                recorder._pebble_calls.append(call)
+
+        return record
+
+    def finish(self, profile: ReconcileProfile):
+        """Completes the recording of the pass that was started, and writes it to self.path."""
+        recording, self._recording = self._recording, None
+        if recording is None:
+            return
+        recording.kubernetes_calls = list(self._kubernetes_calls)
+        recording.pebble_calls = list(self._pebble_calls)
+        recording.duration = profile.duration
+        recording.components = [asdict(timing) for timing in profile.components]
+        recording.save(self.path)
+        self.last_recording = recording
+        logger.info(
+            f"Recorded reconcile pass for '{recording.event['kind']}' to {self.path} "
+            f"({len(recording.kubernetes_calls)} Kubernetes calls, "
+            f"{len(recording.pebble_calls)} Pebble calls)"
+        )
+
+
+class ReplayClient:
+    """A stub lightkube Client that serves the responses of a recording.
+
+    Repeated list calls are served the recorded responses in order, reusing the last once they
+    run out.  Lists that were not recorded return no resources and are counted in unrecorded.
+    Requests made through the generic client under _client replay their recorded timing too.
+    """
+
+    def __init__(self, calls: Iterable[Dict[str, Any]], simulate_latency: bool = False):
+        """Instantiate a ReplayClient.
+
+        Args:
+            calls: the kubernetes_calls of a ReconcileRecording
+            simulate_latency: if True, each call sleeps for as long as it took when recorded
+        """
+        self.simulate_latency = simulate_latency
+        self.calls: Counter = Counter()
+        self.unrecorded: List[str] = []
+        self._lists: Dict[Tuple, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._durations: Dict[Tuple[str, Optional[str]], Deque[float]] = defaultdict(deque)
+        for call in calls:
+            if call["method"] == "list":
+                key = (call["resource"], call["namespace"], _labels_key(call["labels"]))
+                self._lists[key].append(call)
+            else:
+                self._durations[(call["method"], call["resource"])].append(call["duration"])
+
+    def list(self, res: Type[Resource], *, namespace=None, labels=None, **kwargs) -> list:
+        """Returns the recorded response of this list call."""
+        self.calls["list"] += 1
+        key = (_resource_key(res), namespace, _labels_key(labels))
+        recorded = self._lists.get(key)
+        if not recorded:
+            self.unrecorded.append(f"list {key[0]} namespace={namespace} labels={labels}")
+            return []
+        call = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        self._sleep(call["duration"])
+        return [res.from_dict(resource) for resource in call["response"]]
+
+    @property
+    def _client(self) -> "_ReplayGenericClient":
+        """Returns a stub generic client, replaying the timing of its recorded requests."""
+        return _ReplayGenericClient(self)
+
+    def __getattr__(self, name: str):
+        """Returns a stub for any other client method, replaying its recorded timing."""
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def replay(*args, **kwargs):
+            self._replay_call(name, args[0] if args else None)
+
+        return replay
+
+    def _replay_call(self, method: str, res):
+        """Counts a call that is not a list, sleeping for as long as it took when recorded."""
+        self.calls[method] += 1
+        durations = self._durations.get((method, _resource_key(res) if res is not None else None))
+        if not durations:
+            self.unrecorded.append(method)
+            return
+        self._sleep(durations.popleft() if len(durations) > 1 else durations[0])
+
+    def _sleep(self, duration: float):
+        if self.simulate_latency:
+            time.sleep(duration)
+
+
+class _ReplayGenericClient:
+    """Stands in for the generic client of a ReplayClient."""
+
+    def __init__(self, client: ReplayClient):
+        self._replay_client = client
+
+    def request(self, method: str, res=None, **kwargs):
+        """Replays the recorded timing of a request."""
+        self._replay_client._replay_call(method, res)
+
+
+class ReplayPebble:
+    """Serves the recorded Pebble calls of a recording to the containers of a Harness.
+
+    Reads whose responses were recorded are served them, in order and reusing the last once they
+    run out, as are the errors recorded calls raised.  Other calls are made against the Harness'
+    fake Pebble.  Reads that were not recorded are counted in unrecorded.
+    """
+
+    def __init__(self, calls: Iterable[Dict[str, Any]], simulate_latency: bool = False):
+        """Instantiate a ReplayPebble.
+
+        Args:
+            calls: the pebble_calls of a ReconcileRecording
+            simulate_latency: if True, each call sleeps for as long as it took when recorded
+        """
+        self.simulate_latency = simulate_latency
+        self.calls: Counter = Counter()
+        self.unrecorded: List[str] = []
+        self._recorded: Dict[Tuple[str, str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        for call in calls:
+            self._recorded[(call["container"], call["method"], call["arguments"])].append(call)
+
+    def install(self, container: Container):
+        """Replaces the container's Pebble methods with ones replaying the recorded calls."""
+        for name in PEBBLE_METHODS:
+            method = getattr(container, name, None)
+            if method is not None:
+                setattr(container, name, self._replaying_pebble_method(container, name, method))
+
+    def _replaying_pebble_method(self, container: Container, name: str, method: Callable):
+        def replay(*args, **kwargs):
+            self.calls[name] += 1
+            arguments = _arguments_key(args, kwargs)
+            recorded = self._recorded.get((container.name, name, arguments))
+            if not recorded:
+                if name in PEBBLE_RESPONSE_METHODS:
+                    self.unrecorded.append(f"pebble {container.name} {name} {arguments}")
+                return method(*args, **kwargs)
+            call = recorded.popleft() if len(recorded) > 1 else recorded[0]
+            if self.simulate_latency:
+                time.sleep(call["duration"])
+            if "error" in call:
+                raise _decode_pebble_error(call["error"])
+            if "response" in call:
+                return _decode_pebble_response(name, call["response"])
+            return method(*args, **kwargs)
+
+        return replay
+
+
+@dataclass
+class ReplayResult:
+    """The outcome of replaying a ReconcileRecording."""
+
+    duration: float
+    profile: Optional[ReconcileProfile]
+    kubernetes_calls: Dict[str, int]
+    unrecorded_calls: List[str]
+    pebble_calls: Dict[str, int] = field(default_factory=dict)
+
+
+def replay(
+    recording: ReconcileRecording,
+    charm_type: Type[CharmBase],
+    meta: Optional[str] = None,
+    config: Optional[str] = None,
+    get_reconciler: Callable[[CharmBase], Any] = lambda charm: charm.charm_reconciler,
+    simulate_latency: bool = False,
+    patch_targets: Iterable[str] = ("lightkube.Client",),
+) -> ReplayResult:
+    """Replays a recorded reconcile pass offline, under ops.testing.Harness.
+
+    The Harness is set up with the recording's config, leadership and relations, the
+    reconciler is given the recorded stored state, every patch_target is replaced by a factory
+    returning a ReplayClient, the charm's containers serve the recorded Pebble calls through a
+    ReplayPebble, and the recorded event is emitted and the framework committed.  Containers of
+    recordings that hold a snapshot of them instead are seeded from it.
+
+    Args:
+        recording: the recording to replay
+        charm_type: the charm class that was recorded
+        meta: (optional) the charm's metadata.yaml, if Harness cannot find it
+        config: (optional) the charm's config.yaml, if Harness cannot find it
+        get_reconciler: callable returning the CharmReconciler of a charm instance
+        simulate_latency: if True, Kubernetes and Pebble calls sleep for as long as they took
+                          when recorded
+        patch_targets: dotted paths of the lightkube Client classes the charm instantiates
+    """
+    # Imported here so charms importing the reconciler do not import the testing modules
+    from unittest.mock import patch
+
+    from ops.testing import Harness
+
+    client = ReplayClient(recording.kubernetes_calls, simulate_latency=simulate_latency)
+    replay_pebble = ReplayPebble(recording.pebble_calls, simulate_latency=simulate_latency)
+    patchers = [patch(target, lambda *args, **kwargs: client) for target in patch_targets]
+    harness = Harness(charm_type, meta=meta, config=config)
+    for patcher in patchers:
+        patcher.start()
+    try:
+        relation_ids = set_up_harness(
+            harness,
+            recording.leader,
+            recording.config,
+            recording.relations,
+            {name: container["can_connect"] for name, container in recording.containers.items()},
+        )
+        if not recording.containers:
+            # Recorded Pebble calls were made against reachable containers, and calls that
+            # are not served from the recording are made against the fake Pebble
+            for name in harness.model.unit.containers:
+                harness.set_can_connect(name, True)
+        harness.begin()
+        if recording.containers:
+            _seed_containers(harness, recording)
+        else:
+            for container in harness.charm.unit.containers.values():
+                replay_pebble.install(container)
+        if recording.stored_state:
+            get_reconciler(harness.charm).restore_stored_state(recording.stored_state)
+
+        started_at = time.perf_counter()
+        emit_event(harness, recording.event, relation_ids, get_reconciler)
+        harness.framework.commit()
+        duration = time.perf_counter() - started_at
+
+        reconciler = get_reconciler(harness.charm)
+        return ReplayResult(
+            duration=duration,
+            profile=getattr(reconciler, "last_profile", None),
+            kubernetes_calls=dict(client.calls),
+            unrecorded_calls=client.unrecorded + replay_pebble.unrecorded,
+            pebble_calls=dict(replay_pebble.calls),
+        )
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+        harness.cleanup()
+
+
+def _resource_key(res) -> Optional[str]:
+    """Returns a string identifying a lightkube resource type, or the type of a resource."""
+    resource_type = res if isinstance(res, type) else type(res)
+    api_info = getattr(resource_type, "_api_info", None)
+    if api_info is None:
+        return None
+    resource = api_info.resource
+    return f"{resource.group}/{resource.version}/{resource.kind}"
+
+
+def _labels_key(labels: Optional[dict]) -> Tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _record_event(event: EventBase) -> Dict[str, Any]:
+    recorded: Dict[str, Any] = {"kind": event.handle.kind}
+    if isinstance(event, RelationEvent):
+        recorded["relation_name"] = event.relation.name
+        recorded["relation_id"] = event.relation.id
+        recorded["unit"] = event.unit.name if event.unit else None
+    elif isinstance(event, WorkloadEvent):
+        recorded["workload"] = event.workload.name
+    return recorded
+
+
+def _record_relations(charm: CharmBase) -> List[Dict[str, Any]]:
+    relations = []
+    for name, relations_of_name in charm.model.relations.items():
+        for relation in relations_of_name:
+            relations.append(
+                {
+                    "name": name,
+                    "id": relation.id,
+                    "remote_app": relation.app.name if relation.app else None,
+                    "remote_app_data": (dict(relation.data[relation.app]) if relation.app else {}),
+                    "remote_units": {
+                        unit.name: dict(relation.data[unit]) for unit in relation.units
+                    },
+                    "local_unit_data": dict(relation.data[charm.unit]),
+                    "local_app_data": (
+                        dict(relation.data[charm.app]) if charm.unit.is_leader() else {}
+                    ),
+                }
+            )
+    return relations
+
+
+def _arguments_key(args: tuple, kwargs: dict) -> str:
+    """Returns a string identifying the arguments of a Pebble call."""
+    return json.dumps([list(args), kwargs], sort_keys=True, default=str)
+
+
+def _enum_value(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def _service_dict(service: pebble.ServiceInfo) -> Dict[str, Any]:
+    return {
+        "name": service.name,
+        "startup": _enum_value(service.startup),
+        "current": _enum_value(service.current),
+    }
+
+
+def _check_dict(check: pebble.CheckInfo) -> Dict[str, Any]:
+    return {
+        "name": check.name,
+        "level": _enum_value(check.level),
+        "status": _enum_value(check.status),
+        "successes": check.successes,
+        "failures": check.failures,
+        "threshold": check.threshold,
+    }
+
+
+def _encode_pebble_response(method: str, response: Any) -> Tuple[Any, Any]:
+    """Returns the response to return to the caller, and the response to record.
+
+    A pulled file is read to be recorded, so the caller is given a new file with its content.
+    """
+    if method == "get_plan":
+        return response, response.to_yaml()
+    if method == "get_service":
+        return response, _service_dict(response)
+    if method == "get_services":
+        return response, [_service_dict(service) for service in response.values()]
+    if method == "get_check":
+        return response, _check_dict(response)
+    if method == "get_checks":
+        return response, [_check_dict(check) for check in response.values()]
+    if method == "pull":
+        content = response.read()
+        if isinstance(content, bytes):
+            return io.BytesIO(content), {"base64": base64.b64encode(content).decode()}
+        return io.StringIO(content), {"text": content}
+    return response, response
+
+
+def _decode_pebble_response(method: str, recorded: Any) -> Any:
+    """Returns the response of a Pebble call from its recorded form."""
+    if method == "get_plan":
+        return pebble.Plan(recorded)
+    if method == "get_service":
+        return pebble.ServiceInfo.from_dict(recorded)
+    if method == "get_services":
+        return ServiceInfoMapping(pebble.ServiceInfo.from_dict(s) for s in recorded)
+    if method == "get_check":
+        return pebble.CheckInfo.from_dict(recorded)
+    if method == "get_checks":
+        return CheckInfoMapping(pebble.CheckInfo.from_dict(c) for c in recorded)
+    if method == "pull":
+        if "base64" in recorded:
+            return io.BytesIO(base64.b64decode(recorded["base64"]))
+        return io.StringIO(recorded["text"])
+    return recorded
+
+
+def _encode_pebble_error(error: pebble.Error) -> Dict[str, Any]:
+    """Returns the recorded form of an error raised by a Pebble call."""
+    encoded: Dict[str, Any] = {"type": type(error).__name__, "message": str(error)}
+    if isinstance(error, pebble.PathError):
+        encoded.update(kind=error.kind, message=error.message)
+    elif isinstance(error, pebble.APIError):
+        encoded.update(code=error.code, status=error.status, message=error.message)
+    return encoded
+
+
+def _decode_pebble_error(recorded: Dict[str, Any]) -> pebble.Error:
+    """Returns an error like the one a recorded Pebble call raised."""
+    if recorded["type"] == "PathError":
+        return pebble.PathError(recorded["kind"], recorded["message"])
+    if recorded["type"] == "APIError":
+        return pebble.APIError({}, recorded["code"], recorded["status"], recorded["message"])
+    if recorded["type"] == "ConnectionError":
+        return pebble.ConnectionError(recorded["message"])
+    return pebble.Error(recorded["message"])
+
+
+def _seed_containers(harness: "Harness", recording: ReconcileRecording):
+    """Adds each container's snapshotted plan as a layer, and starts its running services.
+
+    Only recordings of format version 1 and 2 hold a snapshot of the containers.
+    """
+    for name, container in recording.containers.items():
+        if container["can_connect"] and container["plan"]:
+            workload = harness.model.unit.get_container(name)
+            workload.add_layer("recorded-plan", container["plan"], combine=True)
+            running = container.get("running_services", [])
+            if running:
+                workload.start(*running)
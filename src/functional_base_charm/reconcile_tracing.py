@@ -0,0 +1,310 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Span-based tracing of reconcile passes, exported as OpenTelemetry JSON to a local file.
+
+A Tracer is activated for the duration of a dispatch by the CharmReconciler it is passed to.
+While it is active, span() records a span nested under the current one; while no Tracer is
+active, span() returns a shared no-op span, so instrumented code costs one context variable
+lookup per call when tracing is off.
+
+Each finished trace is written as one line of OTLP/JSON (an ExportTraceServiceRequest) to a
+size-rotated file, for a sidecar to ship to a collector, and passed to the Tracer's processors,
+such as a ReconcileMetrics.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_CODE_UNSET = 0
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+INSTRUMENTATION_SCOPE = "functional_base_charm"
+
+_active_tracer: ContextVar[Optional["Tracer"]] = ContextVar("active_tracer", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation in a trace.
+
+    Use a Span returned by span() or Tracer.start_span() as a context manager: it becomes the
+    current span on entry and is ended on exit, recording any exception as an error.
+    """
+
+    __slots__ = (
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "start_time",
+        "end_time",
+        "attributes",
+        "status_code",
+        "status_message",
+        "_tracer",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+    ):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent is not None else None
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status_code = STATUS_CODE_UNSET
+        self.status_message = ""
+        self._tracer = tracer
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        """Sets an attribute describing the result of this span."""
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        """Marks this span as failed."""
+        self.status_code = STATUS_CODE_ERROR
+        self.status_message = message
+
+    def end(self):
+        """Ends this span, exporting its trace if it is the root span."""
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+            self._tracer._on_end(self)
+
+    def __enter__(self) -> "Span":
+        """Makes this span the current span."""
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Ends this span, recording an exception as an error, and restores the current span."""
+        if exc_type is not None:
+            self.attributes["exception.type"] = exc_type.__name__
+            self.set_error(str(exc_value))
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Returns this span in the OTLP/JSON encoding."""
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id is not None:
+            otlp["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            otlp["status"]["message"] = self.status_message
+        return otlp
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is off."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Records spans, writing each finished trace to a rotating local file and its processors."""
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        service_name: str = "charm",
+        resource_attributes: Optional[Dict[str, Any]] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        processors: Iterable[Callable[[List[Span]], None]] = (),
+    ):
+        """Instantiate a Tracer.
+
+        Args:
+            path: (optional) the file traces are appended to.  If None, traces are only passed
+                  to the processors.
+            service_name: the service.name resource attribute of exported spans
+            resource_attributes: (optional) more attributes of the resource, such as the unit
+            max_bytes: size at which the file is rotated
+            backup_count: number of rotated files to keep
+            processors: callables each given the spans of every finished trace
+        """
+        self.path = Path(path) if path is not None else None
+        self.resource_attributes = {"service.name": service_name, **(resource_attributes or {})}
+        self.processors: List[Callable[[List[Span]], None]] = list(processors)
+        self._handler = (
+            RotatingFileHandler(
+                self.path, maxBytes=max_bytes, backupCount=backup_count, delay=True
+            )
+            if self.path is not None
+            else None
+        )
+        self._lock = threading.Lock()
+        # Finished spans of traces whose root span has not ended yet, by trace id
+        self._finished: Dict[str, List[Span]] = {}
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+    ) -> Span:
+        """Returns a new span, a child of the current span if there is one.
+
+        Use it as a context manager, or end() it explicitly.
+        """
+        return Span(self, name, _current_span.get(), attributes, kind)
+
+    def activate(self) -> contextvars.Token:
+        """Makes this the Tracer that spans are recorded to, returning a token to deactivate it."""
+        return _active_tracer.set(self)
+
+    @staticmethod
+    def deactivate(token: contextvars.Token):
+        """Restores the Tracer that was active before activate() returned token."""
+        _active_tracer.reset(token)
+
+    def _on_end(self, span: Span):
+        with self._lock:
+            self._finished.setdefault(span.trace_id, []).append(span)
+            if span.parent_span_id is not None:
+                return
+            spans = self._finished.pop(span.trace_id)
+        if self._handler is not None:
+            self.export(spans)
+        for processor in self.processors:
+            try:
+                processor(spans)
+            except Exception as e:
+                # Tracing must never break a dispatch
+                logger.warning(f"Trace processor {processor} failed: {e}")
+
+    def export(self, spans: List[Span]):
+        """Appends spans to the trace file as one OTLP/JSON line."""
+        document = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes(self.resource_attributes)},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": INSTRUMENTATION_SCOPE},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        record = logging.makeLogRecord({"msg": json.dumps(document, separators=(",", ":"))})
+        try:
+            self._handler.handle(record)
+        except OSError as e:
+            # Tracing must never break a dispatch
+            logger.warning(f"Failed to write trace to {self.path}: {e}")
+
+    def close(self):
+        """Closes the trace file."""
+        if self._handler is not None:
+            self._handler.close()
+
+
+def span(
+    name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL
+) -> Union[Span, _NoopSpan]:
+    """Returns a span under the current one if a Tracer is active, else a no-op span.
+
+    Use it as a context manager:
+
+        with span("kubernetes.apply", {"component.name": self.name}, SPAN_KIND_CLIENT) as s:
+            ...
+            s.set_attribute("resources", count)
+    """
+    tracer = _active_tracer.get()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, attributes, kind)
+
+
+def in_current_context(func: Callable[..., T]) -> Callable[..., T]:
+    """Returns func bound to a copy of the current context, for running on another thread.
+
+    Threads do not inherit context variables, so without this, spans recorded on a worker thread
+    would not be nested under the span that submitted the work, nor would a GraphProfiler's
+    frames be nested under the Component that submitted it.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return run
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Returns attributes as a list of OTLP KeyValues."""
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64 bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
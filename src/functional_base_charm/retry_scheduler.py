@@ -0,0 +1,113 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Schedules reconcile retries, with exponential backoff, for Components that are not ready."""
+
+import logging
+import random
+import time
+from typing import Callable
+
+from ops import EventBase, EventSource, Object, ObjectEvents, StoredState
+
+logger = logging.getLogger(__name__)
+
+
+class ReconcileRetryEvent(EventBase):
+    """Emitted to retry reconciling Components that were not ready in an earlier pass."""
+
+
+class RetrySchedulerEvents(ObjectEvents):
+    """Events emitted by a RetryScheduler."""
+
+    reconcile_retry = EventSource(ReconcileRetryEvent)
+
+
+class RetryScheduler(Object):
+    """Schedules retries of a reconcile pass, with exponential backoff and jitter.
+
+    Juju has no timers, so a retry is a deferred ReconcileRetryEvent: it is re-emitted at the
+    start of every later dispatch and only handled once its backoff delay has elapsed.  At most
+    one retry is pending at a time, so several passes that each leave work pending are merged
+    into a single retry.
+
+    Observe `on.reconcile_retry` with the reconcile handler, and guard that handler with
+    `is_due(event)`.
+    """
+
+    on = RetrySchedulerEvents()
+    _stored = StoredState()
+
+    def __init__(
+        self,
+        parent: Object,
+        key: str = "retry-scheduler",
+        base_delay: float = 10.0,
+        max_delay: float = 600.0,
+        jitter: float = 0.2,
+        clock: Callable[[], float] = time.time,
+    ):
+        """Instantiate a RetryScheduler.
+
+        Args:
+            parent: the ops.Object (typically the charm) this belongs to
+            key: the ops.Object key of this instance
+            base_delay: seconds to wait before the first retry
+            max_delay: the longest delay between retries, in seconds
+            jitter: fraction by which each delay is randomly lengthened or shortened, so units of
+                    an application do not all retry at once
+            clock: callable returning the current time in seconds since the epoch.  This must be
+                   comparable across processes, as retries are due in later dispatches.
+        """
+        super().__init__(parent, key)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._clock = clock
+        self._stored.set_default(attempt=0, next_retry_at=0.0, pending=False)
+
+    @property
+    def pending(self) -> bool:
+        """Returns True if a retry is scheduled."""
+        return self._stored.pending
+
+    @property
+    def attempt(self) -> int:
+        """Returns the number of retries scheduled since the last reset()."""
+        return self._stored.attempt
+
+    def next_delay(self) -> float:
+        """Returns the delay, in seconds, for the next retry to be scheduled."""
+        delay = min(self.max_delay, self.base_delay * 2**self._stored.attempt)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def schedule(self):
+        """Schedule a retry, unless one is already pending."""
+        if self._stored.pending:
+            logger.info("Reconcile retry already pending - merging with it.")
+            return
+        delay = self.next_delay()
+        self._stored.attempt += 1
+        self._stored.next_retry_at = self._clock() + delay
+        self._stored.pending = True
+        logger.info(f"Scheduling reconcile retry {self._stored.attempt} in {delay:.1f}s.")
+        self.on.reconcile_retry.emit()
+
+    def reset(self):
+        """Cancel any pending retry and restart the backoff, for example after converging."""
+        self._stored.attempt = 0
+        self._stored.pending = False
+
+    def is_due(self, event: ReconcileRetryEvent) -> bool:
+        """Returns True if a retry should run now, deferring or dropping the event otherwise.
+
+        Call this at the start of the reconcile_retry handler.  If the retry was cancelled the
+        event is dropped, and if it is not yet due the event is deferred to a later dispatch.
+        """
+        if not self._stored.pending:
+            logger.info("Reconcile retry no longer needed - dropping it.")
+            return False
+        if self._clock() < self._stored.next_retry_at:
+            event.defer()
+            return False
+        self._stored.pending = False
+        return True
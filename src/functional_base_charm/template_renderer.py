@@ -0,0 +1,167 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""A shared Jinja template rendering service for Components."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple, Union
+
+import jinja2
+
+logger = logging.getLogger(__name__)
+
+# Globs, relative to a charm's directory, of the files preload() compiles by default
+DEFAULT_TEMPLATE_GLOBS = ("templates/**/*", "src/templates/**/*")
+
+# How many rendered outputs a TemplateRenderer memoizes before dropping the oldest
+DEFAULT_MAX_MEMOIZED_RENDERS = 256
+
+
+@dataclass
+class TemplateStats:
+    """Counters and timings of one template in a TemplateRenderer."""
+
+    compiles: int = 0
+    renders: int = 0
+    cache_hits: int = 0
+    compile_seconds: float = 0.0
+    render_seconds: float = 0.0
+
+
+class TemplateRenderer:
+    """Renders Jinja templates with one shared Environment, compiling and rendering each once.
+
+    Templates are compiled at most once, either up front with preload() or on first use.
+    Rendered output is memoized by template and a hash of the context, so Components that
+    render the same template with the same context share one render.  Only contexts made of
+    JSON types (dicts with string keys, lists, strings, numbers, booleans and None) are
+    memoized, as other values cannot be hashed reliably, and the oldest renders are dropped once
+    max_memoized_renders are held.
+
+    Share one TemplateRenderer between the KubernetesComponents and PebbleComponents of a charm
+    by passing it as their template_renderer.
+    """
+
+    def __init__(
+        self,
+        environment: Optional[jinja2.Environment] = None,
+        max_memoized_renders: int = DEFAULT_MAX_MEMOIZED_RENDERS,
+    ):
+        """Instantiate a TemplateRenderer.
+
+        Args:
+            environment: (optional) the jinja2 Environment templates are compiled in, for example
+                         one with custom filters.  If None, a default Environment is used.
+            max_memoized_renders: how many rendered outputs to memoize
+        """
+        self.environment = environment or jinja2.Environment()
+        self.max_memoized_renders = max_memoized_renders
+        self._templates: Dict[Path, jinja2.Template] = {}
+        self._rendered: Dict[Tuple[Path, Optional[str]], str] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[Path, TemplateStats] = {}
+
+    def preload(
+        self, root: Union[str, Path], globs: Iterable[str] = DEFAULT_TEMPLATE_GLOBS
+    ) -> int:
+        """Compiles every file under root matching globs, returning how many were compiled.
+
+        Args:
+            root: the directory to search, typically the charm's directory
+            globs: glob patterns, relative to root, of the templates to compile
+        """
+        paths = {path for pattern in globs for path in Path(root).glob(pattern) if path.is_file()}
+        compiled = 0
+        for path in sorted(paths):
+            try:
+                self.get_template(path)
+                compiled += 1
+            except (jinja2.TemplateSyntaxError, UnicodeDecodeError) as e:
+                # Not every file in a templates directory must be a valid template
+                logger.warning(f"Skipped preloading {path}: {e}")
+        logger.info(f"Preloaded {compiled} templates from {root}")
+        return compiled
+
+    def get_template(self, path: Union[str, Path]) -> jinja2.Template:
+        """Returns the compiled template at path, compiling it if it is not already."""
+        path = Path(path).resolve()
+        with self._lock:
+            template = self._templates.get(path)
+        if template is not None:
+            return template
+
+        started_at = time.perf_counter()
+        template = self.environment.from_string(path.read_text())
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            self._templates[path] = template
+            stats = self.stats.setdefault(path, TemplateStats())
+            stats.compiles += 1
+            stats.compile_seconds += elapsed
+        return template
+
+    def render(self, path: Union[str, Path], context: Optional[Mapping[str, Any]] = None) -> str:
+        """Returns the template at path rendered with context, reusing an earlier render if any.
+
+        Contexts are hashed through their JSON representation.  A context that is not made of
+        JSON types is rendered every time.
+        """
+        context = context or {}
+        template = self.get_template(path)
+        resolved = Path(path).resolve()
+        context_hash = _hash_context(context)
+        key = (resolved, context_hash)
+        if context_hash is not None:
+            with self._lock:
+                rendered = self._rendered.get(key)
+                if rendered is not None:
+                    self.stats[resolved].cache_hits += 1
+                    return rendered
+
+        started_at = time.perf_counter()
+        rendered = template.render(**context)
+        elapsed = time.perf_counter() - started_at
+        with self._lock:
+            if context_hash is not None:
+                self._rendered[key] = rendered
+                while len(self._rendered) > self.max_memoized_renders:
+                    del self._rendered[next(iter(self._rendered))]
+            stats = self.stats[resolved]
+            stats.renders += 1
+            stats.render_seconds += elapsed
+        return rendered
+
+    def clear(self):
+        """Drops every memoized render, keeping the compiled templates."""
+        with self._lock:
+            self._rendered.clear()
+
+    def report(self) -> str:
+        """Returns a human readable summary of the compile and render time of each template."""
+        lines = [
+            f"{path}: {stats.compiles} compiles ({stats.compile_seconds * 1000:.1f}ms), "
+            f"{stats.renders} renders ({stats.render_seconds * 1000:.1f}ms), "
+            f"{stats.cache_hits} cache hits"
+            for path, stats in sorted(self.stats.items())
+        ]
+        return "\n".join(lines)
+
+
+def _hash_context(context: Mapping[str, Any]) -> Optional[str]:
+    """Returns a stable hash of a template context, or None if it is not made of JSON types.
+
+    A context is only hashed if it survives a JSON round trip unchanged, so values that JSON
+    would convert, such as tuples or non-string keys, cannot share a hash with other values.
+    """
+    try:
+        dumped = json.dumps(context, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    if json.loads(dumped) != context:
+        return None
+    return hashlib.sha256(dumped.encode()).hexdigest()
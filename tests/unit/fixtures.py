@@ -38,6 +38,20 @@ class MinimallyExtendedComponent(Component):
         self._completed_work = "some work"
 
 
+class CountingComponent(MinimallyExtendedComponent):
+    """A Component that counts how many times its status has been evaluated."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.status_evaluations = 0
+
+    @property
+    def status(self) -> StatusBase:
+        """Returns the status of MinimallyExtendedComponent, counting the evaluation."""
+        self.status_evaluations += 1
+        return super().status
+
+
 class MinimallyBlockedComponent(MinimallyExtendedComponent):
     """A minimal Component that defaults to being Blocked."""
 
@@ -168,3 +182,18 @@ def harness_with_container():
     harness = Harness(DummyCharm, meta=METADATA_WITH_CONTAINER)
     harness.begin()
     return harness
+
+
+METADATA_WITH_CONTAINERS = """
+name: test-charm
+containers:
+  first-container:
+  second-container:
+"""
+
+
+@pytest.fixture()
+def harness_with_containers():
+    harness = Harness(DummyCharm, meta=METADATA_WITH_CONTAINERS)
+    harness.begin()
+    return harness
@@ -0,0 +1,225 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import asyncio
+import sys
+import time
+
+import pytest
+from fixtures import MinimallyExtendedComponent, harness  # noqa: F401
+from ops import ActiveStatus, BlockedStatus, Handle, StatusBase, WaitingStatus
+
+from functional_base_charm.async_component import (
+    AsyncComponent,
+    execute_component_graph_async,
+)
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.component_graph import ComponentGraph
+from functional_base_charm.reconcile_profile import ReconcileProfile
+
+
+class MockEvent:
+    handle = Handle(None, "mock_event", None)
+
+
+class SleepingComponent(AsyncComponent):
+    """An AsyncComponent that records when it starts and finishes configuring."""
+
+    def __init__(self, *args, log, delay=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = log
+        self.delay = delay
+        self.configured = 0
+
+    def fingerprint(self):
+        return "inputs"
+
+    async def _configure_unit_async(self, event):
+        self.log.append(f"start {self.name}")
+        await asyncio.sleep(self.delay)
+        self.log.append(f"end {self.name}")
+        self.configured += 1
+
+    async def get_status(self) -> StatusBase:
+        return ActiveStatus()
+
+
+class AlwaysBlockedComponent(MinimallyExtendedComponent):
+    """A synchronous Component that stays Blocked after executing."""
+
+    @property
+    def status(self) -> StatusBase:
+        return BlockedStatus("Blocked")
+
+
+class TestAsyncComponent:
+    def test_sync_api(self, harness):  # noqa: F811
+        """Test that the synchronous Component API runs the coroutines to completion."""
+        log = []
+        component = SleepingComponent(charm=harness.charm, name="a", log=log)
+
+        component.configure_charm(MockEvent())
+
+        assert log == ["start a", "end a"]
+        assert component.status == ActiveStatus()
+
+
+class TestExecuteComponentGraphAsync:
+    def test_independent_components_run_concurrently(self, harness):  # noqa: F811
+        """Test that independent Components overlap, and dependents wait for their prerequisites.
+
+        a and b are independent and c depends on both, so a and b should both start before either
+        ends, and c should only start after both have ended.
+        """
+        # Arrange
+        log = []
+        graph = ComponentGraph()
+        a = graph.add(SleepingComponent(charm=harness.charm, name="a", log=log, delay=0.02))
+        b = graph.add(SleepingComponent(charm=harness.charm, name="b", log=log, delay=0.01))
+        graph.add(SleepingComponent(charm=harness.charm, name="c", log=log), depends_on=[a, b])
+        executed = []
+
+        # Act
+        asyncio.run(
+            execute_component_graph_async(
+                graph, MockEvent(), lambda item, fingerprint: executed.append(item.name)
+            )
+        )
+
+        # Assert
+        assert log == ["start a", "start b", "end b", "end a", "start c", "end c"]
+        assert executed == ["b", "a", "c"]
+        assert graph.status == ActiveStatus()
+
+    def test_sync_components_run_on_executor(self, harness):  # noqa: F811
+        """Test that a synchronous Component is executed, and its status gates its dependents."""
+        # Arrange
+        log = []
+        graph = ComponentGraph()
+        sync_active = graph.add(MinimallyExtendedComponent(charm=harness.charm, name="sync"))
+        blocked = graph.add(AlwaysBlockedComponent(charm=harness.charm, name="blocked"))
+        after_sync = graph.add(
+            SleepingComponent(charm=harness.charm, name="after-sync", log=log),
+            depends_on=[sync_active],
+        )
+        after_blocked = graph.add(
+            SleepingComponent(charm=harness.charm, name="after-blocked", log=log),
+            depends_on=[blocked],
+        )
+
+        # Act
+        asyncio.run(execute_component_graph_async(graph, MockEvent(), lambda *_: None))
+
+        # Assert
+        assert sync_active.executed and blocked.executed
+        assert after_sync.executed
+        assert not after_blocked.executed
+        assert log == ["start after-sync", "end after-sync"]
+
+    def test_chain_deeper_than_recursion_limit(self, harness):  # noqa: F811
+        """Test that a chain deeper than the recursion limit executes without wait reasons."""
+        graph = ComponentGraph()
+        items = []
+        for i in range(sys.getrecursionlimit() + 100):
+            items.append(
+                graph.add(
+                    MinimallyExtendedComponent(charm=harness.charm, name=f"link{i}"),
+                    depends_on=items[-1:],
+                )
+            )
+
+        asyncio.run(execute_component_graph_async(graph, MockEvent(), lambda *_: None))
+
+        assert all(item.executed for item in items)
+        assert graph._last_reasons == {}
+
+    def test_exception_propagates(self, harness):  # noqa: F811
+        """Test that an exception raised while configuring a Component is raised to the caller."""
+
+        class FailingComponent(SleepingComponent):
+            async def _configure_unit_async(self, event):
+                raise RuntimeError("configure failed")
+
+        graph = ComponentGraph()
+        graph.add(FailingComponent(charm=harness.charm, name="a", log=[]))
+
+        with pytest.raises(RuntimeError, match="configure failed"):
+            asyncio.run(execute_component_graph_async(graph, MockEvent(), lambda *_: None))
+
+    def test_component_over_budget_is_cancelled(self, harness):  # noqa: F811
+        """Test that an overrunning Component is cancelled and independent items carry on."""
+        log = []
+        graph = ComponentGraph()
+        slow = graph.add(SleepingComponent(charm=harness.charm, name="slow", log=log, delay=5))
+        after_slow = graph.add(
+            SleepingComponent(charm=harness.charm, name="after-slow", log=log), depends_on=[slow]
+        )
+        graph.add(SleepingComponent(charm=harness.charm, name="independent", log=log))
+        profile = ReconcileProfile()
+
+        asyncio.run(
+            execute_component_graph_async(
+                graph, MockEvent(), lambda *_: None, budgets={"slow": 0.01}, profile=profile
+            )
+        )
+
+        assert sorted(log) == ["end independent", "start independent", "start slow"]
+        assert slow.status == WaitingStatus("Timed out after 0.01s configuring.")
+        assert not after_slow.executed
+        assert [timing.name for timing in profile.overruns] == ["slow"]
+
+    def test_sync_component_over_budget_does_not_hold_pass(self, harness):  # noqa: F811
+        """Test that the pass ends without waiting for an overrunning synchronous Component."""
+
+        class SlowSyncComponent(MinimallyExtendedComponent):
+            def _configure_unit(self, event):
+                time.sleep(5)
+
+        graph = ComponentGraph()
+        slow = graph.add(SlowSyncComponent(charm=harness.charm, name="slow"))
+
+        started_at = time.monotonic()
+        asyncio.run(
+            execute_component_graph_async(
+                graph, MockEvent(), lambda *_: None, budgets={"slow": 0.05}
+            )
+        )
+
+        assert time.monotonic() - started_at < 1
+        assert slow.status == WaitingStatus("Timed out after 0.05s configuring.")
+
+
+class TestReconcilerAsyncio:
+    def test_execute_components(self, harness):  # noqa: F811
+        """Test that a CharmReconciler using asyncio executes and records each Component."""
+        # Arrange
+        log = []
+        charm_reconciler = CharmReconciler(harness.charm, use_asyncio=True)
+        a = charm_reconciler.add(SleepingComponent(charm=harness.charm, name="a", log=log))
+        b = charm_reconciler.add(
+            SleepingComponent(charm=harness.charm, name="b", log=log), depends_on=[a]
+        )
+
+        # Act
+        charm_reconciler.execute_components(MockEvent())
+
+        # Assert
+        assert log == ["start a", "end a", "start b", "end b"]
+        assert a.component.configured == b.component.configured == 1
+        assert sorted(charm_reconciler._stored.execution_state["completed"]) == ["a", "b"]
+        assert a.executed and b.executed
+
+    def test_incremental_status(self, harness):  # noqa: F811
+        """Test that statuses are pushed once the loop has finished, not evaluated on it."""
+        log = []
+        graph = ComponentGraph(incremental_status=True)
+        charm_reconciler = CharmReconciler(harness.charm, graph, use_asyncio=True)
+        a = charm_reconciler.add(SleepingComponent(charm=harness.charm, name="a", log=log))
+        charm_reconciler.add(
+            SleepingComponent(charm=harness.charm, name="b", log=log), depends_on=[a]
+        )
+
+        charm_reconciler.execute_components(MockEvent())
+
+        assert log == ["start a", "end a", "start b", "end b"]
+        assert graph.status_prioritiser.highest() == ActiveStatus()
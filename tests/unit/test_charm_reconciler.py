@@ -1,14 +1,31 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-from fixtures import MinimallyExtendedComponent, harness  # noqa: F401
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
 
+from fixtures import (  # noqa: F401
+    CountingComponent,
+    MinimallyExtendedComponent,
+    harness,
+)
+from ops import ActiveStatus, Handle, WaitingStatus
+
+import functional_base_charm
 from functional_base_charm.charm_reconciler import CharmReconciler
 from functional_base_charm.component_graph import ComponentGraph
 
 # TODO: Add tests for execute_components, install, remove_components
 
 
+class MockEvent:
+    handle = Handle(None, "mock_event", None)
+
+
 class TestBasicFunction:
     def test_init_with_component_graph(self, harness):  # noqa: F811
         """Test that initialising a CharmReconciler with a ComponentGraph works as expected."""
@@ -56,3 +73,325 @@ class TestBasicFunction:
         assert component_graph_item1.name in charm_reconciler._component_graph.component_items
         assert component_graph_item2.name in charm_reconciler._component_graph.component_items
         assert len(charm_reconciler._component_graph.component_items) == 2
+
+
+class VerifiableComponent(CountingComponent):
+    """A Component that counts status evaluations and trusts any cached ActiveStatus."""
+
+    def verify_status(self, cached_status):
+        return isinstance(cached_status, ActiveStatus)
+
+
+class TestUpdateStatus:
+    def test_update_status_does_not_execute_components(self, harness):  # noqa: F811
+        """Tests that update_status refreshes status without configuring any Component."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        cgi1 = charm_reconciler.add(VerifiableComponent(harness.charm, "component1"))
+        charm_reconciler.add(VerifiableComponent(harness.charm, "component2"), depends_on=[cgi1])
+
+        charm_reconciler.update_status(MockEvent())
+
+        assert cgi1.executed is False
+        assert cgi1.component._completed_work is None
+        status = harness.charm.unit.status
+        assert isinstance(status, WaitingStatus)
+        assert status.message.startswith("[component1]")
+
+    def test_update_status_reuses_verified_statuses(self, harness):  # noqa: F811
+        """Tests that cached statuses are reused when the Component verifies them."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        cgi1 = charm_reconciler.add(VerifiableComponent(harness.charm, "component1"))
+        cgi1.component.configure_charm("mock event")
+
+        charm_reconciler.update_status(MockEvent())
+        assert isinstance(harness.charm.unit.status, ActiveStatus)
+        assert cgi1.component.status_evaluations == 1
+
+        charm_reconciler.update_status(MockEvent())
+        assert cgi1.component.status_evaluations == 1
+
+    def test_update_status_only_sets_changed_status(self, harness):  # noqa: F811
+        """Tests that the unit status is only set when it changes."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        charm_reconciler.add(VerifiableComponent(harness.charm, "component1"))
+        backend = harness.charm.framework.model._backend
+
+        with patch.object(backend, "status_set", wraps=backend.status_set) as status_set:
+            charm_reconciler.update_status(MockEvent())
+            charm_reconciler.update_status(MockEvent())
+
+        assert status_set.call_count == 1
+
+
+class TestExecuteComponents:
+    def test_status_set_once_on_commit(self, harness):  # noqa: F811
+        """Tests that the unit status is computed and set once, when the framework commits."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        cgi1 = charm_reconciler.add(MinimallyExtendedComponent(harness.charm, "component1"))
+        charm_reconciler.add(MinimallyExtendedComponent(harness.charm, "component2"), [cgi1])
+        backend = harness.charm.framework.model._backend
+
+        with patch.object(backend, "status_set", wraps=backend.status_set) as status_set:
+            charm_reconciler.execute_components(MockEvent())
+            charm_reconciler.execute_components(MockEvent())
+            assert status_set.call_count == 0
+
+            harness.framework.commit()
+            assert status_set.call_count == 1
+            assert isinstance(harness.charm.unit.status, ActiveStatus)
+
+            # A later commit without execute_components does not set the status again
+            harness.framework.commit()
+            assert status_set.call_count == 1
+
+    def test_unchanged_status_not_set_on_commit(self, harness):  # noqa: F811
+        """Tests that status-set is skipped if the computed status matches the unit status."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        charm_reconciler.add(MinimallyExtendedComponent(harness.charm, "component1"))
+        harness.charm.unit.status = ActiveStatus()
+        backend = harness.charm.framework.model._backend
+
+        with patch.object(backend, "status_set", wraps=backend.status_set) as status_set:
+            charm_reconciler.execute_components(MockEvent())
+            harness.framework.commit()
+
+        assert status_set.call_count == 0
+
+
+class FingerprintedComponent(MinimallyExtendedComponent):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.configured = 0
+
+    def fingerprint(self):
+        return "unchanged"
+
+    def _configure_unit(self, event):
+        self.configured += 1
+        super()._configure_unit(event)
+
+
+class TestExecutionState:
+    def test_completed_components_are_not_executed_again(self, harness):  # noqa: F811
+        """Tests that Components with unchanged fingerprints are not executed in a new dispatch."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        cgi1 = charm_reconciler.add(FingerprintedComponent(harness.charm, "fingerprinted"))
+        cgi2 = charm_reconciler.add(
+            MinimallyExtendedComponent(harness.charm, "plain"), depends_on=[cgi1]
+        )
+        charm_reconciler.execute_components(MockEvent())
+        assert cgi1.component.configured == 1
+
+        # Simulate a new dispatch, where the graph starts with nothing executed
+        cgi1.executed = False
+        cgi2.executed = False
+        charm_reconciler._execution_state_restored = False
+        charm_reconciler.execute_components(MockEvent())
+
+        assert cgi1.component.configured == 1
+        assert cgi2.executed is True
+
+    def test_only_dirty_components_are_executed_again(self, harness):  # noqa: F811
+        """Tests that an event observed by one Component only re-executes it and its dependents."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        items = []
+        for name in ["upstream", "observer", "downstream"]:
+            items.append(
+                charm_reconciler.add(
+                    FingerprintedComponent(harness.charm, name), depends_on=items[-1:]
+                )
+            )
+        items[1].component._events_to_observe = [harness.charm.on.config_changed]
+        charm_reconciler.execute_components(MockEvent())
+
+        # Simulate a new dispatch for an event that "observer" observes
+        for item in items:
+            item.executed = False
+        charm_reconciler._execution_state_restored = False
+        event = MockEvent()
+        event.handle = Handle(harness.charm.on, "config_changed", None)
+        charm_reconciler.execute_components(event)
+
+        assert [item.component.configured for item in items] == [1, 2, 2]
+
+
+class TestCoalesceEvents:
+    def test_events_merged_into_one_pass(self, harness):  # noqa: F811
+        """Tests that several events in one dispatch run a single reconcile pass on commit."""
+        charm_reconciler = CharmReconciler(harness.charm, coalesce_events=True)
+        item = charm_reconciler.add(FingerprintedComponent(harness.charm, "component"))
+
+        for _ in range(3):
+            charm_reconciler.execute_components(MockEvent())
+        assert item.component.configured == 0
+
+        harness.framework.commit()
+
+        assert item.component.configured == 1
+        assert charm_reconciler.events_received == 3
+        assert charm_reconciler.events_coalesced == 2
+        assert isinstance(harness.charm.unit.status, ActiveStatus)
+
+    def test_merged_events_mark_work_dirty(self, harness):  # noqa: F811
+        """Tests that a merged event still marks the Components it affects as dirty."""
+        charm_reconciler = CharmReconciler(harness.charm, coalesce_events=True)
+        upstream = charm_reconciler.add(FingerprintedComponent(harness.charm, "upstream"))
+        observer = charm_reconciler.add(FingerprintedComponent(harness.charm, "observer"))
+        observer.component._events_to_observe = [harness.charm.on.config_changed]
+        charm_reconciler.execute_components(MockEvent())
+        harness.framework.commit()
+
+        event = MockEvent()
+        event.handle = Handle(harness.charm.on, "config_changed", None)
+        charm_reconciler.execute_components(MockEvent())
+        charm_reconciler.execute_components(event)
+        harness.framework.commit()
+
+        assert upstream.component.configured == 1
+        assert observer.component.configured == 2
+
+
+class SlowComponent(FingerprintedComponent):
+    def __init__(self, *args, delay, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    def _configure_unit(self, event):
+        time.sleep(self.delay)
+        super()._configure_unit(event)
+
+
+class TestBudgets:
+    def test_component_over_budget_is_abandoned(self, harness):  # noqa: F811
+        """Tests that an overrunning Component is Waiting, and only its own dependents wait."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        slow = charm_reconciler.add(SlowComponent(harness.charm, "slow", delay=0.5), budget=0.05)
+        after_slow = charm_reconciler.add(
+            FingerprintedComponent(harness.charm, "after-slow"), depends_on=[slow]
+        )
+        independent = charm_reconciler.add(FingerprintedComponent(harness.charm, "independent"))
+
+        charm_reconciler.execute_components(MockEvent())
+
+        assert slow.status == WaitingStatus("Timed out after 0.05s configuring.")
+        assert after_slow.component.configured == 0
+        assert independent.component.configured == 1
+        profile = charm_reconciler.last_profile
+        assert [timing.name for timing in profile.overruns] == ["slow"]
+        assert profile.overruns[0].budget == 0.05
+        assert "slow" not in charm_reconciler._stored.execution_state["completed"]
+
+    def test_overrunning_component_does_not_hold_process_open(self):
+        """Tests that the process exits without waiting for an overrunning Component."""
+        script = (
+            "import time\n"
+            "from functional_base_charm.charm_reconciler import _run_within_budget\n"
+            "assert _run_within_budget(lambda event: time.sleep(5), None, 0.1) is False\n"
+        )
+        src = str(Path(functional_base_charm.__file__).parent.parent)
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.pathsep.join([src, os.environ.get("PYTHONPATH", "")]),
+        }
+
+        started_at = time.monotonic()
+        subprocess.run([sys.executable, "-c", script], env=env, check=True)
+
+        assert time.monotonic() - started_at < 4
+
+    def test_pass_budget_leaves_remaining_components_pending(self, harness):  # noqa: F811
+        """Tests that no Component is started once the pass budget is spent."""
+        charm_reconciler = CharmReconciler(harness.charm, pass_budget=0.05)
+        first = charm_reconciler.add(SlowComponent(harness.charm, "first", delay=0.1))
+        second = charm_reconciler.add(FingerprintedComponent(harness.charm, "second"))
+
+        charm_reconciler.execute_components(MockEvent())
+
+        # The budget given to "first" is whatever remained of the pass budget when it started
+        assert isinstance(first.status, WaitingStatus)
+        assert first.status.message.startswith("Timed out after 0.0")
+        assert not second.executed
+        assert charm_reconciler.last_profile.skipped == ["second"]
+
+    def test_within_budget(self, harness):  # noqa: F811
+        """Tests that Components that finish within their budget are recorded as usual."""
+        charm_reconciler = CharmReconciler(harness.charm, component_budget=5.0)
+        item = charm_reconciler.add(FingerprintedComponent(harness.charm, "component"))
+
+        charm_reconciler.execute_components(MockEvent())
+
+        assert item.component.configured == 1
+        assert item.status == ActiveStatus()
+        assert charm_reconciler.last_profile.overruns == []
+        assert charm_reconciler.last_profile.components[0].budget == 5.0
+
+
+class TestAddFactory:
+    def test_components_built_when_needed(self, harness):  # noqa: F811
+        """Tests that a factory Component is built when executed, and its budget is kept."""
+        charm_reconciler = CharmReconciler(harness.charm, component_budget=5.0)
+        first = charm_reconciler.add_factory(
+            "first", lambda: FingerprintedComponent(harness.charm, "first"), budget=1.0
+        )
+        second = charm_reconciler.add_factory(
+            "second", lambda: FingerprintedComponent(harness.charm, "second"), depends_on=[first]
+        )
+        assert not first.built and not second.built
+
+        charm_reconciler.execute_components(MockEvent())
+
+        assert first.component.configured == second.component.configured == 1
+        assert charm_reconciler._component_budgets == {"first": 1.0, "second": 5.0}
+
+    def test_untouched_factory_not_built_in_warm_dispatch(self, harness):  # noqa: F811
+        """Tests that a dispatch that does not execute a factory Component does not build it."""
+        builds = []
+        plain = FingerprintedComponent(harness.charm, "plain")
+
+        def add_factories(charm_reconciler):
+            def factory():
+                builds.append("lazy")
+                return FingerprintedComponent(harness.charm, "lazy")
+
+            lazy = charm_reconciler.add_factory("lazy", factory, fingerprint=lambda: "unchanged")
+            charm_reconciler.add(plain, depends_on=[lazy])
+            return lazy
+
+        charm_reconciler = CharmReconciler(harness.charm)
+        add_factories(charm_reconciler)
+        charm_reconciler.execute_components(MockEvent())
+        harness.framework.commit()
+        assert builds == ["lazy"]
+
+        # Simulate a new dispatch, with only the stored state kept
+        charm_reconciler._component_graph = ComponentGraph()
+        charm_reconciler._execution_state_restored = False
+        charm_reconciler._summary_state_restored = False
+        lazy = add_factories(charm_reconciler)
+        charm_reconciler.execute_components(MockEvent())
+        harness.framework.commit()
+
+        assert builds == ["lazy"]
+        assert not lazy.built and lazy.executed
+        assert isinstance(harness.charm.unit.status, ActiveStatus)
+
+
+class TestSummarise:
+    def test_summary_reported_in_later_dispatch(self, harness):  # noqa: F811
+        """Tests that a later dispatch reports statuses and timings without evaluating them."""
+        charm_reconciler = CharmReconciler(harness.charm)
+        component = charm_reconciler.add(FingerprintedComponent(harness.charm, "component"))
+        charm_reconciler.execute_components(MockEvent())
+        harness.framework.commit()
+
+        # Simulate a new dispatch, such as a debug action, with only the stored state kept
+        charm_reconciler._component_graph = ComponentGraph()
+        charm_reconciler._execution_state_restored = False
+        charm_reconciler._summary_state_restored = False
+        charm_reconciler.add(component.component)
+        with patch.object(FingerprintedComponent, "status", new_callable=PropertyMock) as status:
+            (summary,) = charm_reconciler.summarise().components
+            status.assert_not_called()
+
+        assert (summary.executed, summary.fingerprint) == (True, "unchanged")
+        assert (summary.status, summary.duration is not None) == ("active", True)
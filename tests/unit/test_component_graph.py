@@ -1,16 +1,29 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import time
+from unittest.mock import PropertyMock, patch
+
 import pytest
 from fixtures import (  # noqa: F401
+    CountingComponent,
     MinimallyBlockedComponent,
     MinimallyExtendedComponent,
     harness,
 )
-from ops import BlockedStatus, UnknownStatus
+from ops import (
+    ActiveStatus,
+    BlockedStatus,
+    Handle,
+    MaintenanceStatus,
+    UnknownStatus,
+    WaitingStatus,
+)
 
 from functional_base_charm.component_graph import ComponentGraph
 from functional_base_charm.component_graph_item import ComponentGraphItem
+from functional_base_charm.multistatus import Prioritiser
+from functional_base_charm.reconcile_profile import ComponentTiming
 
 
 class TestAdd:
@@ -210,3 +223,428 @@ class TestEventsToObserve:
 
         expected_events = events1 + events2
         assert cg.get_events_to_observe() == expected_events
+
+
+class TestStatusPass:
+    def test_status_evaluates_each_component_once(self, harness):  # noqa: F811
+        """Tests that ComponentGraph.status evaluates each Component's status once per pass."""
+        cg = ComponentGraph()
+
+        previous = []
+        for i in range(30):
+            cgi = cg.add(CountingComponent(harness.charm, f"link{i}"), depends_on=previous)
+            cgi.executed = True
+            cgi.component.configure_charm("mock event")
+            previous = [cgi]
+
+        assert isinstance(cg.status, ActiveStatus)
+        assert all(cgi.component.status_evaluations == 1 for cgi in cg.component_items.values())
+
+    def test_yield_evaluates_each_prerequisite_once(self, harness):  # noqa: F811
+        """Tests that executing many dependents of one item evaluates its status once."""
+        cg = ComponentGraph()
+
+        root = cg.add(CountingComponent(harness.charm, "root"))
+        dependents = [
+            cg.add(CountingComponent(harness.charm, f"dependent{i}"), depends_on=[root])
+            for i in range(200)
+        ]
+
+        executed = []
+        for item in cg.yield_executable_component_items():
+            item.component.configure_charm("mock event")
+            executed.append(item.name)
+
+        assert len(executed) == 201
+        assert root.component.status_evaluations == 1
+        assert not any(cgi.component.status_evaluations for cgi in dependents)
+
+    def test_concurrent_status_evaluates_shared_prerequisite_once(self, harness):  # noqa: F811
+        """Tests that statuses collected concurrently evaluate a shared prerequisite once."""
+        cg = ComponentGraph(status_prioritiser=Prioritiser(max_workers=4))
+        evaluations = []
+
+        class SlowComponent(MinimallyExtendedComponent):
+            @property
+            def status(self):
+                evaluations.append(self.name)
+                time.sleep(0.02)
+                return super().status
+
+        shared = cg.add(SlowComponent(harness.charm, "shared"))
+        items = [shared] + [
+            cg.add(SlowComponent(harness.charm, f"dependent{i}"), depends_on=[shared])
+            for i in range(4)
+        ]
+        for cgi in items:
+            cgi.executed = True
+            cgi.component.configure_charm("mock event")
+
+        assert isinstance(cg.status, ActiveStatus)
+        assert evaluations.count("shared") == 1
+
+
+class TestIncrementalStatus:
+    def test_status_pushed_after_notify(self, harness):  # noqa: F811
+        """Tests that an incremental graph only re-evaluates items that were notified."""
+        cg = ComponentGraph(incremental_status=True)
+        cgi1 = cg.add(MinimallyExtendedComponent(harness.charm, "component1"))
+        cgi2 = cg.add(MinimallyExtendedComponent(harness.charm, "component2"), depends_on=[cgi1])
+
+        assert isinstance(cg.status, MaintenanceStatus)
+
+        for cgi in [cgi1, cgi2]:
+            cgi.executed = True
+            cgi.component.configure_charm("mock event")
+
+        # Nothing has been notified, so the graph still reports the last pushed status
+        assert isinstance(cg.status, MaintenanceStatus)
+
+        # Notifying about cgi1 also refreshes cgi2, which depends on it
+        cg.notify_status_changed("component1")
+        assert isinstance(cg.status, ActiveStatus)
+
+    def test_notify_without_incremental_status_is_noop(self, harness):  # noqa: F811
+        cg = ComponentGraph()
+        cg.add(MinimallyExtendedComponent(harness.charm, "component1"))
+        cg.notify_status_changed("component1")
+        assert isinstance(cg.status, MaintenanceStatus)
+
+
+class TestIndexes:
+    def make_diamond(self, harness):  # noqa: F811
+        """Returns a ComponentGraph of a -> (b, c) -> d."""
+        cg = ComponentGraph()
+        a = cg.add(MinimallyExtendedComponent(harness.charm, "a"))
+        b = cg.add(MinimallyExtendedComponent(harness.charm, "b"), depends_on=[a])
+        c = cg.add(MinimallyExtendedComponent(harness.charm, "c"), depends_on=[a])
+        cg.add(MinimallyExtendedComponent(harness.charm, "d"), depends_on=[b, c])
+        return cg
+
+    def test_get_by_name(self, harness):  # noqa: F811
+        cg = self.make_diamond(harness)
+        assert cg.get_by_name("b").name == "b"
+        with pytest.raises(KeyError):
+            cg.get_by_name("missing")
+
+    def test_get_dependents(self, harness):  # noqa: F811
+        cg = self.make_diamond(harness)
+        assert [item.name for item in cg.get_dependents("a")] == ["b", "c"]
+        assert [item.name for item in cg.get_dependents("a", transitive=True)] == ["b", "c", "d"]
+        assert cg.get_dependents("d", transitive=True) == []
+
+    def test_get_ancestors(self, harness):  # noqa: F811
+        cg = self.make_diamond(harness)
+        assert [item.name for item in cg.get_ancestors("d")] == ["a", "b", "c"]
+        assert cg.get_ancestors("a") == []
+
+    def test_add_with_foreign_depends_on_raises(self, harness):  # noqa: F811
+        """Tests that depends_on must be items of the same graph."""
+        other = ComponentGraph()
+        foreign = other.add(MinimallyExtendedComponent(harness.charm, "foreign"))
+        cg = ComponentGraph()
+        with pytest.raises(ValueError):
+            cg.add(MinimallyExtendedComponent(harness.charm, "local"), depends_on=[foreign])
+        assert "local" not in cg.component_items
+
+    def test_add_dependency_reorders(self, harness):  # noqa: F811
+        """Tests that add_dependency updates the topological order."""
+        cg = ComponentGraph()
+        first = cg.add(MinimallyExtendedComponent(harness.charm, "first"))
+        second = cg.add(MinimallyExtendedComponent(harness.charm, "second"))
+
+        cg.add_dependency(first, second)
+
+        assert cg.topological_order() == ["second", "first"]
+        assert first.depends_on == [second]
+        assert [item.name for item in cg.get_executable_component_items()] == ["second"]
+
+    def test_add_dependency_cycle_raises(self, harness):  # noqa: F811
+        """Tests that a dependency that would create a cycle is rejected."""
+        cg = self.make_diamond(harness)
+        with pytest.raises(ValueError):
+            cg.add_dependency(cg.get_by_name("a"), cg.get_by_name("d"))
+        with pytest.raises(ValueError):
+            cg.add_dependency(cg.get_by_name("b"), cg.get_by_name("b"))
+        assert cg.get_by_name("a").depends_on == []
+
+
+class TestCompactState:
+    def test_items_are_views_onto_graph_state(self, harness):  # noqa: F811
+        """Tests that an item's executed flag is stored in the graph's bitset."""
+        cg = ComponentGraph()
+        cgi1 = cg.add(MinimallyExtendedComponent(harness.charm, "component1"))
+        cgi2 = cg.add(MinimallyExtendedComponent(harness.charm, "component2"))
+
+        cgi2.executed = True
+
+        assert cg._executed_mask == 0b10
+        assert cgi1.executed is False
+        assert cgi2.executed is True
+        assert not hasattr(cgi1, "__dict__")
+
+        cgi2.executed = False
+        assert cg._executed_mask == 0
+
+    def test_readiness_on_large_graph(self, harness):  # noqa: F811
+        """Tests executable items of a wide graph with a shared root."""
+        cg = ComponentGraph()
+        root = cg.add(MinimallyExtendedComponent(harness.charm, "root"))
+        leaves = [
+            cg.add(MinimallyExtendedComponent(harness.charm, f"leaf{i}"), depends_on=[root])
+            for i in range(2000)
+        ]
+
+        assert cg.get_executable_component_items() == [root]
+
+        root.executed = True
+        root.component.configure_charm("mock event")
+
+        assert cg.get_executable_component_items() == leaves
+
+        for leaf in leaves:
+            leaf.executed = True
+        assert cg.get_executable_component_items() == []
+
+
+class FingerprintedComponent(MinimallyExtendedComponent):
+    """A Component whose fingerprint can be set by tests."""
+
+    fingerprint_value = "fingerprint"
+
+    def fingerprint(self):
+        return self.fingerprint_value
+
+
+class TestExecutionState:
+    def make_graph(self, harness):  # noqa: F811
+        cg = ComponentGraph()
+        fingerprinted = cg.add(FingerprintedComponent(harness.charm, "fingerprinted"))
+        cg.add(MinimallyExtendedComponent(harness.charm, "plain"), depends_on=[fingerprinted])
+        return cg
+
+    def test_restore_completed_items_with_matching_fingerprints(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        for item in cg.yield_executable_component_items():
+            cg.record_completion(item.name, item.component.fingerprint())
+            item.component.configure_charm("mock event")
+        state = cg.export_execution_state()
+
+        assert state["plan"] == ["fingerprinted", "plain"]
+        assert state["completed"] == {"fingerprinted": "fingerprint"}
+
+        # Simulate a new dispatch, where nothing has executed yet
+        for item in cg.component_items.values():
+            item.executed = False
+
+        assert cg.restore_execution_state(state) == ["fingerprinted"]
+        assert cg.get_by_name("fingerprinted").executed is True
+        assert cg.get_by_name("plain").executed is False
+
+    def test_restore_skips_changed_fingerprints(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        cg.record_completion("fingerprinted", "old fingerprint")
+
+        assert cg.restore_execution_state(cg.export_execution_state()) == []
+        assert cg.get_by_name("fingerprinted").executed is False
+
+    def test_restore_skips_changed_structure(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        cg.record_completion("fingerprinted", "fingerprint")
+        state = cg.export_execution_state()
+
+        cg.add(MinimallyExtendedComponent(harness.charm, "new"))
+
+        assert cg.structure_hash() != state["structure_hash"]
+        assert cg.restore_execution_state(state) == []
+
+    def test_restore_treats_failing_fingerprint_as_changed(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        cg.record_completion("fingerprinted", "fingerprint")
+        state = cg.export_execution_state()
+
+        def fingerprint():
+            raise KeyError("relation data missing")
+
+        cg.get_by_name("fingerprinted").component.fingerprint = fingerprint
+
+        assert cg.restore_execution_state(state) == []
+        assert cg.get_by_name("fingerprinted").executed is False
+
+
+class TestSummarise:
+    def make_graph(self, harness):  # noqa: F811
+        cg = ComponentGraph()
+        fingerprinted = cg.add(FingerprintedComponent(harness.charm, "fingerprinted"))
+        cg.add(MinimallyBlockedComponent(harness.charm, "plain"), depends_on=[fingerprinted])
+        return cg
+
+    def test_summary_reports_last_seen_state(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        fingerprinted = cg.get_by_name("fingerprinted")
+        cg.record_completion("fingerprinted", "fingerprint")
+        fingerprinted.component.configure_charm("mock event")
+        fingerprinted.executed = True
+        cg.record_timings([ComponentTiming("fingerprinted", 0.5, 1.0)])
+        cg.status
+
+        summary = cg.summarise()
+
+        assert summary.order == ("fingerprinted", "plain")
+        first, second = summary.components
+        assert (first.executed, first.status, first.fingerprint) == (True, "active", "fingerprint")
+        assert first.duration == 0.5
+        assert (second.executed, second.status, second.depends_on) == (
+            False,
+            "maintenance",
+            ("fingerprinted",),
+        )
+        assert "fingerprinted [executed] (active: )" in summary.format()
+
+    def test_summary_evaluates_nothing(self, harness):  # noqa: F811
+        """Tests that summarise does not evaluate statuses, and is cached until state changes."""
+        cg = self.make_graph(harness)
+        with patch.object(
+            MinimallyBlockedComponent, "status", new_callable=PropertyMock
+        ) as status:
+            summary = cg.summarise()
+            assert status.call_count == 0
+
+        assert summary.components[1].status is None
+        assert cg.summarise() is summary
+        cg.get_by_name("plain").executed = True
+        assert cg.summarise() is not summary
+
+    def test_summary_state_round_trip(self, harness):  # noqa: F811
+        cg = self.make_graph(harness)
+        cg.status
+        cg.record_timings([ComponentTiming("plain", 0.25, None, True)])
+        state = cg.export_summary_state()
+
+        # Simulate a new dispatch, where the graph starts from scratch
+        restored = ComponentGraph()
+        fingerprinted = restored.add(cg.get_by_name("fingerprinted").component)
+        restored.add(cg.get_by_name("plain").component, depends_on=[fingerprinted])
+        restored.restore_summary_state(state)
+        summary = restored.summarise({"completed": {"fingerprinted": "fingerprint"}})
+
+        first, second = summary.components
+        assert (first.executed, first.fingerprint) == (True, "fingerprint")
+        assert (second.status, second.waiting_on) == ("maintenance", ("fingerprinted",))
+        assert (second.duration, second.timed_out) == (0.25, True)
+
+
+class TestDirtyPropagation:
+    def make_executed_diamond(self, harness):  # noqa: F811
+        cg = TestIndexes().make_diamond(harness)
+        for item in cg.component_items.values():
+            item.executed = True
+            item.component.configure_charm("mock event")
+        return cg
+
+    def test_mark_dirty_propagates_downstream(self, harness):  # noqa: F811
+        cg = self.make_executed_diamond(harness)
+
+        assert cg.mark_dirty("b") == ["b", "d"]
+        assert [name for name, item in cg.component_items.items() if not item.executed] == [
+            "b",
+            "d",
+        ]
+        assert cg.get_executable_component_items() == [cg.get_by_name("b")]
+
+    def test_mark_dirty_for_event(self, harness):  # noqa: F811
+        cg = self.make_executed_diamond(harness)
+        cg.get_by_name("c").component._events_to_observe = [harness.charm.on.config_changed]
+
+        dirty = cg.mark_dirty_for_event(MockEvent(harness.charm.on.config_changed))
+        assert dirty == ["c", "d"]
+
+        assert cg.mark_dirty_for_event(MockEvent(harness.charm.on.update_status)) == []
+
+    def test_mark_inactive_dirty(self, harness):  # noqa: F811
+        cg = self.make_executed_diamond(harness)
+        # Make "c" lose whatever work it had done
+        cg.get_by_name("c").component._completed_work = None
+
+        assert cg.mark_inactive_dirty() == ["c", "d"]
+        assert cg.get_by_name("b").executed is True
+
+    def test_restore_marks_changed_fingerprints_dirty_downstream(self, harness):  # noqa: F811
+        cg = ComponentGraph()
+        upstream = cg.add(FingerprintedComponent(harness.charm, "upstream"))
+        cg.add(FingerprintedComponent(harness.charm, "downstream"), depends_on=[upstream])
+        cg.record_completion("upstream", "old fingerprint")
+        cg.record_completion("downstream", "fingerprint")
+
+        assert cg.restore_execution_state(cg.export_execution_state()) == []
+
+
+class TestMarkTimedOut:
+    def test_timed_out_item_is_waiting_until_dirty(self, harness):  # noqa: F811
+        cg = TestDirtyPropagation().make_executed_diamond(harness)
+        cg.record_completion("b", "fingerprint")
+
+        status = cg.mark_timed_out("b", 1.5)
+
+        assert status == WaitingStatus("Timed out after 1.5s configuring.")
+        assert cg.get_by_name("b").status == status
+        assert cg.get_by_name("d").status == MaintenanceStatus(
+            "Execution pending - waiting on b (waiting: Timed out after 1.5s configuring.)."
+        )
+        assert "b" not in cg.export_execution_state()["completed"]
+
+        cg.mark_dirty("b")
+        assert cg.get_status_override("b") is None
+
+
+class TestAddFactory:
+    def make_factory(self, harness, name, built):  # noqa: F811
+        def factory():
+            built.append(name)
+            return MinimallyExtendedComponent(harness.charm, name)
+
+        return factory
+
+    def test_component_built_on_first_use(self, harness):  # noqa: F811
+        built = []
+        cg = ComponentGraph()
+        config_changed = harness.charm.on.config_changed
+        item = cg.add_factory(
+            "lazy", self.make_factory(harness, "lazy", built), events_to_observe=[config_changed]
+        )
+
+        assert cg.get_events_to_observe() == [config_changed]
+        structure_hash = cg.structure_hash()
+        assert not item.built and built == []
+
+        assert item.component is item.component
+        assert item.built and built == ["lazy"]
+        assert cg.structure_hash() == structure_hash
+
+    def test_only_needed_components_are_built(self, harness):  # noqa: F811
+        built = []
+        cg = ComponentGraph()
+        blocked = cg.add(MinimallyBlockedComponent(harness.charm, "blocked"))
+        cg.add_factory(
+            "after-blocked", self.make_factory(harness, "after-blocked", built), [blocked]
+        )
+        blocked.executed = True
+
+        assert cg.get_executable_component_items() == []
+        assert built == []
+
+    def test_factory_must_build_declared_name(self, harness):  # noqa: F811
+        cg = ComponentGraph()
+        item = cg.add_factory("declared", self.make_factory(harness, "other", []))
+
+        with pytest.raises(ValueError, match="built a component named 'other'"):
+            item.component
+
+    def test_item_requires_component_or_factory(self):
+        with pytest.raises(ValueError):
+            ComponentGraphItem()
+
+
+class MockEvent:
+    def __init__(self, bound_event):
+        self.handle = Handle(bound_event.emitter, bound_event.event_kind, None)
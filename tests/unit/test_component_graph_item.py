@@ -1,9 +1,13 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import sys
+
 import pytest
 from fixtures import (  # noqa
     COMPONENT_NAME,
+    CountingComponent,
+    MinimallyExtendedComponent,
     component_active_factory,
     component_graph_item_active_factory,
     component_graph_item_factory,
@@ -14,7 +18,7 @@ from fixtures import (  # noqa
 )
 from ops import ActiveStatus, MaintenanceStatus, WaitingStatus
 
-from functional_base_charm.component_graph_item import ComponentGraphItem
+from functional_base_charm.component_graph_item import ComponentGraphItem, WaitReason
 
 
 class TestExecuted:
@@ -63,6 +67,30 @@ class TestReadyForExecution:
         assert component_graph_item.ready_for_execution is True
 
 
+class TestWrapComponent:
+    def test_wraps_built_component(self, harness):  # noqa: F811
+        """Tests that a built Component is wrapped at once."""
+        component = MinimallyExtendedComponent(harness.charm, "built")
+        item = ComponentGraphItem(component=component)
+        wrapped = []
+
+        item.wrap_component(lambda c: wrapped.append(c) or c)
+
+        assert wrapped == [component]
+
+    def test_wraps_factory_component_when_built(self, harness):  # noqa: F811
+        """Tests that a factory's Component is wrapped when built, without building it."""
+        factory = lambda: MinimallyExtendedComponent(harness.charm, "lazy")  # noqa: E731
+        item = ComponentGraphItem(name="lazy", factory=factory)
+        wrapped = []
+
+        item.wrap_component(lambda c: wrapped.append(c) or c)
+
+        assert item.built is False and wrapped == []
+        assert wrapped == [item.component]
+        assert item.kind == f"factory:{factory.__qualname__}"
+
+
 class TestStatus:
     def test_prerequisites_inactive(
         self, component_graph_item_with_depends_not_active_factory  # noqa: F811
@@ -142,3 +170,84 @@ class TestInactivePrerequisites:
             ],
         )
         assert len(cgi._inactive_prerequisites()) == 2
+
+
+def make_chain(harness, length, executed=True):  # noqa: F811
+    """Returns a list of ComponentGraphItems where each depends on the one before it."""
+    items = []
+    for i in range(length):
+        cgi = ComponentGraphItem(
+            component=CountingComponent(charm=harness.charm, name=f"link{i}"),
+            depends_on=items[-1:],
+        )
+        cgi.executed = executed
+        items.append(cgi)
+    return items
+
+
+class TestWaitReason:
+    def test_deep_chain_evaluates_each_component_once(self, harness):  # noqa: F811
+        """Tests that status on a 30-deep chain evaluates each Component's status once."""
+        chain = make_chain(harness, 30)
+
+        status = chain[-1].status
+
+        assert isinstance(status, MaintenanceStatus)
+        assert [cgi.component.status_evaluations for cgi in chain] == [1] + [0] * 29
+
+    def test_active_chain_evaluates_each_component_once(self, harness):  # noqa: F811
+        """Tests that an Active 30-deep chain evaluates every Component status exactly once."""
+        chain = make_chain(harness, 30)
+        for cgi in chain:
+            cgi.component.configure_charm("mock event")
+
+        assert isinstance(chain[-1].status, ActiveStatus)
+        assert all(cgi.component.status_evaluations == 1 for cgi in chain)
+
+    def test_chain_deeper_than_recursion_limit(self, harness):  # noqa: F811
+        """Tests that a chain deeper than the recursion limit is evaluated without recursing."""
+        chain = make_chain(harness, sys.getrecursionlimit() + 100)
+
+        status = chain[-1].status
+
+        assert isinstance(status, MaintenanceStatus)
+        assert chain[0].component.status_evaluations == 1
+        assert all(cgi.component.status_evaluations == 0 for cgi in chain[1:])
+
+    def test_diamond_shares_cache(self, harness):  # noqa: F811
+        """Tests that a shared prerequisite of a diamond is evaluated once."""
+        top = ComponentGraphItem(component=CountingComponent(charm=harness.charm, name="top"))
+        top.executed = True
+        left = ComponentGraphItem(
+            component=CountingComponent(charm=harness.charm, name="left"), depends_on=[top]
+        )
+        right = ComponentGraphItem(
+            component=CountingComponent(charm=harness.charm, name="right"), depends_on=[top]
+        )
+        bottom = ComponentGraphItem(
+            component=CountingComponent(charm=harness.charm, name="bottom"),
+            depends_on=[left, right],
+        )
+
+        cache = {}
+        reason = bottom.wait_reason(cache)
+
+        assert top.component.status_evaluations == 1
+        assert [r.name for r in reason.waiting_on] == ["left", "right"]
+        assert reason.waiting_on[0].waiting_on[0] is reason.waiting_on[1].waiting_on[0]
+
+    def test_message_depth_is_bounded(self, harness):  # noqa: F811
+        """Tests that nested prerequisites are elided beyond the maximum depth."""
+        chain = make_chain(harness, 30)
+
+        message = chain[-1].status.message
+
+        assert message.startswith("Execution pending - waiting on link28 (waiting on link27")
+        assert "..." in message
+        assert "link20" not in message
+
+    def test_format_leaf(self):
+        """Tests formatting a WaitReason that is not waiting on anything."""
+        reason = WaitReason(name="leaf", status=WaitingStatus("not yet"))
+        assert reason.format() == "leaf (waiting: not yet)"
+        assert reason.to_status() == WaitingStatus("not yet")
@@ -0,0 +1,121 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import threading
+import time
+
+import pytest
+from fixtures import harness  # noqa: F401
+
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.context_registry import ContextRegistry
+from functional_base_charm.pebble_component import ContainerFileTemplate
+
+
+def make_registry():
+    """Returns a registry of certificates <- (config, relation) <- rendered."""
+    registry = ContextRegistry()
+    registry.register("certificates", lambda: {"cert": "CERT"})
+    registry.register("relation", lambda: {"host": "db"})
+    registry.register(
+        "rendered",
+        lambda certificates, relation: {**certificates, **relation},
+        depends_on=["certificates", "relation"],
+    )
+    return registry
+
+
+class TestGet:
+    def test_computed_once(self):
+        registry = make_registry()
+
+        assert registry.get("rendered") == {"cert": "CERT", "host": "db"}
+        assert registry.get("rendered") == {"cert": "CERT", "host": "db"}
+        registry.get("certificates")
+
+        assert registry.computations == {"certificates": 1, "relation": 1, "rendered": 1}
+
+    def test_computed_once_across_threads(self):
+        """Tests that threads asking for a context at once share one computation."""
+        registry = ContextRegistry()
+        registry.register("slow", lambda: time.sleep(0.05) or {"cert": "CERT"})
+        registry.register("derived", lambda slow: {**slow, "host": "db"}, depends_on=["slow"])
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(registry.get("derived")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [{"cert": "CERT", "host": "db"}] * 4
+        assert registry.computations == {"slow": 1, "derived": 1}
+
+    def test_unregistered(self):
+        with pytest.raises(KeyError):
+            ContextRegistry().get("missing")
+
+    def test_getter_as_context_function(self):
+        registry = make_registry()
+        templates = [
+            ContainerFileTemplate("a.j2", "/a", context_function=registry.getter("rendered")),
+            ContainerFileTemplate("b.j2", "/b", context_function=registry.getter("rendered")),
+        ]
+
+        contexts = [template.context_function() for template in templates]
+
+        assert contexts[0] is contexts[1]
+        assert registry.computations["rendered"] == 1
+
+
+class TestRegister:
+    def test_dependencies_must_be_registered(self):
+        registry = ContextRegistry()
+
+        with pytest.raises(ValueError, match="not registered"):
+            registry.register("rendered", lambda certificates: {}, depends_on=["certificates"])
+
+    def test_duplicate_key(self):
+        registry = make_registry()
+
+        with pytest.raises(ValueError, match="already registered"):
+            registry.register("relation", lambda: {})
+
+
+class TestInvalidate:
+    def test_invalidation_cascades_to_dependents(self):
+        registry = make_registry()
+        registry.get("rendered")
+
+        assert sorted(registry.invalidate("relation")) == ["relation", "rendered"]
+        registry.get("rendered")
+
+        assert registry.computations == {"certificates": 1, "relation": 2, "rendered": 2}
+
+    def test_invalidate_uncomputed(self):
+        registry = make_registry()
+        registry.get("certificates")
+
+        assert registry.invalidate("relation") == []
+        assert registry.get("certificates") == {"cert": "CERT"}
+        assert registry.computations["certificates"] == 1
+
+    def test_clear(self):
+        registry = make_registry()
+        registry.get("rendered")
+
+        registry.clear()
+        registry.get("rendered")
+
+        assert registry.computations["rendered"] == 2
+
+
+class TestCharmReconcilerContexts:
+    def test_reconciler_shares_graph_registry(self, harness):  # noqa: F811
+        charm_reconciler = CharmReconciler(harness.charm)
+
+        charm_reconciler.contexts.register("relation", lambda: {"host": "db"})
+
+        assert charm_reconciler._component_graph.contexts.get("relation") == {"host": "db"}
@@ -0,0 +1,200 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import asyncio
+import pstats
+import threading
+from unittest.mock import patch
+
+import lightkube
+from lightkube.resources.core_v1 import ConfigMap
+from ops import ActiveStatus, CharmBase, StatusBase
+
+from functional_base_charm import graph_profiler
+from functional_base_charm.async_component import AsyncComponent
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.component import Component
+from functional_base_charm.graph_profiler import (
+    UNATTRIBUTED,
+    GraphProfiler,
+    profile_charm,
+)
+from functional_base_charm.reconcile_tracing import in_current_context
+
+META = """
+name: profiled-charm
+containers:
+  workload:
+    resource: image
+resources:
+  image:
+    type: oci-image
+"""
+
+
+class ListingComponent(Component):
+    """A Component that lists from Kubernetes when configured and when its status is checked."""
+
+    def _configure_unit(self, event):
+        lightkube.Client().list(ConfigMap)
+
+    @property
+    def status(self) -> StatusBase:
+        lightkube.Client().list(ConfigMap)
+        return ActiveStatus()
+
+
+class PushingComponent(Component):
+    """A Component that pushes a file to its container."""
+
+    def _configure_unit(self, event):
+        self._charm.unit.get_container("workload").push("/config", "data")
+
+    @property
+    def status(self) -> StatusBase:
+        return ActiveStatus()
+
+
+class SleepingAsyncComponent(AsyncComponent):
+    async def _configure_unit_async(self, event):
+        await asyncio.sleep(0)
+
+    async def get_status(self) -> StatusBase:
+        return ActiveStatus()
+
+
+class ProfiledCharm(CharmBase):
+    def __init__(self, framework):
+        super().__init__(framework)
+        self.charm_reconciler = CharmReconciler(self)
+        lister = self.charm_reconciler.add(ListingComponent(self, "lister"))
+        self.charm_reconciler.add(PushingComponent(self, "pusher"), depends_on=[lister])
+        self.charm_reconciler.add_factory(
+            "async", lambda: SleepingAsyncComponent(self, "async"), depends_on=[lister]
+        )
+        self.charm_reconciler.install(self)
+
+
+class TestProfileCharm:
+    def test_per_component_breakdown(self):
+        """Tests that configure, status and external calls are attributed to each Component."""
+        result = profile_charm(ProfiledCharm, ["config_changed"], meta=META)
+
+        lister = result.components["lister"]
+        assert lister.configure_calls == 1
+        assert lister.status_calls >= 1
+        assert lister.external_calls["k8s.list"] == 1 + lister.status_calls
+        assert result.components["pusher"].external_calls["pebble.push"] == 1
+        assert result.components["async"].configure_calls == 1
+        assert UNATTRIBUTED not in result.components
+
+    def test_fake_latency(self):
+        result = profile_charm(ProfiledCharm, ["config_changed"], meta=META, pebble_latency=0.05)
+
+        assert result.components["pusher"].configure_time >= 0.05
+        assert result.event_durations[0] >= 0.05
+
+    def test_collapsed_stacks(self):
+        result = profile_charm(ProfiledCharm, ["config_changed"], meta=META)
+
+        assert "config_changed;lister.configure;k8s.list" in result.collapsed_stacks
+        assert "config_changed;pusher.configure;pebble.push" in result.collapsed_stacks
+
+
+class TestInstrument:
+    def test_components_are_proxied_not_mutated(self):
+        """Tests that instrumented Components keep their class, and are timed through a proxy."""
+        from ops.testing import Harness
+
+        harness = Harness(ProfiledCharm, meta=META)
+        harness.begin()
+        graph = harness.charm.charm_reconciler.component_graph
+        lister = graph.component_items["lister"].component
+        profiler = GraphProfiler()
+
+        profiler.instrument(graph)
+
+        assert type(lister) is ListingComponent
+        proxy = graph.component_items["lister"].component
+        assert proxy is not lister and isinstance(proxy, ListingComponent)
+        assert graph.component_items["lister"].kind == "ListingComponent"
+        assert isinstance(graph.component_items["async"].component, AsyncComponent)
+        assert type(graph.component_items["async"].component._component) is SleepingAsyncComponent
+        with patch("lightkube.Client"):
+            proxy.status
+        assert profiler.components["lister"].status_calls == 1
+        harness.cleanup()
+
+
+class TestMain:
+    def test_writes_report_and_profiles(self, tmp_path, monkeypatch, capsys):
+        (tmp_path / "metadata.yaml").write_text(META)
+        monkeypatch.setattr(graph_profiler, "_load_charm", lambda path, charm_dir: ProfiledCharm)
+
+        exit_code = graph_profiler.main(
+            [
+                "charm:ProfiledCharm",
+                "--charm-dir",
+                str(tmp_path),
+                "--event",
+                "install",
+                "--event",
+                "config_changed",
+                "--cprofile",
+                str(tmp_path / "out.prof"),
+                "--collapsed",
+                str(tmp_path / "out.folded"),
+            ]
+        )
+
+        assert exit_code == 0
+        output = capsys.readouterr().out
+        assert "lister" in output and "k8s.list=" in output
+        assert "install: " in output and "config_changed: " in output
+        pstats.Stats(str(tmp_path / "out.prof"))
+        folded = (tmp_path / "out.folded").read_text().splitlines()
+        assert any(line.startswith("install;pusher.configure;pebble.push ") for line in folded)
+
+
+class TestThreads:
+    def test_frames_are_kept_per_thread(self):
+        """Tests that Components timed on concurrent threads do not share a stack."""
+        profiler = GraphProfiler()
+        barrier = threading.Barrier(2)
+
+        def work(name):
+            with profiler._component_frame(name, "configure"):
+                barrier.wait()
+                with profiler.external_call("k8s.list", 0.01):
+                    barrier.wait()
+
+        threads = [threading.Thread(target=work, args=(name,)) for name in ["a", "b"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert profiler.components["a"].external_calls == {"k8s.list": 1}
+        assert profiler.components["b"].external_calls == {"k8s.list": 1}
+        assert set(profiler.collapsed_stacks) == {
+            "a.configure",
+            "a.configure;k8s.list",
+            "b.configure",
+            "b.configure;k8s.list",
+        }
+
+    def test_worker_frames_nest_under_submitter(self):
+        """Tests that work run in_current_context is charged to the Component submitting it."""
+        profiler = GraphProfiler()
+
+        def call():
+            with profiler.external_call("pebble.exists", 0.0):
+                pass
+
+        with profiler._component_frame("a", "status"):
+            thread = threading.Thread(target=in_current_context(call))
+            thread.start()
+            thread.join()
+
+        assert profiler.components["a"].external_calls == {"pebble.exists": 1}
+        assert "a.status;pebble.exists" in profiler.collapsed_stacks
@@ -0,0 +1,321 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from unittest.mock import MagicMock, patch
+
+import httpx
+import lightkube
+import pytest
+from charmed_kubeflow_chisme.exceptions import GenericCharmRuntimeError
+from fixtures import harness  # noqa: F401
+from lightkube.config.kubeconfig import KubeConfig
+from lightkube.core import generic_client
+from lightkube.core.exceptions import ApiError
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.apps_v1 import Deployment
+from lightkube.resources.core_v1 import ConfigMap
+from lightkube.resources.rbac_authorization_v1 import ClusterRole
+from ops import WaitingStatus
+
+from functional_base_charm.kubernetes_component import KubernetesComponent
+from functional_base_charm.kubernetes_session import KubernetesSession
+
+# The httpx module of the installed lightkube, whose transports its Client accepts
+lightkube_httpx = generic_client.httpx
+
+LABELS = {"app.juju.is/created-by": "test", "part-of": "component"}
+
+
+def api_error(code: int) -> ApiError:
+    response = httpx.Response(
+        code,
+        json={"code": code, "message": "", "status": "Failure", "kind": "Status", "metadata": {}},
+        request=httpx.Request("DELETE", "http://localhost"),
+    )
+    return ApiError(response=response)
+
+
+def make_component(harness, lightkube_client, **kwargs):  # noqa: F811
+    return KubernetesComponent(
+        harness.charm,
+        "kubernetes",
+        resource_templates=[],
+        krh_child_resource_types=[ConfigMap, ClusterRole],
+        krh_labels=LABELS,
+        lightkube_client=lightkube_client,
+        bulk_delete=True,
+        **kwargs,
+    )
+
+
+class TestBulkDelete:
+    def test_one_collection_delete_per_type(self, harness):  # noqa: F811
+        """Tests that each type is deleted by label, in each namespace holding labelled objects."""
+        client = MagicMock()
+        client.list.return_value = [
+            ConfigMap(metadata=ObjectMeta(name=f"cm{i}", namespace="model")) for i in range(100)
+        ]
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+        # One list to find the namespaces of the namespaced type, none for the global type
+        client.list.assert_called_once_with(ConfigMap, namespace="*", labels=LABELS)
+        requests = client._client.request.call_args_list
+        assert len(requests) == 2
+        selector = "app.juju.is/created-by=test,part-of=component"
+        assert {(call.kwargs["res"], call.kwargs["namespace"]) for call in requests} == {
+            (ConfigMap, "model"),
+            (ClusterRole, None),
+        }
+        for call in requests:
+            assert call.args == ("deletecollection",)
+            assert call.kwargs["params"] == {"labelSelector": selector}
+
+    def test_missing_types_are_ignored(self, harness):  # noqa: F811
+        """Tests that a 404, such as for a type whose CRD is not installed, is ignored."""
+        client = MagicMock()
+        client.list.side_effect = api_error(404)
+        client._client.request.side_effect = api_error(404)
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+    def test_errors_are_raised_after_all_types(self, harness):  # noqa: F811
+        """Tests that a failed delete is raised, after every type has been attempted."""
+        client = MagicMock()
+        client.list.return_value = []
+        client._client.request.side_effect = api_error(403)
+        component = make_component(harness, client)
+
+        with pytest.raises(GenericCharmRuntimeError):
+            component.remove("mock event")
+
+        assert client._client.request.call_count == 1
+
+    def test_real_lightkube_client(self, harness):  # noqa: F811
+        """Tests the collection deletes made through the installed lightkube's generic client."""
+        requests = []
+
+        def handle(request):
+            requests.append((request.method, request.url.path, dict(request.url.params)))
+            if request.method == "GET":
+                return lightkube_httpx.Response(
+                    200,
+                    json={
+                        "apiVersion": "v1",
+                        "kind": "ConfigMapList",
+                        "metadata": {},
+                        "items": [{"metadata": {"name": "cm", "namespace": "model"}}],
+                    },
+                )
+            return lightkube_httpx.Response(200, json={"kind": "Status", "status": "Success"})
+
+        client = lightkube.Client(
+            config=KubeConfig.from_dict(
+                {
+                    "clusters": [{"name": "test", "cluster": {"server": "http://kubernetes"}}],
+                    "users": [{"name": "test", "user": {"token": "token"}}],
+                    "contexts": [{"name": "test", "context": {"cluster": "test", "user": "test"}}],
+                    "current-context": "test",
+                }
+            ),
+            transport=lightkube_httpx.MockTransport(handle),
+        )
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+        selector = {"labelSelector": "app.juju.is/created-by=test,part-of=component"}
+        assert sorted(request for request in requests if request[0] == "DELETE") == [
+            ("DELETE", "/api/v1/namespaces/model/configmaps", selector),
+            ("DELETE", "/apis/rbac.authorization.k8s.io/v1/clusterroles", selector),
+        ]
+
+    def test_client_without_generic_client(self, harness):  # noqa: F811
+        """Tests that resources are deleted one by one if the client has no generic client."""
+        client = MagicMock(spec=["list", "delete"])
+        client.list.side_effect = lambda res, **kwargs: (
+            [ConfigMap(metadata=ObjectMeta(name="cm", namespace="model"))]
+            if res is ConfigMap
+            else []
+        )
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+        client.delete.assert_called_once_with(ConfigMap, "cm", namespace="model")
+
+    @patch("functional_base_charm.kubernetes_component.FINALIZER_POLL_INTERVAL", 0)
+    def test_wait_for_finalizers(self, harness):  # noqa: F811
+        """Tests that remove waits until the labelled resources are gone."""
+        client = MagicMock()
+        remaining = [[ConfigMap(metadata=ObjectMeta(name="cm", namespace="model"))]] * 3
+        client.list.side_effect = lambda res, **kwargs: (
+            remaining.pop() if res is ConfigMap and remaining else []
+        )
+        component = make_component(harness, client, wait_for_finalizers=True)
+
+        component.remove("mock event")
+
+        assert remaining == []
+
+    def test_real_lightkube_client(self, harness):  # noqa: F811
+        """Tests the collection deletes made through the installed lightkube's generic client."""
+        requests = []
+
+        def handle(request):
+            requests.append((request.method, request.url.path, dict(request.url.params)))
+            if request.method == "GET":
+                return lightkube_httpx.Response(
+                    200,
+                    json={
+                        "apiVersion": "v1",
+                        "kind": "ConfigMapList",
+                        "metadata": {},
+                        "items": [{"metadata": {"name": "cm", "namespace": "model"}}],
+                    },
+                )
+            return lightkube_httpx.Response(200, json={"kind": "Status", "status": "Success"})
+
+        client = lightkube.Client(
+            config=KubeConfig.from_dict(
+                {
+                    "clusters": [{"name": "test", "cluster": {"server": "http://kubernetes"}}],
+                    "users": [{"name": "test", "user": {"token": "token"}}],
+                    "contexts": [{"name": "test", "context": {"cluster": "test", "user": "test"}}],
+                    "current-context": "test",
+                }
+            ),
+            transport=lightkube_httpx.MockTransport(handle),
+        )
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+        selector = {"labelSelector": "app.juju.is/created-by=test,part-of=component"}
+        assert sorted(request for request in requests if request[0] == "DELETE") == [
+            ("DELETE", "/api/v1/namespaces/model/configmaps", selector),
+            ("DELETE", "/apis/rbac.authorization.k8s.io/v1/clusterroles", selector),
+        ]
+
+    def test_client_without_generic_client(self, harness):  # noqa: F811
+        """Tests that resources are deleted one by one if the client has no generic client."""
+        client = MagicMock(spec=["list", "delete"])
+        client.list.side_effect = lambda res, **kwargs: (
+            [ConfigMap(metadata=ObjectMeta(name="cm", namespace="model"))]
+            if res is ConfigMap
+            else []
+        )
+        component = make_component(harness, client)
+
+        component.remove("mock event")
+
+        client.delete.assert_called_once_with(ConfigMap, "cm", namespace="model")
+
+    @patch("functional_base_charm.kubernetes_component.FINALIZER_POLL_INTERVAL", 0)
+    def test_wait_for_finalizers_times_out(self, harness):  # noqa: F811
+        client = MagicMock()
+        client.list.return_value = [ConfigMap(metadata=ObjectMeta(name="cm", namespace="model"))]
+        component = make_component(
+            harness, client, wait_for_finalizers=True, finalizer_timeout=0.01
+        )
+
+        with pytest.raises(GenericCharmRuntimeError, match="ConfigMap"):
+            component.remove("mock event")
+
+
+class TestKubernetesSession:
+    def test_components_share_listed_resources(self, harness):  # noqa: F811
+        """Tests that Components sharing a session list each type and label set once."""
+        client = MagicMock()
+        client.list.return_value = []
+        session = KubernetesSession(client)
+        components = [
+            KubernetesComponent(
+                harness.charm,
+                name,
+                resource_templates=[],
+                krh_child_resource_types=[ConfigMap],
+                krh_labels=LABELS,
+                kubernetes_session=session,
+            )
+            for name in ("first", "second")
+        ]
+
+        for component in components:
+            assert component._get_deployed_resources(None) == []
+
+        client.list.assert_called_once_with(ConfigMap, namespace="*", labels=LABELS)
+        assert components[1]._lightkube_client is client
+
+    def test_requires_a_client_or_session(self, harness):  # noqa: F811
+        with pytest.raises(ValueError):
+            KubernetesComponent(
+                harness.charm,
+                "kubernetes",
+                resource_templates=[],
+                krh_child_resource_types=[ConfigMap],
+                krh_labels=LABELS,
+            )
+
+
+class TestReadiness:
+    def test_status_waits_for_readiness(self, harness):  # noqa: F811
+        """Tests that a Component checking readiness is Waiting until its Deployment rolls out."""
+        harness.set_leader(True)
+        deployment = Deployment.from_dict(
+            {
+                "metadata": {"name": "app", "namespace": "model", "generation": 1},
+                "spec": {"replicas": 1, "selector": {}, "template": {}},
+                "status": {"observedGeneration": 1, "updatedReplicas": 1},
+            }
+        )
+        client = MagicMock()
+        session = KubernetesSession(client)
+        client.list.side_effect = lambda res, **kwargs: [deployment] if res is Deployment else []
+        component = KubernetesComponent(
+            harness.charm,
+            "kubernetes",
+            resource_templates=[],
+            krh_child_resource_types=[Deployment],
+            krh_labels=LABELS,
+            kubernetes_session=session,
+            check_readiness=True,
+        )
+
+        with patch.object(component, "_get_missing_kubernetes_resources", return_value=[]):
+            assert component.status == WaitingStatus(
+                "Waiting for resources to be ready: "
+                "Deployment/model/app (0/1 replicas available)"
+            )
+
+    def test_status_lists_each_type_once_without_session(self, harness):  # noqa: F811
+        """Tests that readiness reuses the lists status fetched, without a KubernetesSession."""
+        harness.set_leader(True)
+        deployment = Deployment.from_dict(
+            {
+                "metadata": {"name": "app", "namespace": "model", "generation": 1},
+                "spec": {"replicas": 1, "selector": {}, "template": {}},
+                "status": {"observedGeneration": 1, "updatedReplicas": 1},
+            }
+        )
+        client = MagicMock()
+        client.list.side_effect = lambda res, **kwargs: [deployment] if res is Deployment else []
+        component = KubernetesComponent(
+            harness.charm,
+            "kubernetes",
+            resource_templates=[],
+            krh_child_resource_types=[Deployment],
+            krh_labels=LABELS,
+            lightkube_client=client,
+            check_readiness=True,
+        )
+
+        with patch("functional_base_charm.kubernetes_component.load_in_cluster_generic_resources"):
+            assert component.status == WaitingStatus(
+                "Waiting for resources to be ready: "
+                "Deployment/model/app (0/1 replicas available)"
+            )
+
+        assert [c.args[0] for c in client.list.call_args_list] == [Deployment]
@@ -0,0 +1,144 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+from lightkube.generic_resource import create_namespaced_resource
+from lightkube.resources.apps_v1 import Deployment, StatefulSet
+from lightkube.resources.batch_v1 import Job
+from lightkube.resources.core_v1 import ConfigMap
+from ops import ActiveStatus, WaitingStatus
+
+from functional_base_charm.kubernetes_readiness import (
+    ReadinessVerdict,
+    ResourceReadiness,
+    evaluate_readiness,
+    evaluate_resource,
+)
+
+Profile = create_namespaced_resource("kubeflow.org", "v1", "Profile", "profiles")
+
+
+def deployment(replicas=2, generation=2, **status):
+    return Deployment.from_dict(
+        {
+            "metadata": {"name": "app", "namespace": "model", "generation": generation},
+            "spec": {"replicas": replicas, "selector": {}, "template": {}},
+            "status": {"observedGeneration": 2, **status},
+        }
+    )
+
+
+class TestEvaluateResource:
+    @pytest.mark.parametrize(
+        "resource, ready, reason",
+        [
+            (deployment(updatedReplicas=2, availableReplicas=2), True, ""),
+            (deployment(updatedReplicas=1, availableReplicas=2), False, "1/2 replicas updated"),
+            (deployment(updatedReplicas=2, availableReplicas=1), False, "1/2 replicas available"),
+            (
+                deployment(generation=3, updatedReplicas=2, availableReplicas=2),
+                False,
+                "latest generation not yet observed",
+            ),
+            (
+                deployment(
+                    conditions=[
+                        {
+                            "type": "Progressing",
+                            "status": "False",
+                            "reason": "ProgressDeadlineExceeded",
+                        }
+                    ]
+                ),
+                False,
+                "progress deadline exceeded",
+            ),
+        ],
+    )
+    def test_deployment(self, resource, ready, reason):
+        assert evaluate_resource(resource) == ResourceReadiness(
+            "Deployment", "app", "model", ready, reason
+        )
+
+    def test_statefulset(self):
+        statefulset = StatefulSet.from_dict(
+            {
+                "metadata": {"name": "db", "namespace": "model"},
+                "spec": {"replicas": 1, "selector": {}, "serviceName": "db", "template": {}},
+                "status": {
+                    "replicas": 1,
+                    "readyReplicas": 1,
+                    "currentRevision": "db-1",
+                    "updateRevision": "db-2",
+                },
+            }
+        )
+
+        readiness = evaluate_resource(statefulset)
+
+        assert not readiness.ready
+        assert readiness.reason == "rolling update in progress"
+
+    @pytest.mark.parametrize(
+        "condition, ready, reason",
+        [("Complete", True, ""), ("Failed", False, "failed"), (None, False, "not complete")],
+    )
+    def test_job(self, condition, ready, reason):
+        conditions = [{"type": condition, "status": "True"}] if condition else []
+        job = Job.from_dict(
+            {
+                "metadata": {"name": "migrate", "namespace": "model"},
+                "spec": {"template": {}},
+                "status": {"conditions": conditions},
+            }
+        )
+
+        assert (evaluate_resource(job).ready, evaluate_resource(job).reason) == (ready, reason)
+
+    def test_custom_resource_conditions(self):
+        profile = Profile.from_dict(
+            {
+                "metadata": {"name": "user"},
+                "status": {
+                    "conditions": [{"type": "Ready", "status": "False", "message": "syncing"}]
+                },
+            }
+        )
+
+        readiness = evaluate_resource(profile)
+
+        assert readiness == ResourceReadiness(
+            "Profile", "user", None, False, "Ready is False: syncing"
+        )
+
+    def test_resource_without_status_is_ready(self):
+        config_map = ConfigMap.from_dict({"metadata": {"name": "config", "namespace": "model"}})
+
+        assert evaluate_resource(config_map).ready
+
+
+class TestReadinessVerdict:
+    def test_to_status(self):
+        ready = ResourceReadiness("ConfigMap", "config", "model", True)
+        not_ready = [
+            ResourceReadiness("Deployment", f"app{i}", "model", False, "0/1 replicas available")
+            for i in range(5)
+        ]
+
+        assert ReadinessVerdict((ready,)).to_status() == ActiveStatus()
+        verdict = ReadinessVerdict((ready, *not_ready))
+        assert not verdict.ready
+        assert verdict.not_ready == tuple(not_ready)
+        assert verdict.to_status() == WaitingStatus(
+            "Waiting for resources to be ready: "
+            "Deployment/model/app0 (0/1 replicas available), "
+            "Deployment/model/app1 (0/1 replicas available), "
+            "Deployment/model/app2 (0/1 replicas available) and 2 more"
+        )
+
+    def test_evaluate_readiness(self):
+        verdict = evaluate_readiness(
+            [deployment(updatedReplicas=2, availableReplicas=2), deployment()]
+        )
+
+        assert [resource.ready for resource in verdict.resources] == [True, False]
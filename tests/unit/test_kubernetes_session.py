@@ -0,0 +1,87 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from unittest.mock import MagicMock, patch
+
+from lightkube.resources.apps_v1 import Deployment
+from lightkube.resources.core_v1 import ConfigMap
+from lightkube.resources.rbac_authorization_v1 import ClusterRole
+
+from functional_base_charm.kubernetes_session import KubernetesSession
+
+LABELS = {"part-of": "component"}
+DEPLOYMENT = {"metadata": {"name": "app"}, "spec": {"selector": {}, "template": {}}}
+
+
+class TestList:
+    def test_lists_are_cached_by_type_namespace_and_labels(self):
+        client = MagicMock()
+        client.list.side_effect = lambda res, **kwargs: [res.__name__]
+        session = KubernetesSession(client)
+
+        assert session.list(ConfigMap, namespace="*", labels=LABELS) == ["ConfigMap"]
+        assert session.list(ConfigMap, namespace="*", labels=dict(LABELS)) == ["ConfigMap"]
+        session.list(ConfigMap, namespace="model", labels=LABELS)
+        session.list(ConfigMap, namespace="*", labels={"other": "label"})
+
+        assert client.list.call_count == 3
+        assert session.list_requests == 3
+        assert session.list_cache_hits == 1
+
+    def test_list_all_namespaces(self):
+        client = MagicMock()
+        session = KubernetesSession(client)
+
+        session.list_all_namespaces(ConfigMap, LABELS)
+        session.list_all_namespaces(ClusterRole, LABELS)
+
+        client.list.assert_any_call(ConfigMap, namespace="*", labels=LABELS)
+        client.list.assert_any_call(ClusterRole, namespace=None, labels=LABELS)
+
+    def test_invalidate(self):
+        client = MagicMock()
+        session = KubernetesSession(client)
+        session.list(ConfigMap, labels=LABELS)
+        session.list(Deployment, labels=LABELS)
+
+        session.invalidate([ConfigMap])
+        session.list(ConfigMap, labels=LABELS)
+        session.list(Deployment, labels=LABELS)
+        assert client.list.call_count == 3
+
+        session.clear()
+        session.list(Deployment, labels=LABELS)
+        assert client.list.call_count == 4
+
+
+class TestReadiness:
+    def test_one_list_per_kind_and_cached_verdict(self):
+        client = MagicMock()
+        client.list.side_effect = lambda res, **kwargs: (
+            [Deployment.from_dict(DEPLOYMENT)] if res is Deployment else []
+        )
+        session = KubernetesSession(client)
+        # Another component already listed the Deployments
+        session.list_all_namespaces(Deployment, LABELS)
+
+        verdict = session.readiness([Deployment, ConfigMap], LABELS)
+        assert session.readiness([Deployment, ConfigMap], LABELS) is verdict
+
+        assert client.list.call_count == 2
+        assert [resource.name for resource in verdict.not_ready] == ["app"]
+
+        session.invalidate([ConfigMap])
+        assert session.readiness([Deployment, ConfigMap], LABELS) is not verdict
+        assert client.list.call_count == 3
+
+
+class TestDiscovery:
+    @patch("functional_base_charm.kubernetes_session.load_in_cluster_generic_resources")
+    def test_generic_resources_loaded_once(self, load):
+        client = MagicMock()
+        session = KubernetesSession(client)
+
+        session.load_generic_resources()
+        session.load_generic_resources()
+
+        load.assert_called_once_with(client)
@@ -0,0 +1,208 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fixtures import harness  # noqa: F401
+from ops import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+
+from functional_base_charm.multistatus import Prioritiser
+
+
+def slow_status(status, seconds):
+    def get_status():
+        time.sleep(seconds)
+        return status
+
+    return get_status
+
+
+class TestAll:
+    def test_sequential_order(self):
+        """Tests that statuses are ordered by priority, then by the order they were added."""
+        prioritiser = Prioritiser()
+        prioritiser.add("active", lambda: ActiveStatus())
+        prioritiser.add("waiting1", lambda: WaitingStatus("1"))
+        prioritiser.add("blocked", lambda: BlockedStatus("b"))
+        prioritiser.add("waiting2", lambda: WaitingStatus("2"))
+
+        assert [name for name, _ in prioritiser.all()] == [
+            "blocked",
+            "waiting1",
+            "waiting2",
+            "active",
+        ]
+
+    def test_concurrent_matches_sequential_order(self):
+        """Tests that concurrent collection returns the same deterministic order."""
+        prioritiser = Prioritiser(max_workers=4)
+        # Later components finish first, but must not be reordered because of it
+        prioritiser.add("waiting1", slow_status(WaitingStatus("1"), 0.05))
+        prioritiser.add("maintenance", slow_status(MaintenanceStatus("m"), 0.02))
+        prioritiser.add("waiting2", slow_status(WaitingStatus("2"), 0.0))
+
+        assert [name for name, _ in prioritiser.all()] == ["waiting1", "waiting2", "maintenance"]
+
+    def test_concurrent_runs_in_parallel(self):
+        """Tests that statuses are collected concurrently when max_workers is set."""
+        barrier = threading.Barrier(3, timeout=5)
+
+        def get_status():
+            barrier.wait()
+            return ActiveStatus()
+
+        prioritiser = Prioritiser(max_workers=3)
+        for name in ["a", "b", "c"]:
+            prioritiser.add(name, get_status)
+
+        # Would raise BrokenBarrierError if the getters were called one at a time
+        assert isinstance(prioritiser.highest(), ActiveStatus)
+
+    def test_concurrent_timeout(self):
+        """Tests that a component exceeding its timeout is reported as Waiting."""
+        prioritiser = Prioritiser(max_workers=2, timeout=0.05)
+        prioritiser.add("fast", lambda: ActiveStatus())
+        prioritiser.add("slow", slow_status(ActiveStatus(), 1))
+
+        start = time.monotonic()
+        statuses = dict(prioritiser.all())
+
+        assert time.monotonic() - start < 0.5
+        assert isinstance(statuses["fast"], ActiveStatus)
+        assert isinstance(statuses["slow"], WaitingStatus)
+        assert "Timed out" in statuses["slow"].message
+
+    def test_concurrent_timeout_starts_with_getter(self):
+        """Tests that a queued getter times out relative to when it started, not much later."""
+        prioritiser = Prioritiser(max_workers=1, timeout=0.2)
+        prioritiser.add("first", slow_status(ActiveStatus(), 0.15))
+        prioritiser.add("second", slow_status(ActiveStatus(), 2))
+
+        start = time.monotonic()
+        statuses = dict(prioritiser.all())
+
+        # second starts at about 0.15s, so times out at about 0.35s
+        assert time.monotonic() - start < 0.5
+        assert isinstance(statuses["first"], ActiveStatus)
+        assert isinstance(statuses["second"], WaitingStatus)
+
+    def test_timed_out_getter_does_not_hold_process_open(self):
+        """Tests that a getter that times out is left on a thread the interpreter does not join."""
+        prioritiser = Prioritiser(max_workers=1, timeout=0.05)
+        prioritiser.add("hangs", slow_status(ActiveStatus(), 1))
+
+        prioritiser.all()
+
+        running = [t for t in threading.enumerate() if t.name.startswith("prioritiser")]
+        assert running and all(thread.daemon for thread in running)
+
+
+class TestPush:
+    def test_highest_does_not_poll_pushed_components(self):
+        """Tests that highest() uses pushed statuses without calling get_status."""
+        calls = []
+
+        def get_status():
+            calls.append(1)
+            return MaintenanceStatus("initial")
+
+        prioritiser = Prioritiser()
+        prioritiser.add("a", get_status, pushes=True)
+        prioritiser.add("b", pushes=True)
+
+        # The first call seeds "a" from its get_status, as it has not pushed anything yet
+        assert prioritiser.highest() == MaintenanceStatus("[a] initial")
+        assert len(calls) == 1
+
+        prioritiser.push("b", BlockedStatus("b is blocked"))
+        assert prioritiser.highest() == BlockedStatus("[b] b is blocked")
+
+        prioritiser.push("b", ActiveStatus())
+        prioritiser.push("a", ActiveStatus())
+        assert prioritiser.highest() == ActiveStatus()
+        assert len(calls) == 1
+
+    def test_highest_only_polls_components_that_need_it(self):
+        """Tests that highest() does not revisit components once they have pushed."""
+        prioritiser = Prioritiser()
+        for name in ["a", "b", "c"]:
+            prioritiser.add(name, lambda: ActiveStatus(), pushes=True)
+        prioritiser.add("polled", lambda: WaitingStatus("polled"))
+
+        with patch.object(prioritiser, "collect", wraps=prioritiser.collect) as collect:
+            prioritiser.highest()
+            prioritiser.push("a", ActiveStatus())
+            prioritiser.highest()
+
+        assert list(collect.call_args_list[0].args[0]) == ["a", "b", "c", "polled"]
+        assert list(collect.call_args_list[1].args[0]) == ["polled"]
+
+    def test_returning_to_a_priority_does_not_grow_buckets(self):
+        """Tests that cycling a component between priorities keeps one heap entry per priority."""
+        prioritiser = Prioritiser()
+        prioritiser.add("a", pushes=True)
+        prioritiser.add("b", pushes=True)
+        prioritiser.push("b", BlockedStatus("b"))
+
+        for _ in range(100):
+            prioritiser.push("a", ActiveStatus())
+            prioritiser.push("a", WaitingStatus("a"))
+        prioritiser.push("a", ActiveStatus())
+
+        assert sum(len(bucket) for bucket in prioritiser._buckets.values()) <= 3
+        assert prioritiser.highest() == BlockedStatus("[b] b")
+        prioritiser.push("b", ActiveStatus())
+        assert prioritiser.highest() == ActiveStatus()
+
+    def test_ties_broken_by_registration_order(self):
+        """Tests that pushed statuses of equal priority are ordered by registration."""
+        prioritiser = Prioritiser()
+        for name in ["a", "b", "c"]:
+            prioritiser.add(name, pushes=True)
+
+        prioritiser.push("c", WaitingStatus("c"))
+        prioritiser.push("b", WaitingStatus("b"))
+        assert prioritiser.highest() == WaitingStatus("[b] b")
+
+        prioritiser.push("a", WaitingStatus("a"))
+        assert prioritiser.highest() == WaitingStatus("[a] a")
+
+        prioritiser.push("a", ActiveStatus())
+        assert [name for name, _ in prioritiser.all()] == ["b", "c", "a"]
+
+    def test_mixed_push_and_poll(self):
+        """Tests that polled components are still polled alongside pushed ones."""
+        prioritiser = Prioritiser()
+        prioritiser.add("pushed", pushes=True)
+        prioritiser.add("polled", lambda: WaitingStatus("polled"))
+
+        prioritiser.push("pushed", MaintenanceStatus("pushed"))
+        assert prioritiser.highest() == WaitingStatus("[polled] polled")
+
+        prioritiser.push("pushed", BlockedStatus("pushed"))
+        assert prioritiser.highest() == BlockedStatus("[pushed] pushed")
+
+    def test_push_to_polled_component_raises(self):
+        prioritiser = Prioritiser()
+        prioritiser.add("polled", lambda: ActiveStatus())
+        with pytest.raises(ValueError):
+            prioritiser.push("polled", ActiveStatus())
+
+    def test_add_without_get_status_or_push_raises(self):
+        with pytest.raises(ValueError):
+            Prioritiser().add("nothing")
+
+
+class TestInstall:
+    def test_install_sets_status_on_commit(self, harness):  # noqa: F811
+        """Tests that an installed Prioritiser sets the unit status when the framework commits."""
+        prioritiser = Prioritiser()
+        prioritiser.add("component", lambda: BlockedStatus("blocked"))
+
+        prioritiser.install(harness.framework, harness.charm.unit)
+        harness.framework.commit()
+
+        assert harness.charm.unit.status == BlockedStatus("[component] blocked")
@@ -7,10 +7,16 @@ from fixtures import (  # noqa: F401
     MinimalPebbleComponent,
     MinimalPebbleServiceComponent,
     harness_with_container,
+    harness_with_containers,
 )
 from ops import ActiveStatus, WaitingStatus
 
 import functional_base_charm.pebble_component
+from functional_base_charm.pebble_component import (
+    ContainerFileTemplate,
+    MultiContainerPebbleComponent,
+)
+from functional_base_charm.template_renderer import TemplateRenderer
 
 
 class TestPebbleComponent:
@@ -50,6 +56,30 @@ class TestPebbleComponent:
 
         assert isinstance(pc.status, WaitingStatus)
 
+    def test_push_files_with_shared_renderer(self, harness_with_container, tmp_path):  # noqa: F811
+        """Test that files are rendered through a TemplateRenderer shared between Components."""
+        harness_with_container.set_can_connect(self.container_name, True)
+        template = tmp_path / "config.j2"
+        template.write_text("value: {{ value }}")
+        renderer = TemplateRenderer()
+        files = [
+            ContainerFileTemplate(template, f"/etc/{i}.yaml", context_function={"value": 1})
+            for i in range(2)
+        ]
+        pc = MinimalPebbleComponent(
+            charm=harness_with_container.charm,
+            container_name=self.container_name,
+            files_to_push=files,
+            template_renderer=renderer,
+        )
+
+        pc._push_files_to_container()
+
+        container = harness_with_container.charm.unit.get_container(self.container_name)
+        assert container.pull("/etc/1.yaml").read() == "value: 1"
+        stats = renderer.stats[template.resolve()]
+        assert (stats.renders, stats.cache_hits) == (1, 1)
+
 
 class TestPebbleServiceComponent:
     container_name = "test-container"
@@ -184,3 +214,140 @@ class TestPebbleServiceComponent:
         status = pc.status
 
         assert isinstance(status, ActiveStatus)
+
+    def test_verify_status_active_services_running(self, harness_with_container):  # noqa: F811
+        """Test that a cached ActiveStatus is verified while every service is running."""
+        harness_with_container.set_can_connect(self.container_name, True)
+        pc = MinimalPebbleServiceComponent(
+            charm=harness_with_container.charm,
+            container_name=self.container_name,
+            service_name="test-service",
+        )
+
+        assert pc.verify_status(ActiveStatus()) is False
+
+        pc.configure_charm("mock event")
+
+        assert pc.verify_status(ActiveStatus()) is True
+        assert pc.verify_status(WaitingStatus("cached")) is False
+
+        harness_with_container.set_can_connect(self.container_name, False)
+        assert pc.verify_status(ActiveStatus()) is False
+
+
+class TestMultiContainerPebbleComponent:
+    container_names = ["first-container", "second-container"]
+
+    def make_component(self, harness, **kwargs):
+        containers = [
+            MinimalPebbleServiceComponent(
+                charm=harness.charm, container_name=name, service_name=f"{name}-service", **kwargs
+            )
+            for name in self.container_names
+        ]
+        return MultiContainerPebbleComponent(harness.charm, "workload", containers)
+
+    def test_ready_for_execution_only_if_all_containers_ready(
+        self, harness_with_containers  # noqa: F811
+    ):
+        harness_with_containers.set_can_connect("first-container", True)
+        harness_with_containers.set_can_connect("second-container", False)
+        component = self.make_component(harness_with_containers)
+
+        assert component.ready_for_execution is False
+        harness_with_containers.set_can_connect("second-container", True)
+        assert component.ready_for_execution is True
+
+    def test_events_to_observe_include_each_container(self, harness_with_containers):  # noqa: F811
+        component = self.make_component(harness_with_containers)
+
+        assert [event.event_kind for event in component.events_to_observe] == [
+            "first_container_pebble_ready",
+            "second_container_pebble_ready",
+        ]
+
+    def test_configure_charm_and_status(self, harness_with_containers, tmp_path):  # noqa: F811
+        """Tests that every container is configured, and their statuses are combined."""
+        for name in self.container_names:
+            harness_with_containers.set_can_connect(name, True)
+        template = tmp_path / "config.j2"
+        template.write_text("value: {{ value }}")
+        files = [ContainerFileTemplate(template, "/config.yaml", {"value": 1})]
+        containers = [
+            MinimalPebbleServiceComponent(
+                charm=harness_with_containers.charm,
+                container_name=name,
+                service_name=f"{name}-service",
+                files_to_push=files,
+            )
+            for name in self.container_names
+        ]
+        renderer = TemplateRenderer()
+        component = MultiContainerPebbleComponent(
+            harness_with_containers.charm, "workload", containers, template_renderer=renderer
+        )
+
+        assert isinstance(component.status, WaitingStatus)
+        assert component.status.message.startswith("[first-container]")
+
+        component.configure_charm("mock event")
+
+        for name in self.container_names:
+            container = harness_with_containers.charm.unit.get_container(name)
+            assert container.pull("/config.yaml").read() == "value: 1"
+            assert f"{name}-service" in container.get_plan().services
+        assert renderer.stats[template.resolve()].renders == 1
+        assert component.status == ActiveStatus()
+        assert component.verify_status(ActiveStatus()) is True
+
+    def test_status_reports_unreachable_container(self, harness_with_containers):  # noqa: F811
+        harness_with_containers.set_can_connect("first-container", True)
+        harness_with_containers.set_can_connect("second-container", False)
+        component = self.make_component(harness_with_containers)
+
+        component.configure_charm("mock event")
+
+        assert component.status == WaitingStatus(
+            "[second-container] Waiting for Pebble to be ready."
+        )
+        assert component.verify_status(ActiveStatus()) is False
+
+    def test_connectivity_checked_once_per_call(self, harness_with_containers):  # noqa: F811
+        """Tests that configure_charm and status each check every container's connectivity once."""
+        for name in self.container_names:
+            harness_with_containers.set_can_connect(name, True)
+        component = self.make_component(harness_with_containers)
+
+        with mock.patch.object(
+            functional_base_charm.pebble_component.Container,
+            "can_connect",
+            autospec=True,
+            return_value=True,
+        ) as can_connect:
+            component.configure_charm("mock event")
+            assert sorted(call.args[0].name for call in can_connect.call_args_list) == sorted(
+                self.container_names
+            )
+
+            can_connect.reset_mock()
+            assert component.status == ActiveStatus()
+            assert sorted(call.args[0].name for call in can_connect.call_args_list) == sorted(
+                self.container_names
+            )
+
+        # Nothing is kept between calls
+        harness_with_containers.set_can_connect("second-container", False)
+        assert component.status == WaitingStatus(
+            "[second-container] Waiting for Pebble to be ready."
+        )
+
+    def test_shared_template_renderer(self, harness_with_containers):  # noqa: F811
+        renderer = TemplateRenderer()
+        component = MultiContainerPebbleComponent(
+            harness_with_containers.charm,
+            "workload",
+            self.make_component(harness_with_containers).containers,
+            template_renderer=renderer,
+        )
+
+        assert all(c.template_renderer is renderer for c in component.containers)
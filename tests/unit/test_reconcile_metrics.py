@@ -0,0 +1,130 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from fixtures import MinimallyExtendedComponent, harness  # noqa: F401
+
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.reconcile_metrics import ReconcileMetrics
+from functional_base_charm.reconcile_tracing import Span, Tracer
+
+
+def make_trace(*children, event="config_changed", duration=0.2, **root_attributes):
+    """Returns the spans of a finished dispatch, given (name, attributes, duration) children."""
+    tracer = Tracer()
+    root = Span(tracer, "dispatch", attributes={"juju.event": event, "juju.unit": "app/0"})
+    root.attributes.update(root_attributes)
+    root.end_time = root.start_time + int(duration * 1e9)
+    spans = [root]
+    for name, attributes, child_duration in children:
+        child = Span(tracer, name, root, attributes)
+        child.end_time = child.start_time + int(child_duration * 1e9)
+        spans.append(child)
+    return spans
+
+
+def samples_by_line(path):
+    """Returns {sample: value} for each sample line of a metrics file."""
+    lines = [line for line in path.read_text().splitlines() if not line.startswith("#")]
+    return dict(line.rsplit(" ", 1) for line in lines)
+
+
+class TestReconcileMetrics:
+    def test_histograms_and_counters_accumulate(self, tmp_path):
+        """Tests that each dispatch's observations are added to those already in the file."""
+        metrics = ReconcileMetrics(tmp_path / "charm.prom", buckets=[0.1, 1.0])
+        trace = [
+            ("component.configure", {"component.name": "a"}, 0.5),
+            ("kubernetes.list", {}, 0.01),
+            ("kubernetes.list", {}, 0.01),
+            ("pebble.push", {}, 0.01),
+            ("reconcile", {"reconcile.up_to_date": 2, "reconcile.skipped": 0}, 0.6),
+        ]
+
+        metrics.observe_trace(make_trace(*trace))
+        metrics.observe_trace(make_trace(*trace, duration=2.0, **{"dispatch.events_coalesced": 1}))
+
+        samples = samples_by_line(tmp_path / "charm.prom")
+        labels = 'charm="app",unit="app/0"'
+        dispatch = f'{labels},event="config_changed"'
+        assert samples[f'charm_dispatch_duration_seconds_bucket{{{dispatch},le="1"}}'] == "1"
+        assert samples[f'charm_dispatch_duration_seconds_bucket{{{dispatch},le="+Inf"}}'] == "2"
+        assert samples[f"charm_dispatch_duration_seconds_count{{{dispatch}}}"] == "2"
+        assert float(samples[f"charm_dispatch_duration_seconds_sum{{{dispatch}}}"]) == 2.2
+        configure = f'{labels},component="a"'
+        assert (
+            samples[f'charm_component_configure_duration_seconds_bucket{{{configure},le="0.1"}}']
+            == "0"
+        )
+        assert (
+            samples[f'charm_component_configure_duration_seconds_bucket{{{configure},le="1"}}']
+            == "2"
+        )
+        assert samples[f'charm_kubernetes_requests_total{{{labels},operation="list"}}'] == "4"
+        assert samples[f'charm_pebble_requests_total{{{labels},operation="push"}}'] == "2"
+        assert samples[f'charm_skipped_work_total{{{labels},reason="up_to_date"}}'] == "4"
+        assert samples[f'charm_skipped_work_total{{{dispatch},reason="coalesced"}}'] == "1"
+        assert not any("pass_budget" in sample for sample in samples)
+
+    def test_status_transitions(self, tmp_path):
+        metrics = ReconcileMetrics(tmp_path / "charm.prom")
+        for status in ("waiting", "waiting", "active"):
+            metrics.observe_trace(
+                make_trace(("component.status", {"component.name": "a", "status.name": status}, 0))
+            )
+
+        samples = samples_by_line(tmp_path / "charm.prom")
+        labels = 'charm="app",unit="app/0",component="a"'
+        assert samples[f'charm_component_status{{{labels},status="active"}}'] == "1"
+        assert f'charm_component_status{{{labels},status="waiting"}}' not in samples
+        assert (
+            samples[
+                f'charm_component_status_transitions_total{{{labels},from="waiting",to="active"}}'
+            ]
+            == "1"
+        )
+        assert not any('to="waiting"' in sample for sample in samples)
+
+    def test_round_trip_and_atomic_write(self, tmp_path):
+        metrics = ReconcileMetrics(tmp_path / "charm.prom")
+        samples = {("charm_pebble_requests_total", (("operation", 'a "quoted"\\name'),)): 3.0}
+
+        metrics.write(samples)
+
+        assert metrics.load() == samples
+        assert [p.name for p in tmp_path.iterdir()] == ["charm.prom"]
+        assert (
+            "# TYPE charm_pebble_requests_total counter" in (tmp_path / "charm.prom").read_text()
+        )
+
+    def test_unparseable_file_is_discarded(self, tmp_path):
+        (tmp_path / "charm.prom").write_text("not a metric line at all {\n")
+        metrics = ReconcileMetrics(tmp_path / "charm.prom")
+
+        assert metrics.load() == {}
+
+
+class TestReconcilerMetrics:
+    def test_written_after_each_dispatch(self, harness, tmp_path):  # noqa: F811
+        metrics = ReconcileMetrics(tmp_path / "charm.prom")
+        reconciler = CharmReconciler(harness.charm, metrics=metrics)
+        reconciler.add(MinimallyExtendedComponent(charm=harness.charm, name="a"))
+        reconciler.install(harness.charm)
+
+        harness.charm.on.config_changed.emit()
+        harness.framework.commit()
+        harness.charm.on.config_changed.emit()
+        harness.framework.commit()
+
+        samples = samples_by_line(tmp_path / "charm.prom")
+        unit = harness.charm.unit.name
+        dispatch = f'charm="{unit.split("/")[0]}",unit="{unit}",event="config_changed"'
+        assert samples[f"charm_dispatch_duration_seconds_count{{{dispatch}}}"] == "2"
+        assert any(
+            sample.startswith("charm_component_configure_duration_seconds_count")
+            and 'component="a"' in sample
+            for sample in samples
+        )
+        assert any(
+            sample.startswith("charm_component_status{") and 'status="active"' in sample
+            for sample in samples
+        )
@@ -0,0 +1,53 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from functional_base_charm.reconcile_profile import ComponentTiming, ReconcileProfile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReconcileProfile:
+    def test_unbounded(self):
+        profile = ReconcileProfile(clock=FakeClock())
+
+        assert profile.remaining() is None
+        assert not profile.expired()
+        assert profile.budget_for(None) is None
+        assert profile.budget_for(2.0) == 2.0
+
+    def test_pass_budget_caps_component_budgets(self):
+        clock = FakeClock()
+        profile = ReconcileProfile(pass_budget=10.0, clock=clock)
+
+        clock.now += 7.0
+        assert profile.remaining() == 3.0
+        assert profile.budget_for(None) == 3.0
+        assert profile.budget_for(1.0) == 1.0
+
+        clock.now += 5.0
+        assert profile.expired()
+
+    def test_record(self):
+        clock = FakeClock()
+        profile = ReconcileProfile(clock=clock)
+
+        started_at = profile.now()
+        clock.now += 2.0
+        profile.record("a", started_at, budget=1.0, timed_out=True)
+        profile.record("b", profile.now(), budget=None, timed_out=False)
+        profile.finish()
+        clock.now += 1.0
+
+        assert profile.components == [
+            ComponentTiming("a", 2.0, 1.0, True),
+            ComponentTiming("b", 0.0, None, False),
+        ]
+        assert profile.overruns == [ComponentTiming("a", 2.0, 1.0, True)]
+        assert profile.duration == 2.0
+        assert "a=2.000s (timed out)" in profile.summary()
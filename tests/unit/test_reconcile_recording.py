@@ -0,0 +1,219 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from unittest.mock import MagicMock, patch
+
+import lightkube
+import pytest
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.core_v1 import ConfigMap
+from ops import ActiveStatus, CharmBase, StatusBase
+from ops.pebble import PathError
+from ops.testing import Harness
+
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.component import Component
+from functional_base_charm.kubernetes_session import KubernetesSession
+from functional_base_charm.reconcile_recording import (
+    ReconcileRecorder,
+    ReconcileRecording,
+    RecordingClient,
+    ReplayClient,
+    replay,
+)
+
+META = """
+name: recorded-charm
+requires:
+  db:
+    interface: db
+containers:
+  workload:
+    resource: image
+resources:
+  image:
+    type: oci-image
+"""
+CONFIG = """
+options:
+  replicas:
+    type: int
+    default: 1
+"""
+LABELS = {"app": "recorded"}
+
+
+class ListingComponent(Component):
+    """A Component that reads config and relation data and talks to Kubernetes."""
+
+    # What each configure_charm saw, across instances
+    seen = []
+
+    def __init__(self, *args, session: KubernetesSession, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session = session
+
+    def _configure_unit(self, event):
+        relation = self._charm.model.get_relation("db")
+        config_maps = self._session.list(ConfigMap, namespace="model", labels=LABELS)
+        self._session.client.apply(ConfigMap(metadata=ObjectMeta(name="config")))
+        workload = self._charm.unit.get_container("workload")
+        workload.push("/config", str(self._charm.config["replicas"]))
+        try:
+            workload.pull("/missing")
+        except PathError as e:
+            missing = e.kind
+        self.seen.append(
+            (
+                self._charm.config["replicas"],
+                relation.data[relation.app].get("host"),
+                [config_map.metadata.name for config_map in config_maps],
+                workload.pull("/config").read(),
+                missing,
+            )
+        )
+
+    def fingerprint(self):
+        return str(self._charm.config["replicas"])
+
+    @property
+    def status(self) -> StatusBase:
+        return ActiveStatus()
+
+
+class RecordedCharm(CharmBase):
+    recording_path = None
+
+    def __init__(self, framework):
+        super().__init__(framework)
+        self.recorder = ReconcileRecorder(self.recording_path) if self.recording_path else None
+        client = lightkube.Client()
+        if self.recorder is not None:
+            client = self.recorder.wrap_client(client)
+        self.session = KubernetesSession(client)
+        self.charm_reconciler = CharmReconciler(self, recorder=self.recorder)
+        self.charm_reconciler.add(ListingComponent(self, "lister", session=self.session))
+        self.charm_reconciler.install(self)
+
+
+def record(tmp_path, warm=False):
+    """Records a config-changed pass against a mocked cluster, returning the file.
+
+    If warm, the pass recorded is the second one, after an earlier dispatch executed everything.
+    """
+    path = tmp_path / "pass.rec.gz"
+    cluster = MagicMock()
+    cluster.list.return_value = [
+        ConfigMap(metadata=ObjectMeta(name=f"app{i}", namespace="model")) for i in range(2)
+    ]
+    with patch.object(RecordedCharm, "recording_path", path), patch(
+        "lightkube.Client", return_value=cluster
+    ):
+        harness = Harness(RecordedCharm, meta=META, config=CONFIG)
+        harness.set_leader(True)
+        harness.update_config({"replicas": 3})
+        relation_id = harness.add_relation("db", "postgresql")
+        harness.update_relation_data(relation_id, "postgresql", {"host": "db.example"})
+        harness.set_can_connect("workload", True)
+        harness.begin()
+        harness.charm.on.config_changed.emit()
+        if warm:
+            harness.framework.commit()
+            harness.charm.recorder.last_recording = None
+            harness.charm.on.config_changed.emit()
+        harness.cleanup()
+    return path
+
+
+class TestRecord:
+    def test_recording_captures_inputs_and_calls(self, tmp_path):
+        recording = ReconcileRecording.load(record(tmp_path))
+
+        assert recording.event == {"kind": "config_changed"}
+        assert recording.config == {"replicas": 3}
+        assert recording.leader is True
+        assert [(r["name"], r["remote_app_data"]) for r in recording.relations] == [
+            ("db", {"host": "db.example"})
+        ]
+        assert recording.containers == {}
+        assert recording.stored_state["execution_state"] == {}
+        assert recording.kubernetes_call_counts() == {"list": 1, "apply": 1}
+        # Only the calls the Components made are recorded
+        assert recording.pebble_call_counts() == {"push": 1, "pull": 2}
+        assert [component["name"] for component in recording.components] == ["lister"]
+
+
+class TestReplay:
+    def test_replay_runs_the_pass_offline(self, tmp_path):
+        recording = ReconcileRecording.load(record(tmp_path))
+        ListingComponent.seen.clear()
+
+        result = replay(recording, RecordedCharm, meta=META, config=CONFIG)
+
+        assert ListingComponent.seen == [(3, "db.example", ["app0", "app1"], "3", "not-found")]
+        assert result.kubernetes_calls == recording.kubernetes_call_counts()
+        assert result.pebble_calls == recording.pebble_call_counts()
+        assert result.unrecorded_calls == []
+        assert [timing.name for timing in result.profile.components] == ["lister"]
+
+    def test_warm_pass_replays_warm(self, tmp_path):
+        """Tests that a pass recorded after an earlier dispatch does not execute more on replay."""
+        recording = ReconcileRecording.load(record(tmp_path, warm=True))
+        ListingComponent.seen.clear()
+
+        result = replay(recording, RecordedCharm, meta=META, config=CONFIG)
+
+        assert recording.stored_state["execution_state"]["completed"] == {"lister": "3"}
+        assert recording.kubernetes_calls == []
+        assert recording.pebble_calls == []
+        assert ListingComponent.seen == []
+        assert result.kubernetes_calls == {}
+        assert result.profile.components == []
+
+
+class TestReplayClient:
+    def test_unrecorded_list(self):
+        client = ReplayClient([])
+
+        assert client.list(ConfigMap, namespace="model") == []
+        assert client.unrecorded == ["list /v1/ConfigMap namespace=model labels=None"]
+
+    def test_repeated_lists_served_in_order(self):
+        calls = [
+            {
+                "method": "list",
+                "resource": "/v1/ConfigMap",
+                "namespace": None,
+                "labels": None,
+                "response": [{"metadata": {"name": name}}],
+                "duration": 0.0,
+            }
+            for name in ("first", "second")
+        ]
+        client = ReplayClient(calls)
+
+        names = [client.list(ConfigMap)[0].metadata.name for _ in range(3)]
+
+        assert names == ["first", "second", "second"]
+        assert client.calls == {"list": 3}
+
+    def test_generic_client_requests_replayed(self):
+        calls = []
+        wrapped = MagicMock()
+        recording_client = RecordingClient(wrapped, calls)
+
+        recording_client._client.request("deletecollection", res=ConfigMap, namespace="model")
+
+        wrapped._client.request.assert_called_once_with(
+            "deletecollection", res=ConfigMap, namespace="model"
+        )
+        assert [(c["method"], c["resource"]) for c in calls] == [
+            ("deletecollection", "/v1/ConfigMap")
+        ]
+        with pytest.raises(AttributeError):
+            recording_client._config
+
+        client = ReplayClient(calls)
+        client._client.request("deletecollection", res=ConfigMap, namespace="model")
+        assert client.calls == {"deletecollection": 1}
+        assert client.unrecorded == []
@@ -0,0 +1,113 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import threading
+
+import pytest
+from fixtures import MinimallyExtendedComponent, harness  # noqa: F401
+
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.reconcile_tracing import (
+    NOOP_SPAN,
+    STATUS_CODE_ERROR,
+    Tracer,
+    in_current_context,
+    span,
+)
+
+
+def read_traces(path):
+    """Returns the spans of each trace in a trace file, by name."""
+    traces = []
+    for line in path.read_text().splitlines():
+        document = json.loads(line)
+        spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        traces.append({s["name"]: s for s in spans})
+    return traces
+
+
+def attributes(otlp_span):
+    return {a["key"]: list(a["value"].values())[0] for a in otlp_span["attributes"]}
+
+
+class TestSpan:
+    def test_noop_without_active_tracer(self):
+        assert span("anything") is NOOP_SPAN
+
+    def test_nested_spans_exported_with_root(self, tmp_path):
+        tracer = Tracer(tmp_path / "traces.jsonl", service_name="test")
+        token = tracer.activate()
+        try:
+            with span("root"):
+                with span("child", {"component.name": "a"}) as child:
+                    child.set_attribute("count", 2)
+                with pytest.raises(RuntimeError):
+                    with span("failing"):
+                        raise RuntimeError("boom")
+        finally:
+            tracer.deactivate(token)
+
+        (trace,) = read_traces(tmp_path / "traces.jsonl")
+        assert set(trace) == {"root", "child", "failing"}
+        assert trace["child"]["parentSpanId"] == trace["root"]["spanId"]
+        assert trace["child"]["traceId"] == trace["root"]["traceId"]
+        assert "parentSpanId" not in trace["root"]
+        assert attributes(trace["child"]) == {"component.name": "a", "count": "2"}
+        assert trace["failing"]["status"] == {"code": STATUS_CODE_ERROR, "message": "boom"}
+        assert span("after") is NOOP_SPAN
+
+    def test_in_current_context(self, tmp_path):
+        """Tests that spans on a worker thread are nested under the span that started it."""
+        tracer = Tracer(tmp_path / "traces.jsonl")
+        token = tracer.activate()
+        try:
+            with span("root"):
+
+                def work():
+                    with span("on-thread"):
+                        pass
+
+                thread = threading.Thread(target=in_current_context(work))
+                thread.start()
+                thread.join()
+        finally:
+            tracer.deactivate(token)
+
+        (trace,) = read_traces(tmp_path / "traces.jsonl")
+        assert trace["on-thread"]["parentSpanId"] == trace["root"]["spanId"]
+
+    def test_file_is_rotated(self, tmp_path):
+        tracer = Tracer(tmp_path / "traces.jsonl", max_bytes=200, backup_count=1)
+        token = tracer.activate()
+        try:
+            for _ in range(3):
+                with span("root"):
+                    pass
+        finally:
+            tracer.deactivate(token)
+            tracer.close()
+
+        assert (tmp_path / "traces.jsonl.1").exists()
+
+
+class TestReconcilerTracing:
+    def test_dispatch_traced_until_commit(self, harness, tmp_path):  # noqa: F811
+        """Tests that a dispatch is one trace, holding the pass, configures and unit status."""
+        tracer = Tracer(tmp_path / "traces.jsonl")
+        reconciler = CharmReconciler(harness.charm, tracer=tracer)
+        reconciler.add(MinimallyExtendedComponent(charm=harness.charm, name="a"))
+        reconciler.install(harness.charm)
+
+        harness.charm.on.config_changed.emit()
+        assert not (tmp_path / "traces.jsonl").exists()
+        harness.framework.commit()
+
+        (trace,) = read_traces(tmp_path / "traces.jsonl")
+        assert attributes(trace["dispatch"])["juju.event"] == "config_changed"
+        assert trace["reconcile"]["parentSpanId"] == trace["dispatch"]["spanId"]
+        assert trace["component.configure"]["parentSpanId"] == trace["reconcile"]["spanId"]
+        assert attributes(trace["component.configure"])["component.name"] == "a"
+        assert trace["prioritiser.highest"]["parentSpanId"] == trace["dispatch"]["spanId"]
+        assert attributes(trace["component.status"])["status.name"] == "active"
+        assert span("after") is NOOP_SPAN
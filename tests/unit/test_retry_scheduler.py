@@ -0,0 +1,100 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from fixtures import MinimallyExtendedComponent, harness  # noqa: F401
+from ops import Handle, StatusBase, WaitingStatus
+
+from functional_base_charm.charm_reconciler import CharmReconciler
+from functional_base_charm.retry_scheduler import RetryScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class NeverReadyComponent(MinimallyExtendedComponent):
+    """A Component that stays Waiting until its `ready_after` attempt."""
+
+    def __init__(self, *args, ready_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attempts = 0
+        self.ready_after = ready_after
+
+    def _configure_unit(self, event):
+        self.attempts += 1
+        if self.ready_after is not None and self.attempts >= self.ready_after:
+            super()._configure_unit(event)
+
+    @property
+    def status(self) -> StatusBase:
+        if not self._completed_work:
+            return WaitingStatus("not ready")
+        return super().status
+
+
+class MockEvent:
+    handle = Handle(None, "mock_event", None)
+
+
+def make_reconciler(harness, ready_after=None):  # noqa: F811
+    clock = FakeClock()
+    scheduler = RetryScheduler(harness.charm, base_delay=10, max_delay=40, jitter=0, clock=clock)
+    reconciler = CharmReconciler(harness.charm, retry_scheduler=scheduler)
+    flaky = reconciler.add(
+        NeverReadyComponent(harness.charm, "flaky", ready_after=ready_after),
+    )
+    dependent = reconciler.add(
+        MinimallyExtendedComponent(harness.charm, "dependent"), depends_on=[flaky]
+    )
+    reconciler.install(harness.charm)
+    return clock, scheduler, reconciler, flaky, dependent
+
+
+class TestRetryScheduler:
+    def test_backoff(self, harness):  # noqa: F811
+        scheduler = RetryScheduler(harness.charm, base_delay=10, max_delay=40, jitter=0)
+        delays = []
+        for _ in range(4):
+            delays.append(scheduler.next_delay())
+            scheduler.schedule()
+            scheduler._stored.pending = False
+        assert delays == [10, 20, 40, 40]
+
+        scheduler.reset()
+        assert scheduler.next_delay() == 10
+
+    def test_retry_deferred_until_due(self, harness):  # noqa: F811
+        """Tests that a pass leaving Components pending schedules a deferred retry."""
+        clock, scheduler, reconciler, flaky, dependent = make_reconciler(harness, ready_after=2)
+
+        reconciler.execute_components(MockEvent())
+        assert scheduler.pending
+        assert flaky.component.attempts == 1
+
+        # Not due yet, so the re-emitted retry is deferred again without reconciling
+        harness.framework.reemit()
+        assert flaky.component.attempts == 1
+
+        clock.now += 10
+        harness.framework.reemit()
+
+        assert flaky.component.attempts == 2
+        assert dependent.executed is True
+        assert not scheduler.pending
+        assert scheduler.attempt == 0
+
+    def test_pending_retries_are_merged(self, harness):  # noqa: F811
+        """Tests that several passes leaving work pending only schedule one retry."""
+        clock, scheduler, reconciler, flaky, dependent = make_reconciler(harness)
+
+        reconciler.execute_components(MockEvent())
+        reconciler.execute_components(MockEvent())
+        reconciler.execute_components(MockEvent())
+
+        assert scheduler.attempt == 1
+        notices = harness.framework._storage.notices()
+        assert len([n for n in notices if "reconcile_retry" in n[0]]) == 1
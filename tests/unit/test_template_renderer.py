@@ -0,0 +1,93 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from pathlib import Path
+
+import jinja2
+
+from functional_base_charm.template_renderer import TemplateRenderer
+
+
+def write_templates(root):
+    templates = root / "src" / "templates"
+    templates.mkdir(parents=True)
+    (templates / "config.yaml.j2").write_text("name: {{ name }}")
+    (templates / "nested").mkdir()
+    (templates / "nested" / "service.yaml.j2").write_text("port: {{ port }}")
+    return templates
+
+
+class TestPreload:
+    def test_preload_compiles_templates_once(self, tmp_path):
+        templates = write_templates(tmp_path)
+        (templates / "broken.j2").write_text("{% if %}")
+        renderer = TemplateRenderer()
+
+        assert renderer.preload(tmp_path) == 2
+        renderer.render(templates / "config.yaml.j2", {"name": "a"})
+
+        stats = renderer.stats[(templates / "config.yaml.j2").resolve()]
+        assert stats.compiles == 1
+
+
+class TestRender:
+    def test_renders_memoized_by_template_and_context(self, tmp_path):
+        templates = write_templates(tmp_path)
+        renderer = TemplateRenderer()
+        path = templates / "config.yaml.j2"
+
+        assert renderer.render(path, {"name": "a"}) == "name: a"
+        assert renderer.render(str(path), {"name": "a"}) == "name: a"
+        assert renderer.render(path, {"name": "b"}) == "name: b"
+
+        stats = renderer.stats[path.resolve()]
+        assert (stats.compiles, stats.renders, stats.cache_hits) == (1, 2, 1)
+        assert "1 cache hits" in renderer.report()
+
+    def test_non_json_contexts_are_not_memoized(self, tmp_path):
+        """Tests that values JSON would represent alike are not served each other's renders."""
+        path = tmp_path / "value.j2"
+        path.write_text("{{ x }}")
+        renderer = TemplateRenderer()
+
+        assert renderer.render(path, {"x": "1"}) == "1"
+        assert renderer.render(path, {"x": Path("2")}) == "2"
+        assert renderer.render(path, {"x": "2"}) == "2"
+        assert renderer.render(path, {"x": [1, 2]}) == "[1, 2]"
+        assert renderer.render(path, {"x": (1, 2)}) == "(1, 2)"
+
+        stats = renderer.stats[path.resolve()]
+        assert (stats.renders, stats.cache_hits) == (5, 0)
+
+    def test_memoized_renders_are_bounded(self, tmp_path):
+        path = tmp_path / "value.j2"
+        path.write_text("{{ x }}")
+        renderer = TemplateRenderer(max_memoized_renders=2)
+
+        for x in range(3):
+            renderer.render(path, {"x": x})
+        renderer.render(path, {"x": 2})
+        renderer.render(path, {"x": 0})
+
+        assert len(renderer._rendered) == 2
+        assert renderer.stats[path.resolve()].cache_hits == 1
+
+    def test_clear_keeps_compiled_templates(self, tmp_path):
+        templates = write_templates(tmp_path)
+        renderer = TemplateRenderer()
+        path = templates / "config.yaml.j2"
+        renderer.render(path, {"name": "a"})
+
+        renderer.clear()
+        renderer.render(path, {"name": "a"})
+
+        stats = renderer.stats[path.resolve()]
+        assert (stats.compiles, stats.renders) == (1, 2)
+
+    def test_shared_environment(self, tmp_path):
+        path = tmp_path / "filtered.j2"
+        path.write_text("{{ name | shout }}")
+        environment = jinja2.Environment()
+        environment.filters["shout"] = lambda value: value.upper()
+
+        assert TemplateRenderer(environment).render(path, {"name": "a"}) == "A"